@@ -0,0 +1,447 @@
+import os
+import re
+import hmac
+import json
+import queue
+import socket
+import threading
+import subprocess
+from scriptrunner.lib.processes import (popen_in_group, stop_process_group,
+                                        suspend_process_group,
+                                        resume_process_group,
+                                        STOP_GRACE_PERIODS, KILL_WAIT)
+
+# Exit code of a job whose agent disconnected
+AGENT_LOST_CODE = -1
+# Exit code of a job whose command couldn't be started by its agent
+START_FAILED_CODE = 127
+# Seconds between two attempts of an agent to connect
+RECONNECT_INTERVAL = 2.0
+
+
+# ==============================================================================
+#                          Worker Agents
+# ==============================================================================
+
+
+def parse_agent_address(text, default_host="127.0.0.1"):
+    """(host, port) from "PORT" or "HOST:PORT", ValueError if invalid."""
+    match = re.fullmatch(r"(?:([\w.-]+):)?(\d+)", str(text).strip())
+    if not match:
+        raise ValueError(f"Invalid address (expected [HOST:]PORT): {text}")
+    return match.group(1) or default_host, int(match.group(2))
+
+
+class Connection:
+    """A socket exchanging JSON messages, one per line."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("r", encoding="utf-8", newline="\n")
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        try:
+            with self.send_lock:
+                self.sock.sendall(data)
+        except OSError:
+            # Seen by the reading side as a closed connection
+            pass
+
+    def messages(self):
+        """Received messages, until the connection is closed."""
+        try:
+            for line in self.reader:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(message, dict):
+                    yield message
+        except OSError:
+            return
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class WorkerAgent:
+    """
+    Worker agent, run on another host with "scriptrunner agent HOST:PORT".
+    It connects to an AgentPool, registers with its capacity (scripts run
+    at once) and runs the scripts it is sent, each in its own session (see
+    popen_in_group), streaming their output and exit code back. It stops,
+    suspends and resumes them on request. If the connection is lost, its
+    running scripts are stopped and it connects again.
+
+    A script is sent as {"interpreter", "script", "argv", "env"}; paths are
+    those of the ScriptRunner host (e.g. on a shared file system), the
+    interpreter can be replaced by the agent's own. env holds the variables
+    set on top of the agent environment.
+    """
+
+    def __init__(self, address, capacity=1, name=None, interpreter="",
+                 token=None, grace_periods=STOP_GRACE_PERIODS):
+        self.address = address
+        self.capacity = max(int(capacity), 1)
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.interpreter = interpreter
+        self.token = token
+        self.grace_periods = grace_periods
+        self.connection = None
+        # {job: Popen}, None while the script is starting
+        self.processes = {}
+        # Jobs asked to stop while starting
+        self.stop_requests = set()
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+
+    def run(self, retry_interval=RECONNECT_INTERVAL):
+        """
+        Serve the pool until close(), connecting again when the connection
+        is lost. Raises PermissionError if the pool rejects the agent.
+        """
+        while not self.closed.is_set():
+            try:
+                sock = socket.create_connection(self.address)
+            except OSError:
+                self.closed.wait(retry_interval)
+                continue
+            with self.lock:
+                self.connection = Connection(sock)
+            try:
+                self.serve(self.connection)
+            finally:
+                with self.lock:
+                    connection, self.connection = self.connection, None
+                connection.close()
+                self.stop_all()
+            self.closed.wait(retry_interval)
+
+    def serve(self, connection):
+        connection.send({"type": "register", "name": self.name,
+                         "capacity": self.capacity, "token": self.token})
+        for message in connection.messages():
+            kind = message.get("type")
+            job = message.get("job")
+            if kind == "rejected":
+                self.closed.set()
+                raise PermissionError(message.get("message",
+                                                  "Agent rejected"))
+            if kind == "run":
+                # Registered before its thread starts, so that a stop sent
+                # right after is not taken for a finished job
+                with self.lock:
+                    self.processes[job] = None
+                threading.Thread(target=self.run_job,
+                                 args=(connection, job, message),
+                                 daemon=True).start()
+                continue
+            with self.lock:
+                starting = job in self.processes
+                process = self.processes.get(job)
+                if process is None and starting and kind == "stop":
+                    # Stopped by run_job once started
+                    self.stop_requests.add(job)
+            if process is None:
+                if kind == "stop" and not starting:
+                    # Already finished
+                    connection.send({"type": "stopped", "job": job,
+                                     "pids": [], "signal": None})
+                continue
+            if kind == "stop":
+                threading.Thread(target=self.stop_job,
+                                 args=(connection, job, process),
+                                 daemon=True).start()
+            elif kind == "suspend":
+                suspend_process_group(process)
+            elif kind == "resume":
+                resume_process_group(process)
+
+    def run_job(self, connection, job, spec):
+        command = [self.interpreter or spec["interpreter"], "-u",
+                   spec["script"]] + list(spec.get("argv", []))
+        env = dict(os.environ, **spec.get("env", {}))
+        try:
+            process = popen_in_group(command, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, text=True,
+                                     bufsize=1, env=env)
+        except OSError as e:
+            with self.lock:
+                self.processes.pop(job, None)
+                stopping = job in self.stop_requests
+                self.stop_requests.discard(job)
+            connection.send({"type": "output", "job": job,
+                             "line": f"Agent {self.name}: {e}"})
+            connection.send({"type": "exit", "job": job,
+                             "returncode": START_FAILED_CODE})
+            if stopping:
+                connection.send({"type": "stopped", "job": job,
+                                 "pids": [], "signal": None})
+            return
+        with self.lock:
+            self.processes[job] = process
+            stopping = job in self.stop_requests
+            self.stop_requests.discard(job)
+        connection.send({"type": "started", "job": job, "pid": process.pid,
+                         "command": command})
+        if stopping:
+            threading.Thread(target=self.stop_job,
+                             args=(connection, job, process),
+                             daemon=True).start()
+        try:
+            for line in iter(process.stdout.readline, ''):
+                connection.send({"type": "output", "job": job,
+                                 "line": line.rstrip("\n")})
+            process.stdout.close()
+            returncode = process.wait()
+        finally:
+            with self.lock:
+                self.processes.pop(job, None)
+        connection.send({"type": "exit", "job": job,
+                         "returncode": returncode})
+
+    def stop_job(self, connection, job, process):
+        pids, signal_name = stop_process_group(process, self.grace_periods)
+        connection.send({"type": "stopped", "job": job, "pids": pids,
+                         "signal": signal_name})
+
+    def stop_all(self):
+        with self.lock:
+            processes = [p for p in self.processes.values() if p is not None]
+        threads = [threading.Thread(target=stop_process_group,
+                                    args=(process, self.grace_periods),
+                                    daemon=True) for process in processes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def close(self):
+        """Disconnect, stopping the running scripts."""
+        self.closed.set()
+        with self.lock:
+            connection = self.connection
+        if connection is not None:
+            connection.close()
+
+
+class RemoteOutput:
+    """The stdout of a RemoteProcess: lines with readline(), '' at the end."""
+
+    def __init__(self):
+        self.lines = queue.Queue()
+
+    def put(self, line):
+        self.lines.put(line)
+
+    def readline(self):
+        line = self.lines.get()
+        return '' if line is None else line
+
+    def close(self):
+        pass
+
+
+class RemoteProcess:
+    """
+    A script run by a worker agent, used by the Scheduler like the Popen
+    of a local script: stdout.readline(), wait() and poll(), and stop(),
+    suspend() and resume() for its whole session on the agent host.
+    """
+
+    def __init__(self, pool, agent, job):
+        self.pool = pool
+        self.agent = agent
+        self.job = job
+        self.pid = None
+        self.stdout = RemoteOutput()
+        self.returncode = None
+        self.exited = threading.Event()
+        self.stop_result = None
+        self.stopped = threading.Event()
+
+    def on_exit(self, returncode):
+        if self.exited.is_set():
+            return
+        self.returncode = returncode
+        self.stdout.put(None)
+        self.exited.set()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        self.exited.wait()
+        return self.returncode
+
+    def stop(self, grace_periods=STOP_GRACE_PERIODS):
+        """
+        Stop the script and its descendants on the agent host (see
+        stop_process_group). Returns (pids, signal_name).
+        """
+        if self.exited.is_set():
+            return [], None
+        # The answer may come after the exit of the script
+        with self.pool.lock:
+            if self.agent not in self.pool.agents:
+                return [], None
+            self.agent.stopping[self.job] = self
+        self.agent.connection.send({"type": "stop", "job": self.job})
+        self.stopped.wait(sum(grace_periods) + KILL_WAIT + 5.0)
+        return self.stop_result or ([], None)
+
+    def suspend(self):
+        self.agent.connection.send({"type": "suspend", "job": self.job})
+
+    def resume(self):
+        self.agent.connection.send({"type": "resume", "job": self.job})
+
+
+class RegisteredAgent:
+    """An agent connected to an AgentPool."""
+
+    def __init__(self, connection, name, capacity):
+        self.connection = connection
+        self.name = name
+        self.capacity = capacity
+        # {job: RemoteProcess} of the running scripts, and of those being
+        # stopped
+        self.jobs = {}
+        self.stopping = {}
+
+
+class AgentPool:
+    """
+    Worker agents registered with ScriptRunner, on a TCP address they
+    connect to. A Scheduler given the pool runs its scripts on the agents
+    with free capacity (see run) instead of locally. If token is set,
+    agents must give the same one.
+
+    on_change(message) is called when an agent registers or leaves.
+    """
+
+    def __init__(self, address, token=None):
+        self.address = address
+        self.token = token
+        self.agents = []
+        self.lock = threading.Lock()
+        self.next_job = 0
+        self.listener = None
+        self.on_change = None
+
+    def start(self):
+        """Listen for agents in the background. Raises OSError."""
+        self.listener = socket.create_server(self.address)
+        self.address = self.listener.getsockname()[:2]
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve_agent, args=(sock,),
+                             daemon=True).start()
+
+    def changed(self, message):
+        if self.on_change is not None:
+            self.on_change(message)
+
+    def serve_agent(self, sock):
+        connection = Connection(sock)
+        messages = connection.messages()
+        register = next(messages, None)
+        if register is None or register.get("type") != "register":
+            connection.close()
+            return
+        if self.token and not hmac.compare_digest(
+                str(register.get("token") or ""), self.token):
+            connection.send({"type": "rejected",
+                             "message": "Invalid agent token"})
+            connection.close()
+            return
+        agent = RegisteredAgent(connection, str(register.get("name")),
+                                max(int(register.get("capacity", 1)), 1))
+        with self.lock:
+            self.agents.append(agent)
+        self.changed(f"Agent {agent.name} registered with "
+                     f"{agent.capacity} slots")
+        try:
+            for message in messages:
+                job = message.get("job")
+                with self.lock:
+                    process = agent.jobs.get(job) or agent.stopping.get(job)
+                if process is None:
+                    continue
+                kind = message.get("type")
+                if kind == "started":
+                    process.pid = message.get("pid")
+                elif kind == "output":
+                    process.stdout.put(message.get("line", "") + "\n")
+                elif kind == "stopped":
+                    with self.lock:
+                        agent.stopping.pop(job, None)
+                    process.stop_result = (message.get("pids", []),
+                                           message.get("signal"))
+                    process.stopped.set()
+                elif kind == "exit":
+                    with self.lock:
+                        agent.jobs.pop(process.job, None)
+                    process.on_exit(message.get("returncode"))
+                    self.changed(None)
+        finally:
+            with self.lock:
+                self.agents.remove(agent)
+                jobs, agent.jobs = agent.jobs, {}
+                stopping, agent.stopping = agent.stopping, {}
+            connection.close()
+            for process in jobs.values():
+                process.stdout.put(f"Agent {agent.name} disconnected\n")
+                process.on_exit(AGENT_LOST_CODE)
+            for process in list(jobs.values()) + list(stopping.values()):
+                process.stopped.set()
+            self.changed(f"Agent {agent.name} left")
+
+    def capacity(self):
+        """Scripts the registered agents can run at once."""
+        with self.lock:
+            return sum(agent.capacity for agent in self.agents)
+
+    def run(self, command, env=None):
+        """
+        Run a command [interpreter, "-u", script, *argv] on the agent with
+        the most free slots, with the env variables set. Returns its
+        RemoteProcess; raises OSError if no agent is free.
+        """
+        with self.lock:
+            free = [(agent.capacity - len(agent.jobs), i)
+                    for i, agent in enumerate(self.agents)]
+            slots, i = max(free, default=(0, None))
+            if slots <= 0:
+                raise OSError("No worker agent with free capacity")
+            agent = self.agents[i]
+            self.next_job += 1
+            process = RemoteProcess(self, agent, self.next_job)
+            agent.jobs[process.job] = process
+        agent.connection.send({"type": "run", "job": process.job,
+                               "interpreter": command[0],
+                               "script": command[2], "argv": command[3:],
+                               "env": env or {}})
+        return process
+
+    def close(self):
+        """Stop listening and disconnect the agents."""
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        with self.lock:
+            agents = list(self.agents)
+        for agent in agents:
+            agent.connection.close()
@@ -0,0 +1,427 @@
+import os
+import sys
+import math
+import time
+import shlex
+import threading
+import subprocess
+import scriptrunner.lib.utilities as util
+from scriptrunner.lib.agents import RemoteOutput
+from scriptrunner.lib.scheduling import new_task_id
+
+# Exit code of a job that ended without reporting one (cancelled, killed
+# by the batch system at its time limit, node failure)
+JOB_LOST_CODE = -1
+# Polls a finished job may go without its exit code file before it is
+# considered lost (shared file systems can be slow to show new files)
+LOST_POLLS = 3
+# Submit, status and cancel commands of the batch systems
+BATCH_COMMANDS = {
+    "slurm": (["sbatch"], ["squeue"], ["scancel"]),
+    "shim": tuple([sys.executable, "-m", "scriptrunner.lib.batch_shim", name]
+                  for name in ("sbatch", "squeue", "scancel")),
+}
+
+
+# ==============================================================================
+#                          Batch System Backend
+# ==============================================================================
+
+
+def get_batch_dir():
+    """Default folder of the job scripts and output files."""
+    return util.get_cache_path("batch")
+
+
+def make_job_script(commands, env, rc_dir, name):
+    """
+    Shell script of a job array running commands[i] as element i, with the
+    env variables set, and writing its exit code to rc_dir/name_i.rc.
+    """
+    prefix = ["env"] + [f"{key}={value}" for key, value
+                        in sorted(env.items())] if env else []
+    lines = ["#!/bin/sh", 'case "$SLURM_ARRAY_TASK_ID" in']
+    for i, command in enumerate(commands):
+        lines.append(f"{i}) {shlex.join(prefix + list(command))} ;;")
+    rc_file = f"{shlex.quote(rc_dir)}/{name}_$SLURM_ARRAY_TASK_ID.rc"
+    lines += ["esac", "rc=$?", f"rc_file={rc_file}",
+              'echo "$rc" > "$rc_file.tmp" && mv "$rc_file.tmp" "$rc_file"',
+              ""]
+    return "\n".join(lines)
+
+
+def format_time_limit(seconds):
+    """Time limit of a job in the minutes:seconds form of sbatch --time."""
+    seconds = math.ceil(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class JobArray:
+    """
+    A job array submitted by BatchSystem.submit_array. Its elements report
+    to on_start(i), on_line(i, line) and on_exit(i, returncode).
+    """
+
+    def __init__(self, system, job_id, name, count, on_start=None,
+                 on_line=None, on_exit=None):
+        self.system = system
+        self.job_id = job_id
+        self.name = name
+        self.count = count
+        self.on_start = on_start
+        self.on_line = on_line
+        self.on_exit = on_exit
+        self.started = set()
+        self.finished = set()
+        self.missing = [0] * count
+        self.offsets = [0] * count
+        self.partial = [""] * count
+
+    def get_element_id(self, i):
+        return f"{self.job_id}_{i}"
+
+    def get_path(self, i, extension):
+        return os.path.join(self.system.work_dir,
+                            f"{self.name}_{i}.{extension}")
+
+    def read_output(self, i):
+        """Pass the new complete lines of the output of element i on."""
+        try:
+            with open(self.get_path(i, "out"), "rb") as f:
+                f.seek(self.offsets[i])
+                data = f.read()
+        except OSError:
+            return
+        self.offsets[i] += len(data)
+        text = self.partial[i] + data.decode("utf-8", "replace")
+        *lines, self.partial[i] = text.split("\n")
+        if self.on_line is not None:
+            for line in lines:
+                self.on_line(i, line)
+
+    def read_returncode(self, i):
+        try:
+            with open(self.get_path(i, "rc"), "r") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def update(self, states):
+        """
+        Follow the elements from the batch system states of a poll,
+        {element id: state}. Returns True once they are all finished.
+        """
+        for i in range(self.count):
+            if i in self.finished:
+                continue
+            state = states.get(self.get_element_id(i))
+            self.read_output(i)
+            if state is not None:
+                self.missing[i] = 0
+                if state != "PENDING" and i not in self.started:
+                    self.start(i)
+                continue
+            returncode = self.read_returncode(i)
+            if returncode is None:
+                self.missing[i] += 1
+                if self.missing[i] < LOST_POLLS:
+                    continue
+                returncode = JOB_LOST_CODE
+            self.read_output(i)
+            self.finish(i, returncode)
+        return len(self.finished) == self.count
+
+    def start(self, i):
+        self.started.add(i)
+        if self.on_start is not None:
+            self.on_start(i)
+
+    def finish(self, i, returncode):
+        if i not in self.started:
+            self.start(i)
+        if self.partial[i] and self.on_line is not None:
+            self.on_line(i, self.partial[i])
+        self.partial[i] = ""
+        self.finished.add(i)
+        paths = [self.get_path(i, "out"), self.get_path(i, "rc")]
+        if len(self.finished) == self.count:
+            paths.append(os.path.join(self.system.work_dir,
+                                      f"{self.name}.sh"))
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if self.on_exit is not None:
+            self.on_exit(i, returncode)
+
+    def stop(self, grace_periods=None):
+        """Cancel the unfinished elements, return (ids, "scancel")."""
+        ids = [self.get_element_id(i) for i in range(self.count)
+               if i not in self.finished]
+        if ids:
+            self.system.cancel(ids)
+        return ids, "scancel" if ids else None
+
+    def suspend(self):
+        # Jobs of a batch system can't be frozen by their users
+        pass
+
+    def resume(self):
+        pass
+
+
+class BatchJob:
+    """
+    A script run as a job by BatchSystem.run, used by the Scheduler like
+    the Popen of a local script (see RemoteProcess).
+    """
+
+    def __init__(self, system, command, env):
+        self.system = system
+        self.command = command
+        self.env = env
+        self.pid = None
+        self.array = None
+        self.element = None
+        self.stdout = RemoteOutput()
+        self.returncode = None
+        self.exited = threading.Event()
+
+    def on_line(self, line):
+        self.stdout.put(line + "\n")
+
+    def on_exit(self, returncode):
+        if self.exited.is_set():
+            return
+        self.returncode = returncode
+        self.stdout.put(None)
+        self.exited.set()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        self.exited.wait()
+        return self.returncode
+
+    def stop(self, grace_periods=None):
+        with self.system.lock:
+            if self.array is None:
+                # Not submitted yet
+                if self in self.system.pending:
+                    self.system.pending.remove(self)
+                self.on_exit(JOB_LOST_CODE)
+                return [], None
+            element_id = self.array.get_element_id(self.element)
+        if self.exited.is_set():
+            return [], None
+        self.system.cancel([element_id])
+        return [element_id], "scancel"
+
+    def suspend(self):
+        pass
+
+    def resume(self):
+        pass
+
+
+class BatchSystem:
+    """
+    Run the scripts of a Scheduler as jobs of a batch system (Slurm, or the
+    local stand-in of batch_shim), with its submit, status and cancel
+    commands (see BATCH_COMMANDS). Jobs are submitted as job arrays: the
+    scripts started within batch_window seconds share one array (see run),
+    and the points of a sweep are all submitted as one array (see
+    submit_array). Extra sbatch options (e.g. "--partition=gpu") are given
+    as options.
+
+    A background thread polls the status command every poll_interval
+    seconds, tails the output files of the running jobs and reads their
+    exit code files. The job scripts and output files are written to
+    work_dir, which the compute nodes must see (e.g. a shared home
+    folder); they are removed once read.
+    """
+
+    def __init__(self, commands=BATCH_COMMANDS["slurm"], work_dir=None,
+                 options=(), poll_interval=2.0, batch_window=0.2,
+                 max_jobs=10000):
+        self.submit_command, self.status_command, self.cancel_command = \
+            [list(command) for command in commands]
+        self.work_dir = work_dir or get_batch_dir()
+        self.options = list(options)
+        self.poll_interval = poll_interval
+        self.batch_window = batch_window
+        self.max_jobs = max_jobs
+        self.on_change = None
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.arrays = []
+        self.pending = []
+        self.closed = False
+        self.error = None
+        self.threads = [threading.Thread(target=target, daemon=True)
+                        for target in (self.poll_loop, self.submit_loop)]
+        for thread in self.threads:
+            thread.start()
+
+    def capacity(self):
+        """Jobs that can be in the batch system at once."""
+        return self.max_jobs
+
+    def submit_array(self, commands, env=None, parallel=0, timeout=0,
+                     on_start=None, on_line=None, on_exit=None):
+        """
+        Submit commands as one job array, at most parallel of them running
+        at once (0: no limit) and each stopped after timeout seconds (0: no
+        limit). Returns its JobArray; raises OSError if the submission
+        failed.
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        name = new_task_id()
+        script_path = os.path.join(self.work_dir, f"{name}.sh")
+        with open(script_path, "w") as f:
+            f.write(make_job_script(commands, env, self.work_dir, name))
+        array = f"0-{len(commands) - 1}"
+        if parallel:
+            array += f"%{parallel}"
+        command = self.submit_command + [
+            "--parsable", f"--array={array}", "--job-name=scriptrunner",
+            f"--output={os.path.join(self.work_dir, name)}_%a.out"]
+        if timeout:
+            command.append(f"--time={format_time_limit(timeout)}")
+        command += self.options + [script_path]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True)
+        except OSError as e:
+            os.remove(script_path)
+            raise OSError(f"Can't run {command[0]}: {e}")
+        if result.returncode != 0:
+            os.remove(script_path)
+            raise OSError(f"Job submission failed: "
+                          f"{result.stderr.strip() or result.returncode}")
+        job_id = result.stdout.strip().split(";")[0]
+        job_array = JobArray(self, job_id, name, len(commands), on_start,
+                             on_line, on_exit)
+        with self.condition:
+            self.arrays.append(job_array)
+            self.condition.notify_all()
+        return job_array
+
+    def run(self, command, env=None):
+        """
+        Run a command as a job, submitted along with the other commands run
+        within batch_window seconds. Returns its BatchJob.
+        """
+        job = BatchJob(self, command, env or {})
+        with self.condition:
+            self.pending.append(job)
+            self.condition.notify_all()
+        return job
+
+    def submit_loop(self):
+        with self.condition:
+            while not self.closed:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                # Gather the jobs started at about the same time
+                deadline = time.monotonic() + self.batch_window
+                while not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                jobs, self.pending = self.pending, []
+                groups = {}
+                for job in jobs:
+                    key = tuple(sorted(job.env.items()))
+                    groups.setdefault(key, []).append(job)
+                self.condition.release()
+                try:
+                    for group in groups.values():
+                        self.submit_jobs(group)
+                finally:
+                    self.condition.acquire()
+
+    def submit_jobs(self, jobs):
+        try:
+            array = self.submit_array(
+                [job.command for job in jobs], jobs[0].env,
+                on_line=lambda i, line: jobs[i].on_line(line),
+                on_exit=lambda i, returncode: jobs[i].on_exit(returncode))
+        except OSError as e:
+            for job in jobs:
+                job.on_line(str(e))
+                job.on_exit(JOB_LOST_CODE)
+            return
+        with self.lock:
+            for i, job in enumerate(jobs):
+                job.array, job.element = array, i
+                # Stopped while being submitted
+                cancelled = job.exited.is_set()
+                if cancelled:
+                    threading.Thread(target=self.cancel,
+                                     args=([array.get_element_id(i)],),
+                                     daemon=True).start()
+
+    def get_states(self, arrays):
+        """
+        {element id: state} of the elements of arrays still in the batch
+        system, None if the status command failed.
+        """
+        command = self.status_command + [
+            "--noheader", "--array", "--format=%i %T",
+            "--jobs=" + ",".join(array.job_id for array in arrays)]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True)
+        except OSError as e:
+            self.error = str(e)
+            return None
+        if result.returncode != 0:
+            # Slurm rejects the ids of jobs that are all gone
+            if "Invalid job id" in result.stderr:
+                return {}
+            self.error = result.stderr.strip()
+            return None
+        states = {}
+        for line in result.stdout.splitlines():
+            fields = line.split()
+            if len(fields) >= 2:
+                states[fields[0]] = fields[1]
+        return states
+
+    def poll_loop(self):
+        with self.condition:
+            while not self.closed:
+                if not self.arrays:
+                    self.condition.wait()
+                    continue
+                arrays = list(self.arrays)
+                self.condition.release()
+                try:
+                    states = self.get_states(arrays)
+                    finished = []
+                    if states is not None:
+                        finished = [array for array in arrays
+                                    if array.update(states)]
+                finally:
+                    self.condition.acquire()
+                for array in finished:
+                    self.arrays.remove(array)
+                if self.arrays:
+                    self.condition.wait(self.poll_interval)
+
+    def cancel(self, ids):
+        """Cancel jobs or job array elements by their ids."""
+        try:
+            subprocess.run(self.cancel_command + list(ids),
+                           capture_output=True)
+        except OSError as e:
+            self.error = str(e)
+
+    def close(self):
+        """Stop following the jobs, which carry on in the batch system."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,224 @@
+import os
+import re
+import sys
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+
+
+# ==============================================================================
+#                          Batch System Stand-in
+# ==============================================================================
+
+
+def get_state_dir():
+    path = os.environ.get("SCRIPTRUNNER_SHIM_DIR") or os.path.join(
+        tempfile.gettempdir(), f"scriptrunner_shim_{os.getuid()}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_state_path(element_id, extension="state"):
+    return os.path.join(get_state_dir(), f"{element_id}.{extension}")
+
+
+def write_file(path, text):
+    with open(path + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+
+def read_file(path):
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def new_job_id():
+    # Job ids are unique as long as the counter file is created atomically
+    state_dir = get_state_dir()
+    job_id = 1
+    while True:
+        try:
+            fd = os.open(os.path.join(state_dir, f"{job_id}.job"),
+                         os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            job_id += 1
+            continue
+        os.close(fd)
+        return job_id
+
+
+def parse_array(spec):
+    """(indexes, max running) from an --array spec "0-9%2", "3" or "1,4"."""
+    spec, _, limit = spec.partition("%")
+    indexes = []
+    for part in spec.split(","):
+        start, _, stop = part.partition("-")
+        indexes.extend(range(int(start), int(stop or start) + 1))
+    return indexes, int(limit or 0) or len(indexes)
+
+
+def parse_time(text):
+    """Seconds of a --time limit "minutes", "minutes:seconds" or "h:m:s"."""
+    seconds = 0
+    parts = [int(part) for part in text.split(":")]
+    if len(parts) == 1:
+        return parts[0] * 60
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
+
+
+def sbatch(argv):
+    parser = argparse.ArgumentParser(prog="sbatch")
+    parser.add_argument("--parsable", action="store_true")
+    parser.add_argument("--array", default="0")
+    parser.add_argument("--output", default="slurm-%A_%a.out")
+    parser.add_argument("--job-name", default="")
+    parser.add_argument("--time", default=None)
+    parser.add_argument("script")
+    args, _ = parser.parse_known_args(argv)
+    indexes, limit = parse_array(args.array)
+    job_id = new_job_id()
+    for i in indexes:
+        write_file(get_state_path(f"{job_id}_{i}"), "PENDING")
+    time_limit = parse_time(args.time) if args.time else 0
+    subprocess.Popen([sys.executable, "-m", "scriptrunner.lib.batch_shim",
+                      "run-array", str(job_id), args.array, str(limit),
+                      str(time_limit), args.output,
+                      os.path.abspath(args.script)],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+    if args.parsable:
+        print(job_id)
+    else:
+        print(f"Submitted batch job {job_id}")
+    return 0
+
+
+def run_array(argv):
+    job_id, spec, limit, time_limit, output, script = argv
+    indexes, _ = parse_array(spec)
+    slots = threading.Semaphore(int(limit))
+
+    def run_element(i):
+        element_id = f"{job_id}_{i}"
+        state_path = get_state_path(element_id)
+        try:
+            if read_file(state_path) is None:
+                # Cancelled while pending
+                return
+            path = output.replace("%A", job_id).replace("%a", str(i)) \
+                .replace("%j", element_id)
+            env = dict(os.environ, SLURM_ARRAY_TASK_ID=str(i),
+                       SLURM_ARRAY_JOB_ID=job_id, SLURM_JOB_ID=element_id)
+            with open(path, "w") as out:
+                process = subprocess.Popen(["sh", script], stdout=out,
+                                           stderr=subprocess.STDOUT, env=env,
+                                           start_new_session=True)
+            write_file(state_path, f"RUNNING {process.pid}")
+            if read_file(get_state_path(element_id, "cancel")) is not None:
+                os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(int(time_limit) or None)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGTERM)
+                process.wait()
+            for extension in ("state", "cancel"):
+                try:
+                    os.remove(get_state_path(element_id, extension))
+                except OSError:
+                    pass
+        finally:
+            slots.release()
+
+    threads = []
+    for i in indexes:
+        slots.acquire()
+        thread = threading.Thread(target=run_element, args=(i,))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return 0
+
+
+def squeue(argv):
+    parser = argparse.ArgumentParser(prog="squeue")
+    parser.add_argument("--jobs", default=None)
+    args, _ = parser.parse_known_args(argv)
+    jobs = set(args.jobs.split(",")) if args.jobs else None
+    for name in sorted(os.listdir(get_state_dir())):
+        if not name.endswith(".state"):
+            continue
+        element_id = name[:-len(".state")]
+        if jobs is not None and element_id.split("_")[0] not in jobs:
+            continue
+        state = read_file(os.path.join(get_state_dir(), name))
+        if state:
+            print(element_id, state.split()[0])
+    return 0
+
+
+def scancel(argv):
+    for job in argv:
+        if "_" in job:
+            element_ids = [job]
+        else:
+            element_ids = [name[:-len(".state")]
+                           for name in os.listdir(get_state_dir())
+                           if re.fullmatch(rf"{re.escape(job)}_\d+\.state",
+                                           name)]
+        for element_id in element_ids:
+            state_path = get_state_path(element_id)
+            state = read_file(state_path)
+            if state is None:
+                continue
+            write_file(get_state_path(element_id, "cancel"), "")
+            if state.startswith("RUNNING"):
+                try:
+                    os.killpg(int(state.split()[1]), signal.SIGTERM)
+                except OSError:
+                    pass
+            else:
+                try:
+                    os.remove(state_path)
+                except OSError:
+                    pass
+    return 0
+
+
+COMMANDS = {"sbatch": sbatch, "squeue": squeue, "scancel": scancel,
+            "run-array": run_array}
+
+
+def main(argv=None):
+    """
+    Local stand-in for the sbatch, squeue and scancel commands of Slurm,
+    running job arrays on this machine, to develop and test BatchSystem
+    without a cluster, e.g.:
+
+        python -m scriptrunner.lib.batch_shim sbatch --parsable
+            --array=0-9%2 --output=out_%a.txt job.sh
+        python -m scriptrunner.lib.batch_shim squeue --jobs=1,2
+        python -m scriptrunner.lib.batch_shim scancel 1_3
+
+    Only the options used by BatchSystem are supported. Job states are
+    kept in $SCRIPTRUNNER_SHIM_DIR (default: a folder in the temporary
+    folder).
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print(f"usage: batch_shim {{{','.join(COMMANDS)}}} ...",
+              file=sys.stderr)
+        return 2
+    return COMMANDS[argv[0]](argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
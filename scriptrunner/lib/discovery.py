@@ -0,0 +1,141 @@
+import os
+import threading
+import scriptrunner.lib.utilities as util
+
+
+# ==============================================================================
+#                          Script Discovery
+# ==============================================================================
+
+
+class ScanJob:
+    """
+    A cancellable script scan. The number of listed names is counted by
+    the scan thread and can be read from any thread for progress display.
+    """
+
+    def __init__(self, scan_id):
+        self.scan_id = scan_id
+        self.cancel_event = threading.Event()
+        self.listed = 0
+        self.listing_done = False
+
+    def count(self, names):
+        """
+        Wrap an iterable of names, counting them as they are listed.
+        """
+        for name in names:
+            if self.cancel_event.is_set():
+                return
+            self.listed += 1
+            yield name
+        self.listing_done = True
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+class ScriptScanner:
+    """
+    Classify scripts of a folder (CLI or not) using a process pool.
+
+    Cached scripts are answered from util.ARGUMENT_CACHE in the calling
+    thread; only new or modified scripts are sent to the pool, whose
+    results are delivered from done-callbacks. The pool is
+    created on first use and reused by later scans. It uses the "spawn"
+    start method so worker processes never inherit the GUI's threads.
+    """
+
+    def __init__(self, max_workers=None, min_pool_jobs=16):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.min_pool_jobs = min_pool_jobs
+        self.executor = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            import multiprocessing
+            import concurrent.futures as cf
+            context = multiprocessing.get_context("spawn")
+            self.executor = cf.ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=context)
+        return self.executor
+
+    def scan(self, folder, names, on_result, cancel_event=None):
+        """
+        Classify the given script names of a folder, calling
+        on_result(name, spec) with the ScriptSpec of each script as soon as
+        it is available, in completion order. Names can be a lazy iterable: the
+        pool is started once min_pool_jobs uncached scripts were seen and
+        results stream back while the folder is still being listed.
+        Blocking, run it in a thread. Returns False if the scan was
+        cancelled.
+        """
+        def cancelled():
+            return cancel_event is not None and cancel_event.is_set()
+
+        def on_done(future, name, path):
+            if cancelled() or future.cancelled():
+                return
+            try:
+                scanned = future.result()
+            except Exception as e:
+                print(f"Error scanning {path}: {e}")
+                scanned = None
+            if scanned is None:
+                spec = util.ScriptSpec()
+            else:
+                spec = util.ARGUMENT_CACHE.store(path, scanned)
+            if spec is None:
+                spec = util.get_script_arguments(path)
+            on_result(name, spec)
+
+        def submit(name, path):
+            digest = util.ARGUMENT_CACHE.known_digest(path)
+            future = executor.submit(util.scan_script_file, path, digest)
+            future.add_done_callback(lambda f: on_done(f, name, path))
+            futures.append(future)
+
+        # Imported here, a scan runs after the GUI is drawn
+        import concurrent.futures as cf
+        pending = []
+        futures = []
+        executor = None
+        use_pool = self.max_workers > 1
+        try:
+            for name in names:
+                if cancelled():
+                    return False
+                path = os.path.join(folder, name)
+                cached = util.ARGUMENT_CACHE.lookup(path)
+                if cached is not None:
+                    on_result(name, cached)
+                elif executor is not None:
+                    submit(name, path)
+                else:
+                    pending.append((name, path))
+                    if use_pool and len(pending) >= self.min_pool_jobs:
+                        executor = self._get_executor()
+                        for item in pending:
+                            submit(*item)
+                        pending = []
+            for name, path in pending:
+                if cancelled():
+                    return False
+                on_result(name, util.get_script_arguments(path))
+            for _ in cf.as_completed(futures):
+                if cancelled():
+                    return False
+        finally:
+            for future in futures:
+                future.cancel()
+        util.save_argument_cache()
+        return True
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -1,15 +1,16 @@
 import os
 import sys
 import time
-import subprocess
 import signal
 import queue
+import bisect
 from threading import Thread
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox
 import scriptrunner.lib.utilities as util
-from scriptrunner.lib.rendering import ScriptRunnerRendering, CodeEditorWindow
-
+from scriptrunner.lib.rendering import ScriptRunnerRendering
+from scriptrunner.lib.discovery import ScriptScanner, ScanJob
+from scriptrunner.lib.watching import FolderWatcher
 
 # ==============================================================================
 #                          GUI Interactions
@@ -18,16 +19,37 @@ from scriptrunner.lib.rendering import ScriptRunnerRendering, CodeEditorWindow
 
 class ScriptRunnerInteractions(ScriptRunnerRendering):
 
-    def __init__(self, initial_folder, script_type="cli"):
+    def __init__(self, initial_folder, script_type="cli", recursive=False,
+                 max_depth=None, introspect=False, server_address=None,
+                 agents_address=None, batch_system=None):
         super().__init__(initial_folder)
 
         self.script_type = script_type
         self.show_all_var.set(script_type == "all")
+        self.recursive_var.set(recursive)
+        self.introspect_var.set(introspect)
+        self.max_depth = max_depth
+        # Address of the job server running the queue, None to run it here
+        self.server_address = server_address
+        # Worker agents or batch system running the queue scripts, None to
+        # run them here
+        self.executor = None
+        if batch_system:
+            from scriptrunner.lib.batch import BatchSystem, BATCH_COMMANDS
+            self.executor = BatchSystem(BATCH_COMMANDS[batch_system])
+            self.log_to_console(f">>> Submitting the queue scripts to "
+                                f"{batch_system}", "info")
+        elif agents_address:
+            self.start_agent_pool(agents_address)
+        self.script_scanner = ScriptScanner()
+        self.folder_watcher = None
 
         # Connect view events to controller logic
         self.chk_show_all.config(command=self.populate_script_list)
+        self.chk_recursive.config(command=self.populate_script_list)
+        self.chk_introspect.config(command=self.toggle_introspection)
         self.set_browse_folder_callback(self.browse_folder)
-        self.set_refresh_scripts_callback(self.populate_script_list)
+        self.set_refresh_scripts_callback(self.refresh_script_list)
 
         self.set_browse_interpreter_callback(self.browse_interpreter)
         self.set_check_interpreter_callback(self.check_interpreter)
@@ -47,30 +69,162 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
         self.set_save_sched_edit_callback(self.save_sched_edit)
         self.set_delete_sched_task_callback(self.delete_sched_task)
 
-        # Initial population
-        self.populate_script_list()
+        # Initial population, once the window is drawn
+        self.after_idle(self.after, 0, self.on_first_frame)
         # Window + signal handling
         self.protocol("WM_DELETE_WINDOW", self.on_exit)
         signal.signal(signal.SIGINT, self.on_exit_signal)
         self.check_for_exit_signal()
         self.after(100, self.process_queue)
+        self.after(1000, self.watch_script_folder)
 
-    def resolve_interpreter(self, script_full_path):
-        manual_path = self.interpreter_path.get().strip()
-        if manual_path:
-            if os.path.exists(manual_path) and os.path.isfile(manual_path):
-                return manual_path, "Manual Entry"
+    def start_agent_pool(self, address):
+        from scriptrunner.lib.agents import AgentPool, parse_agent_address
         try:
-            with open(script_full_path, 'r') as f:
-                first_line = f.readline().strip()
-                if first_line.startswith("#!"):
-                    potential_path = first_line[2:].strip()
-                    if os.path.exists(potential_path) and os.path.isfile(
-                            potential_path):
-                        return potential_path, "Script Shebang (#!)"
-        except Exception:
-            pass
-        return sys.executable, "System Default"
+            self.executor = AgentPool(
+                parse_agent_address(address),
+                os.environ.get("SCRIPTRUNNER_AGENT_TOKEN"))
+            self.executor.start()
+        except (OSError, ValueError) as e:
+            self.executor = None
+            self.log_to_console(f"Can't listen for agents: {e}", "stderr")
+            return
+        host, port = self.executor.address
+        self.log_to_console(f">>> Waiting for worker agents on "
+                            f"{host}:{port}", "info")
+
+    def on_first_frame(self):
+        from scriptrunner.lib.scheduling import (get_available_cores,
+                                                 get_total_memory)
+        util.STARTUP_PROFILE.mark("first frame drawn")
+        self.entry_total_cores.insert(0, str(len(get_available_cores())))
+        total_memory = get_total_memory()
+        if total_memory:
+            self.entry_total_memory.insert(0, f"{total_memory:.0f}")
+        self.populate_script_list()
+        self.offer_queue_resume()
+
+    def offer_queue_resume(self):
+        """
+        Offer to restore and resume the queue of a run that didn't finish
+        (crash, reboot), from its journal.
+        """
+        from scriptrunner.lib.journal import QueueJournal, read_journal
+        state = read_journal()
+        if state is None:
+            return
+        tasks = state["tasks"]
+        done = sum(task['status'] == util.STATUS_DONE for task in tasks)
+        queue_iters = state["queue_iterations"] or 1
+        msg = (f"The last queue run didn't finish: {done} of {len(tasks)} "
+               f"tasks done in queue iteration {state['iteration'] + 1}/"
+               f"{queue_iters}.\n\nRestore the queue and resume it?")
+        if not messagebox.askyesno("Resume queue", msg):
+            QueueJournal().discard()
+            return
+        folder = state["folder"]
+        if folder and folder != self.current_folder.get():
+            self.current_folder.set(folder)
+            self.populate_script_list()
+        self.interpreter_path.set(state["interpreter"] or "")
+        for entry, value in ((self.entry_queue_iter, queue_iters),
+                             (self.entry_max_parallel,
+                              state["max_concurrent"] or 1),
+                             (self.entry_total_cores, state["total_cores"]),
+                             (self.entry_total_memory,
+                              state["total_memory"])):
+            entry.delete(0, tk.END)
+            if value is not None:
+                entry.insert(0, f"{value:g}")
+        self.scheduled_tasks = tasks
+        self.refresh_sched_tree()
+        if not self.scheduler_visible:
+            self.toggle_scheduler()
+        self.run_scheduler(start_iteration=state["iteration"])
+
+    def resolve_interpreter(self, script_full_path):
+        return util.resolve_interpreter(script_full_path,
+                                        self.interpreter_path.get())
+
+    def get_script_spec(self, script_full_path):
+        """
+        Get the ScriptSpec of a script, from its real parser when
+        introspection is enabled, else from static parsing. A script not
+        introspected yet gets its static spec, and is introspected in the
+        background; the arguments are redrawn once it is done (SPEC_READY).
+        """
+        if self.introspect_var.get():
+            import scriptrunner.lib.introspection as introspection
+            interpreter, _ = self.resolve_interpreter(script_full_path)
+            spec = introspection.get_cached_spec(script_full_path,
+                                                 interpreter)
+            if spec is not None:
+                return spec
+            if script_full_path not in self.introspecting:
+                self.introspecting.add(script_full_path)
+
+                def run():
+                    try:
+                        introspection.get_script_spec(script_full_path,
+                                                      interpreter)
+                    finally:
+                        self.msg_queue.put(("SPEC_READY", script_full_path))
+
+                Thread(target=run, daemon=True).start()
+        return util.get_script_arguments(script_full_path)
+
+    def on_spec_ready(self, script_full_path):
+        """
+        Redraw the arguments shown for a script introspected in the
+        background, keeping the values typed meanwhile.
+        """
+        self.introspecting.discard(script_full_path)
+        if not self.introspect_var.get():
+            return
+        folder = self.current_folder.get()
+        if (self.current_script and os.path.join(
+                folder, self.current_script) == script_full_path):
+            self.save_current_inputs()
+            self.display_arguments(self.current_script)
+        selected = self.sched_tree.selection()
+        # Not while the task is being edited
+        if selected and str(self.btn_sched_save.cget("state")) == \
+                tk.DISABLED:
+            task = self.scheduled_tasks[int(selected[0])]
+            if (task['type'] in ('script', 'sweep') and os.path.join(
+                    folder, task['name']) == script_full_path):
+                self.display_sched_details(task)
+
+    def toggle_introspection(self):
+        if self.introspect_var.get():
+            self.prefetch_introspection()
+        if self.current_script:
+            self.save_current_inputs()
+            self.display_arguments(self.current_script)
+
+    def prefetch_introspection(self):
+        """
+        Introspect the listed scripts in the background so selecting one
+        doesn't wait for its helper run.
+        """
+        if not self.introspect_var.get() or not self.listed_scripts:
+            return
+        import scriptrunner.lib.introspection as introspection
+        folder = self.current_folder.get()
+        manual_path = self.interpreter_path.get()
+        by_interpreter = {}
+        for script in self.listed_scripts:
+            path = os.path.join(folder, script)
+            interpreter, _ = util.resolve_interpreter(path, manual_path)
+            by_interpreter.setdefault(interpreter, []).append(path)
+        cancel_event = self.scan_job.cancel_event if self.scan_job else None
+
+        def run():
+            for interpreter, paths in by_interpreter.items():
+                introspection.introspect_scripts(paths, interpreter,
+                                                 cancel_event)
+
+        Thread(target=run, daemon=True).start()
 
     def check_interpreter(self):
         if not self.current_script:
@@ -84,6 +238,7 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
         messagebox.showinfo("Interpreter Check", msg)
 
     def browse_folder(self):
+        from tkinter import filedialog
         folder = filedialog.askdirectory(initialdir=self.current_folder.get())
         if folder:
             self.current_folder.set(folder)
@@ -104,6 +259,7 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
             util.save_config(config_data)
 
     def browse_interpreter(self):
+        from tkinter import filedialog
         filename = filedialog.askopenfilename(title="Select Python Interpreter",
                                               initialdir="/")
         if filename:
@@ -111,15 +267,106 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
 
     def populate_script_list(self):
         self.script_list.delete(0, tk.END)
+        self.listed_scripts = []
+        self.scan_id += 1
         folder = self.current_folder.get()
-        files = util.find_possible_scripts(folder)
-        show_all = self.show_all_var.get()
-        for script in files:
-            if self.script_type != "cli" or show_all:
-                self.script_list.insert(tk.END, script)
+        if self.folder_watcher is not None:
+            self.folder_watcher.close()
+        self.folder_watcher = FolderWatcher(
+            folder, recursive=self.recursive_var.get(),
+            max_depth=self.max_depth,
+            ignore_patterns=util.load_ignore_patterns(folder))
+        # Lazy listing, consumed by the scan thread
+        files = self.folder_watcher.iter_reset()
+        classify = self.script_type == "cli" and not self.show_all_var.get()
+        self.start_script_scan(folder, files, classify)
+
+    def start_script_scan(self, folder, files, classify=True):
+        """
+        List (and classify) scripts off the Tk thread, results come back
+        through msg_queue and are inserted in sorted order as they arrive.
+        A running scan is cancelled.
+        """
+        if self.scan_job is not None:
+            self.scan_job.cancel()
+        job = ScanJob(self.scan_id)
+        self.scan_job = job
+        self.scan_results = 0
+        names = job.count(files)
+
+        def on_result(script, spec):
+            self.msg_queue.put(("SCRIPT_RESULT",
+                                (job.scan_id, script, bool(spec.arguments))))
+
+        def run_scan():
+            if classify:
+                self.script_scanner.scan(folder, names, on_result,
+                                         job.cancel_event)
             else:
-                if util.get_script_arguments(os.path.join(folder, script))[0]:
-                    self.script_list.insert(tk.END, script)
+                for script in names:
+                    self.msg_queue.put(("SCRIPT_RESULT",
+                                        (job.scan_id, script, True)))
+            self.msg_queue.put(("SCAN_DONE", job))
+
+        Thread(target=run_scan, daemon=True).start()
+
+    def update_scan_status(self):
+        job = self.scan_job
+        if job is None or job.cancelled:
+            return
+        total = f"{job.listed}" if job.listing_done else f"{job.listed}+"
+        self.status_var.set(f"Scanning {self.scan_results}/{total}...")
+
+    def refresh_script_list(self):
+        """
+        Apply only the files added, removed or modified since the last scan
+        to the script list and the argument cache.
+        """
+        folder = os.path.abspath(self.current_folder.get())
+        watcher = self.folder_watcher
+        if watcher is None or watcher.folder != folder:
+            self.populate_script_list()
+            return
+        if self.scan_job is not None:
+            # Done once the running scan finished
+            self.refresh_pending = True
+            return
+        if not watcher.complete:
+            # The last full scan was cancelled part-way
+            self.populate_script_list()
+            return
+        added, removed, modified = watcher.poll()
+        for script in removed:
+            util.ARGUMENT_CACHE.invalidate(os.path.join(folder, script))
+            self.remove_script(script)
+        if self.script_type != "cli" or self.show_all_var.get():
+            for script in added:
+                self.insert_script_sorted(script)
+        elif added or modified:
+            self.start_script_scan(folder, added + modified)
+
+    def watch_script_folder(self):
+        # Only auto-refresh when inotify makes checks free; the scandir
+        # fallback runs on user refresh.
+        if self.folder_watcher is not None \
+                and self.folder_watcher.uses_inotify:
+            self.refresh_script_list()
+        self.after(1000, self.watch_script_folder)
+
+    def insert_script_sorted(self, script):
+        index = bisect.bisect_left(self.listed_scripts, script)
+        if index < len(self.listed_scripts) and \
+                self.listed_scripts[index] == script:
+            return
+        self.listed_scripts.insert(index, script)
+        self.script_list.insert(index, script)
+
+    def remove_script(self, script):
+        index = bisect.bisect_left(self.listed_scripts, script)
+        if index < len(self.listed_scripts) and \
+                self.listed_scripts[index] == script:
+            del self.listed_scripts[index]
+            self.script_list.delete(index)
 
     def on_script_select(self, event):
         selection = self.script_list.curselection()
@@ -141,16 +388,19 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
         if self.editor_window and self.editor_window.winfo_exists():
             self.editor_window.add_file(full_path)
         else:
+            # Loaded on first use, it pulls in idlelib
+            from scriptrunner.lib.editor import CodeEditorWindow
             self.editor_window = CodeEditorWindow(self,
-                                                  self.populate_script_list)
+                                                  self.refresh_script_list)
             self.editor_window.add_file(full_path)
 
     def display_arguments(self, script_name):
+        from scriptrunner.lib.scheduling import SWEEP_MODES
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
 
         full_path = os.path.join(self.current_folder.get(), script_name)
-        arguments, has_argparse = util.get_script_arguments(full_path)
+        spec = self.get_script_spec(full_path)
         self.entries = {}
 
         self.scrollable_frame.grid_columnconfigure(0, weight=0)
@@ -163,11 +413,12 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
                   foreground="#0055aa").grid(row=0, column=0, columnspan=4,
                                              pady=0, sticky="nw", padx=5)
         row = 1
-        if has_argparse:
-            for (raw_flag, clean_name, help_text, arg_type, required,
-                 default_value) in arguments:
+        if spec.has_argparse:
+            for arg in spec.arguments:
+                clean_name = arg.clean_name
+                arg_type = arg.arg_type
 
-                ttk.Label(self.scrollable_frame, text=raw_flag,
+                ttk.Label(self.scrollable_frame, text=arg.raw_flag,
                           width=15, anchor="w",
                           font=(util.FONT_FAMILY,
                                 util.PARA_FONT_SIZE)).grid(row=row, column=0,
@@ -180,16 +431,21 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
                                 util.PARA_FONT_SIZE)).grid(row=row, column=1,
                                                            sticky="w", padx=2,
                                                            pady=2)
-                entry = ttk.Entry(self.scrollable_frame, width=15)
+                if arg.choices:
+                    entry = ttk.Combobox(self.scrollable_frame, width=13,
+                                         values=[str(c) for c in arg.choices])
+                else:
+                    entry = ttk.Entry(self.scrollable_frame, width=15)
                 entry.grid(row=row, column=2, sticky="w", padx=2, pady=2)
 
                 if script_name in self.script_inputs and clean_name in \
                         self.script_inputs[script_name]:
                     entry.insert(0, self.script_inputs[script_name][clean_name])
-                elif default_value is not None:
-                    entry.insert(0, str(default_value))
+                elif arg.default_value is not None:
+                    entry.insert(0, str(arg.default_value))
 
-                ttk.Label(self.scrollable_frame, text=help_text, justify="left",
+                ttk.Label(self.scrollable_frame, text=arg.help_text,
+                          justify="left",
                           foreground="#555",
                           font=(util.FONT_FAMILY,
                                 util.PARA_FONT_SIZE)).grid(row=row, column=3,
@@ -226,6 +482,23 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
         self.entry_sched_index = ttk.Entry(frame_add, width=3)
         self.entry_sched_index.insert(0, "-1")
         self.entry_sched_index.pack(side=tk.LEFT, padx=0)
+        ttk.Label(frame_add, text="After:").pack(side=tk.LEFT, padx=(5, 0))
+        self.entry_sched_after = ttk.Entry(frame_add, width=6)
+        self.entry_sched_after.pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Label(frame_add, text="Cores:").pack(side=tk.LEFT, padx=(5, 0))
+        self.entry_sched_cores = ttk.Entry(frame_add, width=3)
+        self.entry_sched_cores.pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Label(frame_add, text="RAM:").pack(side=tk.LEFT, padx=(5, 0))
+        self.entry_sched_memory = ttk.Entry(frame_add, width=4)
+        self.entry_sched_memory.pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Label(frame_add, text="Priority:").pack(side=tk.LEFT, padx=(5, 0))
+        self.entry_sched_priority = ttk.Entry(frame_add, width=3)
+        self.entry_sched_priority.pack(side=tk.LEFT, padx=(5, 0))
+        # Sweep over the parameters given as "[a, b]" or "range(...)"
+        ttk.Label(frame_add, text="Sweep:").pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Combobox(frame_add, textvariable=self.sched_sweep_var, width=7,
+                     values=("no",) + SWEEP_MODES,
+                     state="readonly").pack(side=tk.LEFT, padx=(5, 0))
         ttk.Button(frame_add, text="Add to schedule", width=15,
                    command=self.schedule_script).pack(side=tk.LEFT, padx=(5, 0))
 
@@ -237,14 +510,112 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
         for clean_name, (entry, _) in self.entries.items():
             self.script_inputs[self.current_script][clean_name] = entry.get()
 
+    def sched_row_values(self, index, task):
+        from scriptrunner.lib.scheduling import (ParameterSweep,
+                                                 get_task_resources,
+                                                 get_retry_policy,
+                                                 get_task_priority,
+                                                 ids_to_positions)
+        if task['type'] == 'sleep':
+            name_display = f"Sleep: {task['params']['duration']} sec"
+        elif task['type'] == 'sweep':
+            try:
+                points = len(ParameterSweep(task['params'], task['mode']))
+            except ValueError:
+                points = "invalid"
+            name_display = f"{task['name']} (sweep, {points} points)"
+        else:
+            name_display = task['name']
+        cores, memory = get_task_resources(task)
+        if cores or memory:
+            name_display += f" [{cores} cores, {memory:g} GB]"
+        timeout, retries, _, _ = get_retry_policy(task)
+        if timeout:
+            name_display += f" [timeout {timeout:g} s]"
+        if retries:
+            name_display += f" [{retries} retries]"
+        priority = get_task_priority(task)
+        if priority:
+            name_display += f" [priority {priority}]"
+        for key in ("at", "every", "cron"):
+            if task.get(key):
+                name_display += f" [{key} {task[key]}]"
+        iter_val = task.get('iterations', 1)
+        after = ids_to_positions(self.scheduled_tasks, task.get('after', []))
+        return (index + 1, iter_val, name_display,
+                ",".join(str(p) for p in after), task['status'])
+
     def refresh_sched_tree(self):
         self.sched_tree.delete(*self.sched_tree.get_children())
         for i, task in enumerate(self.scheduled_tasks):
-            name_display = task['name'] if task['type'] == 'script'\
-                else f"Sleep: {task['params']['duration']} sec"
-            iter_val = task.get('iterations', 1)
-            self.sched_tree.insert("", "end", iid=i, values=(
-                i + 1, iter_val, name_display, task['status']))
+            self.sched_tree.insert("", "end", iid=i,
+                                   values=self.sched_row_values(i, task))
+
+    def get_after_ids(self, text):
+        """
+        Convert the task numbers typed in an "After" field to task ids.
+        Shows an error and returns None if they are invalid.
+        """
+        from scriptrunner.lib.scheduling import parse_task_positions
+        try:
+            positions = parse_task_positions(text)
+            if any(p > len(self.scheduled_tasks) for p in positions):
+                raise ValueError("No such task")
+        except ValueError:
+            messagebox.showerror("Error", f"Invalid task numbers: '{text}'. "
+                                          f"Use e.g. '2, 3'")
+            return None
+        return [self.scheduled_tasks[p - 1]['id'] for p in positions]
+
+    def get_reservation(self, cores_text, memory_text):
+        """
+        Parse the cores and RAM (GB) reserved by a task, empty means 0.
+        Shows an error and returns None if they are invalid.
+        """
+        try:
+            cores = int(cores_text.strip() or 0)
+            memory = float(memory_text.strip() or 0)
+            if cores < 0 or memory < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Cores must be a whole number and "
+                                          "RAM a number of GB")
+            return None
+        return cores, memory
+
+    def get_retry_options(self, timeout_text, retries_text, backoff_text,
+                          codes_text):
+        """
+        Parse the timeout (s), retries, backoff (s) and retryable exit codes
+        of a task, empty timeout/retries mean 0. Shows an error and returns
+        None if they are invalid.
+        """
+        from scriptrunner.lib.scheduling import parse_exit_codes
+        try:
+            timeout = float(timeout_text.strip() or 0)
+            retries = int(retries_text.strip() or 0)
+            backoff = float(backoff_text.strip() or 1)
+            retry_codes = parse_exit_codes(codes_text)
+            if timeout < 0 or retries < 0 or backoff < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Timeout and backoff must be "
+                                          "seconds, retries a whole number "
+                                          "and exit codes e.g. '1, 75'")
+            return None
+        return {'timeout': timeout, 'retries': retries, 'backoff': backoff,
+                'retry_codes': retry_codes}
+
+    def get_priority(self, text):
+        """
+        Parse the priority of a task, empty means 0. Shows an error and
+        returns None if it is invalid.
+        """
+        try:
+            return int(text.strip() or 0)
+        except ValueError:
+            messagebox.showerror("Error", "Priority must be a whole number")
+            return None
 
     def _insert_task_at_position(self, task, position_text):
         """
@@ -268,6 +639,9 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
                 self.scheduled_tasks.insert(internal_idx, task)
 
     def schedule_script(self):
+        from scriptrunner.lib.scheduling import (Scheduler, make_script_task,
+                                                 make_sweep_task,
+                                                 ParameterSweep, SWEEP_MODES)
         if not self.current_script:
             return
         current_params = {}
@@ -280,21 +654,46 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
         except:
             iterations = 1
 
-        task = {'type': 'script', 'name': self.current_script,
-                'params': current_params, 'status': util.STATUS_PENDING,
-                'iterations': iterations}
-        self._insert_task_at_position(task, self.entry_sched_index.get())
+        after = self.get_after_ids(self.entry_sched_after.get())
+        if after is None:
+            return
+        reservation = self.get_reservation(self.entry_sched_cores.get(),
+                                           self.entry_sched_memory.get())
+        if reservation is None:
+            return
+        priority = self.get_priority(self.entry_sched_priority.get())
+        if priority is None:
+            return
+        mode = self.sched_sweep_var.get()
+        if mode in SWEEP_MODES:
+            try:
+                ParameterSweep(current_params, mode)
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid sweep: {e}")
+                return
+            task = make_sweep_task(self.current_script, current_params, mode,
+                                   iterations=iterations, after=after,
+                                   cores=reservation[0], memory=reservation[1],
+                                   priority=priority)
+        else:
+            task = make_script_task(self.current_script, current_params,
+                                    iterations, after, cores=reservation[0],
+                                    memory=reservation[1], priority=priority)
+        # Added to the end of the running queue, where it starts by its
+        # priority, unless the queue is ending
+        if not (self.scheduler_running
+                and isinstance(self.scheduler, Scheduler)
+                and self.scheduler.submit([task]) is not None):
+            self._insert_task_at_position(task, self.entry_sched_index.get())
         self.refresh_sched_tree()
         # If scheduler is hidden, expand it
         if not self.scheduler_visible:
             self.toggle_scheduler()
 
     def add_sleep_to_scheduler(self):
+        from scriptrunner.lib.scheduling import make_sleep_task
         try:
-            dur = float(self.sleep_duration_var.get())
-            task = {'type': 'sleep', 'name': 'Sleep',
-                    'params': {'duration': dur}, 'status': util.STATUS_PENDING,
-                    'iterations': 1}
+            task = make_sleep_task(float(self.sleep_duration_var.get()))
             self._insert_task_at_position(task, self.sleep_position_var.get())
             self.refresh_sched_tree()
             # If scheduler is hidden, expand it
@@ -333,24 +732,28 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
         self.btn_sched_save.config(state=tk.DISABLED)
 
     def display_sched_details(self, task):
+        from scriptrunner.lib.scheduling import (get_task_resources,
+                                                 get_retry_policy,
+                                                 get_task_priority,
+                                                 ids_to_positions)
         for widget in self.sched_scroll_frame.winfo_children():
             widget.destroy()
         self.scheduler_entries = {}
 
         self.sched_scroll_frame.grid_columnconfigure(1, weight=1)
 
-        if task['type'] == 'script':
+        if task['type'] in ('script', 'sweep'):
             ttk.Label(self.sched_scroll_frame, text=f"{task['name']}",
                       font=(util.FONT_FAMILY, util.FONT_SIZE),
                       foreground="#0055aa").grid(row=0, column=0, columnspan=2,
                                                  sticky="w", pady=0, padx=5)
             full_path = os.path.join(self.current_folder.get(), task['name'])
-            arguments, has_args = util.get_script_arguments(full_path)
-            if has_args:
+            spec = self.get_script_spec(full_path)
+            if spec.has_argparse:
                 row = 1
-                for raw_flag, clean_name, help_text, arg_type, required, \
-                        default_val in arguments:
-                    ttk.Label(self.sched_scroll_frame, text=raw_flag,
+                for arg in spec.arguments:
+                    clean_name = arg.clean_name
+                    ttk.Label(self.sched_scroll_frame, text=arg.raw_flag,
                               font=(util.FONT_FAMILY,
                                     util.FONT_SIZE - 2)).grid(row=row, column=0,
                                                               sticky="w",
@@ -376,26 +779,121 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
             entry.grid(row=1, column=1, sticky="w", padx=5, pady=5)
             self.scheduler_entries['duration'] = entry
 
+        # Scheduling options, apart from the script parameters
+        after = ids_to_positions(self.scheduled_tasks, task.get('after', []))
+        options = [("after", "After (task numbers):",
+                    ", ".join(str(p) for p in after))]
+        if task['type'] != 'sleep':
+            cores, memory = get_task_resources(task)
+            options += [("cores", "Reserved cores:", str(cores)),
+                        ("memory", "Reserved RAM (GB):", f"{memory:g}")]
+        if task['type'] != 'sleep':
+            timeout, retries, backoff, retry_codes = get_retry_policy(task)
+            options += [("timeout", "Timeout (s, 0: none):", f"{timeout:g}"),
+                        ("retries", "Retries:", str(retries)),
+                        ("backoff", "Retry backoff (s):", f"{backoff:g}"),
+                        ("retry_codes", "Retry exit codes (empty: any):",
+                         ", ".join(str(c) for c in retry_codes)),
+                        ("priority", "Priority (higher first):",
+                         str(get_task_priority(task))),
+                        ("at", "Start at (HH:MM, empty: now):",
+                         str(task.get('at', ""))),
+                        ("every", "Repeat every (e.g. 5m):",
+                         str(task.get('every', ""))),
+                        ("cron", "Cron pattern (m h dom mon dow):",
+                         str(task.get('cron', "")))]
+        if task['type'] == 'sweep':
+            options += [("mode", "Sweep mode:", task['mode']),
+                        ("parallel", "Parallel points (0: all):",
+                         str(task['parallel']))]
+        self.sched_option_entries = {}
+        row = self.sched_scroll_frame.grid_size()[1]
+        for key, label, value in options:
+            ttk.Label(self.sched_scroll_frame, text=label).grid(
+                row=row, column=0, sticky="w", padx=5, pady=5)
+            entry = ttk.Entry(self.sched_scroll_frame, width=20)
+            entry.insert(0, value)
+            entry.config(state='readonly')
+            entry.grid(row=row, column=1, sticky="w", padx=5, pady=5)
+            self.sched_option_entries[key] = entry
+            row += 1
+
     def enable_sched_edit(self):
         for entry in self.scheduler_entries.values():
             entry.config(state='normal')
+        for entry in self.sched_option_entries.values():
+            entry.config(state='normal')
         self.btn_sched_save.config(state=tk.NORMAL)
         self.btn_sched_edit.config(state=tk.DISABLED)
 
     def save_sched_edit(self):
+        from scriptrunner.lib.scheduling import ParameterSweep
+        from scriptrunner.lib.triggers import get_first_run
         selected = self.sched_tree.selection()
         if not selected:
             return
         idx = int(selected[0])
+        task = self.scheduled_tasks[idx]
+        options = self.sched_option_entries
+        after = self.get_after_ids(options['after'].get())
+        if after is None:
+            return
+        if task['id'] in after:
+            messagebox.showerror("Error", "A task can't run after itself")
+            return
+        reservation = None
+        retry_options = {}
+        timing = {}
+        if 'cores' in options:
+            reservation = self.get_reservation(options['cores'].get(),
+                                               options['memory'].get())
+            if reservation is None:
+                return
+            retry_options = self.get_retry_options(
+                options['timeout'].get(), options['retries'].get(),
+                options['backoff'].get(), options['retry_codes'].get())
+            if retry_options is None:
+                return
+            priority = self.get_priority(options['priority'].get())
+            if priority is None:
+                return
+            retry_options['priority'] = priority
+            timing = {key: options[key].get().strip()
+                      for key in ("at", "every", "cron")}
+            try:
+                get_first_run(timing, time.time())
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid start time: {e}")
+                return
+        params = dict(task['params'])
         for key, entry in self.scheduler_entries.items():
-            self.scheduled_tasks[idx]['params'][key] = entry.get()
+            params[key] = entry.get()
+        if task['type'] == 'sweep':
+            mode = options['mode'].get().strip()
+            try:
+                parallel = int(options['parallel'].get() or 0)
+                if parallel < 0:
+                    raise ValueError("Parallel points must be 0 or more")
+                ParameterSweep(params, mode)
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid sweep: {e}")
+                return
+            task['mode'], task['parallel'] = mode, parallel
+        if reservation is not None:
+            task['cores'], task['memory'] = reservation
+        task.update(retry_options)
+        for key, value in timing.items():
+            if value:
+                task[key] = value
+            else:
+                task.pop(key, None)
+        task['after'] = after
+        task['params'] = params
+        for entry in options.values():
             entry.config(state='readonly')
-        task = self.scheduled_tasks[idx]
-        name_display = task['name'] if task['type'] == 'script'\
-            else f"Sleep: {task['params']['duration']} sec"
-        iter_val = task.get('iterations', 1)
-        self.sched_tree.item(selected, values=(
-            idx + 1, iter_val, name_display, task['status']))
+        for entry in self.scheduler_entries.values():
+            entry.config(state='readonly')
+        self.sched_tree.item(selected, values=self.sched_row_values(idx, task))
 
         self.btn_sched_save.config(state=tk.DISABLED)
         self.btn_sched_edit.config(state=tk.NORMAL)
@@ -405,7 +903,10 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
         if not selected:
             return
         idx = int(selected[0])
-        del self.scheduled_tasks[idx]
+        task_id = self.scheduled_tasks.pop(idx)['id']
+        for task in self.scheduled_tasks:
+            if task_id in task['after']:
+                task['after'].remove(task_id)
         self.refresh_sched_tree()
         for widget in self.sched_scroll_frame.winfo_children():
             widget.destroy()
@@ -416,37 +917,148 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
     # Logic: Execution Engine
     # ---------------------------------------------------------
 
-    def run_scheduler(self):
+    def run_scheduler(self, start_iteration=0):
+        from scriptrunner.lib.journal import QueueJournal
         if self.scheduler_running:
             return
         if not self.scheduled_tasks:
             messagebox.showinfo("Info", "Queue is empty")
             return
-
+        try:
+            queue_iters = max(int(self.entry_queue_iter.get()), 1)
+        except ValueError:
+            queue_iters = 1
+        try:
+            max_parallel = max(int(self.entry_max_parallel.get()), 1)
+        except ValueError:
+            max_parallel = 1
+        if self.server_address is not None:
+            self.scheduler = self.create_server_queue(self.scheduled_tasks,
+                                                      queue_iters,
+                                                      max_parallel)
+        else:
+            # Journal the run, to resume it after a crash
+            self.scheduler = self.create_scheduler(self.scheduled_tasks,
+                                                   queue_iters, max_parallel,
+                                                   QueueJournal(),
+                                                   start_iteration,
+                                                   self.executor)
         self.scheduler_running = True
         self.scheduler_paused = False
         self.shutdown_flag = False
         self.btn_sched_run.config(state=tk.DISABLED)
         self.btn_sched_pause.config(state=tk.NORMAL)
         self.btn_sched_stop.config(state=tk.NORMAL)
-        Thread(target=self.scheduler_loop, daemon=True).start()
+        Thread(target=self.scheduler_loop, args=(self.scheduler,),
+               daemon=True).start()
+
+    def create_scheduler(self, tasks, queue_iterations=1, max_concurrent=1,
+                         journal=None, start_iteration=0, executor=None):
+        """
+        Create a Scheduler for the current folder and interpreter settings,
+        reporting its progress through the message queue. Its scripts run
+        through executor (AgentPool or BatchSystem), if given.
+        """
+        from scriptrunner.lib.scheduling import Scheduler
+        try:
+            total_cores = int(self.entry_total_cores.get())
+        except ValueError:
+            total_cores = None
+        try:
+            total_memory = float(self.entry_total_memory.get())
+        except ValueError:
+            total_memory = None
+        scheduler = Scheduler(tasks, self.current_folder.get(),
+                              self.interpreter_path.get(), queue_iterations,
+                              self.introspect_var.get(),
+                              max_concurrent=max_concurrent,
+                              total_cores=total_cores,
+                              total_memory=total_memory, journal=journal,
+                              start_iteration=start_iteration,
+                              executor=executor,
+                              preempt=self.get_preempt_mode())
+        scheduler.on_event = lambda kind, data: self.on_scheduler_event(
+            scheduler, kind, data)
+        return scheduler
+
+    def get_preempt_mode(self):
+        from scriptrunner.lib.scheduling import PREEMPT_MODES
+        mode = self.preempt_var.get()
+        return mode if mode in PREEMPT_MODES else None
+
+    def create_server_queue(self, tasks, queue_iterations=1,
+                            max_concurrent=1):
+        """
+        Create a ServerQueue running tasks on the job server, reporting its
+        progress through the message queue.
+        """
+        from scriptrunner.lib.server import JobClient, ServerQueue
+        server_queue = ServerQueue(JobClient(self.server_address), tasks,
+                                   self.current_folder.get(),
+                                   queue_iterations,
+                                   max_concurrent=max_concurrent)
+        server_queue.on_event = lambda kind, data: self.on_scheduler_event(
+            server_queue, kind, data)
+        return server_queue
+
+    def on_scheduler_event(self, scheduler, kind, data):
+        # Called from scheduler threads, only post messages
+        if kind == "output" and scheduler.max_concurrent > 1:
+            # Tell apart the output of tasks running at once
+            index, line = data
+            self.msg_queue.put(("stdout", f"[{index + 1}] {line}"))
+        elif kind == "status":
+            self.msg_queue.put(("TREE_UPDATE", data))
+        elif kind == "start":
+            _, command = data
+            self.msg_queue.put(("STATUS_BAR",
+                                f"Running: {os.path.basename(command[2])}..."))
+            self.msg_queue.put(("info", f"\n{'=' * 60}"))
+            self.msg_queue.put(("info", f"STARTED AT: {time.ctime()}"))
+            self.msg_queue.put(("info", f"COMMAND:\n{' '.join(command)}"))
+            self.msg_queue.put(("info", f"{'=' * 60}\n"))
+        elif kind == "output":
+            self.msg_queue.put(("stdout", data[1]))
+        elif kind == "end":
+            _, command, _ = data
+            self.msg_queue.put(("info", f"\n{'=' * 60}"))
+            self.msg_queue.put(("info", f"COMMAND:\n{' '.join(command)}"))
+            self.msg_queue.put(("info", f"FINISHED AT: {time.ctime()}"))
+            self.msg_queue.put(("info", f"{'=' * 60}\n"))
+        elif kind == "info":
+            self.msg_queue.put(("info", f">>> {data}"))
+        elif kind == "error":
+            self.msg_queue.put(("stderr", data))
+            self.msg_queue.put(("STATUS_BAR", ""))
 
     def pause_scheduler(self):
         self.scheduler_paused = True
+        freeze = self.suspend_var.get()
+        if self.scheduler is not None:
+            if freeze:
+                self.scheduler.suspend()
+            else:
+                self.scheduler.pause()
         self.btn_sched_pause.config(state=tk.DISABLED)
         self.btn_sched_resume.config(state=tk.NORMAL)
-        self.log_to_console(">>> Scheduler Paused...", "info")
+        if freeze:
+            self.log_to_console(">>> Scheduler Paused, running scripts "
+                                "suspended...", "info")
+        else:
+            self.log_to_console(">>> Scheduler Paused...", "info")
 
     def resume_scheduler(self):
         self.scheduler_paused = False
+        if self.scheduler is not None:
+            self.scheduler.resume()
         self.btn_sched_pause.config(state=tk.NORMAL)
         self.btn_sched_resume.config(state=tk.DISABLED)
         self.log_to_console(">>> Scheduler Resumed...", "info")
 
     def stop_scheduler(self):
         self.shutdown_flag = True
-        if self.process and self.process.poll() is None:
-            self.process.terminate()
+        if self.scheduler is not None:
+            self.scheduler.stop()
         self.scheduler_running = False
         self.btn_sched_run.config(state=tk.NORMAL)
         self.btn_sched_pause.config(state=tk.DISABLED)
@@ -454,194 +1066,45 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
         self.btn_sched_stop.config(state=tk.DISABLED)
         self.log_to_console(">>> Scheduler Stopped by User.", "stderr")
 
-    def scheduler_loop(self):
-        # 1. Get global iterations
-        try:
-            queue_iters = int(self.entry_queue_iter.get())
-            if queue_iters < 1:
-                queue_iters = 1
-        except ValueError:
-            queue_iters = 1
-        # 2. Auto-reset check
-        if self.scheduled_tasks:
-            all_completed = all(
-                t['status'] in [util.STATUS_DONE, util.STATUS_FAILED] for t in
-                self.scheduled_tasks)
-            if all_completed:
-                self.log_to_console(
-                    ">>> Queue is finished. Resetting for new run...", "info")
-                for i, task in enumerate(self.scheduled_tasks):
-                    task['status'] = util.STATUS_PENDING
-                    self.update_tree_status(i, util.STATUS_PENDING)
-        # 3. Outer Loop: cycle the entire queue
-        for q_run in range(queue_iters):
-            if self.shutdown_flag:
-                break
-            if q_run > 0:
-                self.log_to_console(f"--- Restarting Queue (Iteration "
-                                    f"{q_run + 1}/{queue_iters}) ---", "info")
-                for i, task in enumerate(self.scheduled_tasks):
-                    task['status'] = util.STATUS_PENDING
-                    self.update_tree_status(i, util.STATUS_PENDING)
-            elif queue_iters > 1:
-                self.log_to_console(f"--- Starting Queue (Iteration "
-                                    f"1/{queue_iters}) ---", "info")
-            # 4. Inner Loop: Execute tasks
-            for i, task in enumerate(self.scheduled_tasks):
-                if self.shutdown_flag:
-                    break
-                while self.scheduler_paused:
-                    if self.shutdown_flag:
-                        break
-                    time.sleep(0.2)
-                # Skip tasks that are already done
-                if task['status'] == util.STATUS_DONE:
-                    continue
-                total_runs = task.get('iterations', 1)
-                for run_idx in range(total_runs):
-                    if self.shutdown_flag:
-                        break
-                    while self.scheduler_paused:
-                        if self.shutdown_flag:
-                            break
-                        time.sleep(0.2)
-                    status_txt = util.STATUS_RUNNING if total_runs == 1\
-                        else f"Run {run_idx + 1}/{total_runs}"
-                    task['status'] = status_txt
-                    self.update_tree_status(i, status_txt)
-                    if task['type'] == 'sleep':
-                        try:
-                            dur = float(task['params']['duration'])
-                            self.log_to_console(
-                                f"\n>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>"
-                                f"\n Sleeping for {dur} seconds...\n"
-                                f">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>\n",
-                                "info")
-                            elapsed = 0
-                            while elapsed < dur:
-                                if self.shutdown_flag:
-                                    break
-                                while self.scheduler_paused:
-                                    if self.shutdown_flag:
-                                        break
-                                    time.sleep(0.2)
-                                time.sleep(0.1)
-                                elapsed += 0.1
-                        except:
-                            task['status'] = util.STATUS_FAILED
-                            self.update_tree_status(i, util.STATUS_FAILED)
-                            break
-
-                    elif task['type'] == 'script':
-                        self.task_output_complete.clear()
-                        success = self.execute_queue_script(task)
-                        if not self.shutdown_flag:
-                            self.task_output_complete.wait()
-                        if not success:
-                            task['status'] = util.STATUS_FAILED
-                            self.update_tree_status(i, util.STATUS_FAILED)
-                            break
-                # After inner task completion
-                if (not self.shutdown_flag
-                        and task['status'] != util.STATUS_FAILED):
-                    task['status'] = util.STATUS_DONE
-                    self.update_tree_status(i, util.STATUS_DONE)
-            # If any task failed in the inner loop, break the outer loop
-            any_failed = any(
-                t['status'] == util.STATUS_FAILED for t in self.scheduled_tasks)
-            if any_failed:
-                break
-
-        self.scheduler_running = False
-        self.msg_queue.put(("UI_RESET", None))
-
-    def update_tree_status(self, index, status):
-        self.msg_queue.put(("TREE_UPDATE", (index, status)))
-
-    def execute_queue_script(self, task):
-        script_path = os.path.join(self.current_folder.get(), task['name'])
-        interpreter, _ = self.resolve_interpreter(script_path)
-        command = [interpreter, script_path]
-        command.insert(1, "-u")
-        script_args_def, has_args = util.get_script_arguments(script_path)
-        if has_args:
-            arg_map = {clean_name: arg_type for
-                       (_, clean_name, _, arg_type, _, _) in script_args_def}
-            self.msg_queue.put(("STATUS_BAR", f"Running: {task['name']}..."))
-
-            for clean_name, val in task['params'].items():
-                if not val:
-                    continue
-                try:
-                    if clean_name in arg_map:
-                        _ = arg_map[clean_name](val)
-                except Exception:
-                    self.log_to_console(f"Error: Invalid param "
-                                        f"{clean_name}={val}", "stderr")
-                    self.msg_queue.put(("STATUS_BAR", ""))
-                    return False
-                raw_flag = None
-                for rf, cn, _, _, _, _ in script_args_def:
-                    if cn == clean_name:
-                        raw_flag = rf
-                        break
-                if raw_flag is None:
-                    raw_flag = f"--{clean_name}"
-                command.append(raw_flag)
-                command.append(val)
-
-        full_cmd_str = " ".join(command)
-        start_time = time.ctime()
-
-        self.msg_queue.put(("info", f"\n{'=' * 60}"))
-        self.msg_queue.put(("info", f"STARTED AT: {start_time}"))
-        self.msg_queue.put(("info", f"COMMAND:\n{full_cmd_str}"))
-        self.msg_queue.put(("info", f"{'=' * 60}\n"))
-
+    def scheduler_loop(self, scheduler):
         try:
-            self.process = subprocess.Popen(command, stdout=subprocess.PIPE,
-                                            stderr=subprocess.STDOUT, text=True,
-                                            bufsize=1)
-            for line in iter(self.process.stdout.readline, ''):
-                self.msg_queue.put(("stdout", line))
-
-            self.process.stdout.close()
-            self.process.wait()
-
-            end_time = time.ctime()
-            self.msg_queue.put(("info", f"\n{'=' * 60}"))
-            self.msg_queue.put(("info", f"COMMAND:\n{full_cmd_str}"))
-            self.msg_queue.put(("info", f"FINISHED AT: {end_time}"))
-            self.msg_queue.put(("info", f"{'=' * 60}\n"))
-            self.msg_queue.put(("TASK_DONE_SIGNAL", None))
-            if self.shutdown_flag:
-                return False
-            return (self.process.returncode == 0)
-        except Exception as e:
-            self.msg_queue.put(("stderr", f"Scheduler Error: {e}"))
-            self.msg_queue.put(("STATUS_BAR", ""))
-            return False
+            scheduler.run()
+        finally:
+            self.scheduler_running = False
+            self.msg_queue.put(("UI_RESET", None))
 
     def run_script_direct(self, script_name):
-        if self.process and self.process.poll() is None:
+        from scriptrunner.lib.scheduling import make_script_task
+        if self.direct_runner is not None and self.direct_runner.running:
             messagebox.showerror("Error", "Process running")
             return
         current_params = {}
         for flag, (entry, _) in self.entries.items():
             current_params[flag] = entry.get()
-        task = {'type': 'script', 'name': script_name, 'params': current_params}
-        Thread(target=self.execute_queue_script, args=(task,),
+        task = make_script_task(script_name, current_params)
+        self.direct_runner = self.create_scheduler([task])
+        self.direct_runner.running = True
+        Thread(target=self.run_direct, args=(self.direct_runner, task),
                daemon=True).start()
 
+    def run_direct(self, runner, task):
+        try:
+            runner.run_script(0, task)
+        finally:
+            runner.running = False
+
     def stop_script(self):
-        if self.process:
-            self.process.terminate()
+        if self.direct_runner is not None and self.direct_runner.running:
+            self.direct_runner.stop()
             self.log_to_console("\n!!! Stopped by User !!!\n", "stderr")
 
     def process_queue(self):
+        num_msg = 0
+        delay = 100
         try:
             while True:
                 msg_type, msg = self.msg_queue.get_nowait()
+                num_msg += 1
                 if msg_type in ["stdout", "stderr", "info"]:
                     self.log_to_console(msg, msg_type)
                 elif msg_type == "TREE_UPDATE":
@@ -655,14 +1118,51 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
                     self.btn_sched_stop.config(state=tk.DISABLED)
                     self.log_to_console("\n=== Scheduler Queue Finished ===\n",
                                         "info")
-                elif msg_type == "TASK_DONE_SIGNAL":
-                    self.task_output_complete.set()
+                elif msg_type == "SCRIPT_RESULT":
+                    scan_id, script, is_cli = msg
+                    if scan_id == self.scan_id:
+                        self.scan_results += 1
+                        if is_cli:
+                            self.insert_script_sorted(script)
+                        else:
+                            self.remove_script(script)
+                elif msg_type == "SCAN_DONE":
+                    if msg is self.scan_job:
+                        self.prefetch_introspection()
+                        self.scan_job = None
+                        self.status_var.set(
+                            f"{len(self.listed_scripts)} scripts found")
+                        if not util.STARTUP_PROFILE.reported:
+                            util.STARTUP_PROFILE.mark("first script scan done")
+                            util.STARTUP_PROFILE.report()
+                        if self.refresh_pending:
+                            self.refresh_pending = False
+                            self.refresh_script_list()
+                elif msg_type == "SPEC_READY":
+                    self.on_spec_ready(msg)
                 elif msg_type == "STATUS_BAR":
-                    if hasattr(self, 'status_bar'):
-                        self.status_bar.config(text=str(msg))
+                    self.status_var.set(str(msg))
+                if num_msg >= util.MAX_MESSAGES_PER_TICK:
+                    # Keep the GUI responsive, carry on shortly
+                    delay = 10
+                    break
         except queue.Empty:
             pass
-        self.after(100, self.process_queue)
+        self.update_scan_status()
+        self.update_suspended_status()
+        self.after(delay, self.process_queue)
+
+    def update_suspended_status(self):
+        """Show how long each suspended task has been suspended."""
+        scheduler = self.scheduler
+        if scheduler is None or not scheduler.suspended:
+            return
+        for index, seconds in scheduler.get_suspended_times().items():
+            if self.sched_tree.exists(index):
+                minutes, seconds = divmod(int(seconds), 60)
+                status = f"{util.STATUS_SUSPENDED} {minutes}:{seconds:02d}"
+                if self.sched_tree.set(index, "Status") != status:
+                    self.sched_tree.set(index, "Status", status)
 
     def on_exit_signal(self, signum, frame):
         self.stop_script()
@@ -673,11 +1173,28 @@ class ScriptRunnerInteractions(ScriptRunnerRendering):
 
     def on_exit(self):
         self.shutdown_flag = True
-        if self.process and self.process.poll() is None:
-            try:
-                self.process.terminate()
-            except Exception:
-                pass
+        if self.scan_job is not None:
+            self.scan_job.cancel()
+        util.save_argument_cache()
+        introspection = sys.modules.get("scriptrunner.lib.introspection")
+        if introspection is not None:
+            introspection.save_introspection_cache()
+            introspection.shutdown()
+        self.script_scanner.shutdown()
+        if self.folder_watcher is not None:
+            self.folder_watcher.close()
+        runners = [runner for runner in (self.scheduler, self.direct_runner)
+                   if runner is not None]
+        if self.server_address is not None and self.scheduler is not None:
+            # Tasks submitted to the job server carry on
+            runners.remove(self.scheduler)
+        for runner in runners:
+            runner.stop()
+        # Don't leave orphaned script processes behind
+        for runner in runners:
+            runner.wait_stopped()
+        if self.executor is not None:
+            self.executor.close()
         print("\n************")
         print("Exit the app")
         print("************\n")
@@ -0,0 +1,429 @@
+import os
+import json
+import queue
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import scriptrunner.lib.utilities as util
+
+# Source of the helper run with "<interpreter> -c". It must be standalone
+# (the target environment may not have scriptrunner installed) and work on
+# old Python 3 versions. Requests and results are JSON lines on the
+# original stdin/stdout; everything the scripts print goes to devnull.
+HELPER_SOURCE = r'''
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+
+ACTION_NAMES = {
+    "_StoreAction": "store", "_StoreConstAction": "store_const",
+    "_StoreTrueAction": "store_true", "_StoreFalseAction": "store_false",
+    "_AppendAction": "append", "_AppendConstAction": "append_const",
+    "_CountAction": "count", "_ExtendAction": "extend",
+    "BooleanOptionalAction": "boolean_optional"}
+SKIPPED_ACTIONS = ("_HelpAction", "_VersionAction", "_SubParsersAction")
+
+
+class Captured(BaseException):
+    def __init__(self, parser):
+        BaseException.__init__(self)
+        self.parser = parser
+
+
+def capture(self, *args, **kwargs):
+    raise Captured(self)
+
+
+def jsonable(value):
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def describe(parser):
+    actions = []
+    for action in parser._actions:
+        kind = type(action).__name__
+        if kind in SKIPPED_ACTIONS:
+            continue
+        default = action.default
+        if default is argparse.SUPPRESS:
+            default = None
+        help_text = action.help
+        if not isinstance(help_text, str) or help_text == argparse.SUPPRESS:
+            help_text = ""
+        choices = action.choices
+        if choices is not None:
+            choices = [jsonable(c) for c in choices]
+        actions.append({
+            "option_strings": list(action.option_strings),
+            "dest": action.dest, "help": help_text,
+            "type": getattr(action.type, "__name__", None),
+            "required": bool(action.required), "default": jsonable(default),
+            "choices": choices, "nargs": jsonable(action.nargs),
+            "action": ACTION_NAMES.get(kind, kind)})
+    return actions
+
+
+def introspect(path):
+    argparse.ArgumentParser.parse_known_args = capture
+    if hasattr(argparse.ArgumentParser, "parse_known_intermixed_args"):
+        argparse.ArgumentParser.parse_known_intermixed_args = capture
+    folder = os.path.dirname(path)
+    sys.argv = [path]
+    sys.path.insert(0, folder)
+    os.chdir(folder or ".")
+    try:
+        runpy.run_path(path, run_name="__main__")
+    except Captured as e:
+        return {"ok": True, "found": True, "actions": describe(e.parser)}
+    except SystemExit:
+        pass
+    except BaseException as e:
+        return {"ok": False, "error": "%s: %s" % (type(e).__name__, e)}
+    return {"ok": True, "found": False, "actions": []}
+
+
+def run_forked(path, timeout):
+    import select
+    import signal
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            try:
+                import resource
+                limit = int(timeout) + 1
+                resource.setrlimit(resource.RLIMIT_CPU, (limit, limit + 1))
+            except Exception:
+                pass
+            result = introspect(path)
+            data = json.dumps(result).encode()
+        except BaseException as e:
+            data = json.dumps({"ok": False, "error": repr(e)}).encode()
+        try:
+            while data:
+                data = data[os.write(write_fd, data):]
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    chunks = []
+    deadline = time.time() + timeout
+    timed_out = False
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            timed_out = True
+            break
+        ready = select.select([read_fd], [], [], remaining)[0]
+        if ready:
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    os.close(read_fd)
+    if timed_out:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    os.waitpid(pid, 0)
+    if timed_out:
+        return {"ok": False, "error": "timed out after %ss" % timeout}
+    try:
+        return json.loads(b"".join(chunks).decode())
+    except ValueError:
+        return {"ok": False, "error": "helper child exited without result"}
+
+
+def run_inline(path):
+    # Without fork the request timeout can't be enforced here: a script
+    # that hangs blocks the helper until the client gives up waiting and
+    # kills it (see HelperProcess.request)
+    modules = set(sys.modules)
+    sys_path = list(sys.path)
+    cwd = os.getcwd()
+    try:
+        return introspect(path)
+    finally:
+        for name in set(sys.modules) - modules:
+            del sys.modules[name]
+        sys.path[:] = sys_path
+        os.chdir(cwd)
+
+
+def main():
+    requests = os.fdopen(os.dup(0), "r")
+    results = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    results.write(json.dumps({"ready": True}) + "\n")
+    results.flush()
+    for line in requests:
+        try:
+            request = json.loads(line)
+            path = os.path.abspath(request["path"])
+            timeout = float(request.get("timeout", 30))
+            if hasattr(os, "fork"):
+                result = run_forked(path, timeout)
+            else:
+                result = run_inline(path)
+        except Exception as e:
+            result = {"ok": False, "error": repr(e)}
+        results.write(json.dumps(result) + "\n")
+        results.flush()
+
+
+main()
+'''
+
+# Extra seconds the client waits on top of a request timeout
+TIMEOUT_GRACE = 5.0
+
+
+# ==============================================================================
+#                          Argparse Introspection
+# ==============================================================================
+
+
+class HelperProcess:
+    """
+    A long-lived helper interpreter answering introspection requests.
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.ready = False
+        self.process = subprocess.Popen(
+            [interpreter, "-c", HELPER_SOURCE], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            bufsize=1)
+        self.lines = queue.Queue()
+        self.reader = threading.Thread(target=self._read_lines, daemon=True)
+        self.reader.start()
+
+    def _read_lines(self):
+        for line in self.process.stdout:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def _read_result(self, timeout):
+        try:
+            line = self.lines.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("introspection helper did not answer")
+        if line is None:
+            raise OSError("introspection helper exited")
+        return json.loads(line)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def request(self, script_path, timeout):
+        """
+        Introspect a script, which the helper stops after timeout seconds.
+        Raises TimeoutError if no answer came TIMEOUT_GRACE seconds later
+        (e.g. a helper without fork, which runs scripts inline): the pool
+        then kills the helper and replaces it.
+        """
+        if not self.ready:
+            self._read_result(timeout + TIMEOUT_GRACE)
+            self.ready = True
+        data = json.dumps({"path": script_path, "timeout": timeout})
+        self.process.stdin.write(data + "\n")
+        self.process.stdin.flush()
+        return self._read_result(timeout + TIMEOUT_GRACE)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+        # The reader reaches the end of the output once the helper is gone,
+        # unless a process started by a script still holds the pipe
+        self.reader.join(1.0)
+        if not self.reader.is_alive():
+            self.process.stdout.close()
+
+
+class IntrospectionPool:
+    """
+    Pool of helper processes, reused per interpreter. A helper that timed
+    out or failed is discarded and replaced on demand.
+    """
+
+    def __init__(self, max_helpers=None, timeout=30.0):
+        self.max_helpers = max_helpers or min(4, os.cpu_count() or 1)
+        self.timeout = timeout
+        self.idle = {}
+        self.count = {}
+        self.condition = threading.Condition()
+
+    def _acquire(self, interpreter):
+        with self.condition:
+            while True:
+                idle = self.idle.setdefault(interpreter, [])
+                if idle:
+                    return idle.pop()
+                if self.count.get(interpreter, 0) < self.max_helpers:
+                    self.count[interpreter] = \
+                        self.count.get(interpreter, 0) + 1
+                    break
+                self.condition.wait()
+        try:
+            return HelperProcess(interpreter)
+        except Exception:
+            self._discard(interpreter, None)
+            raise
+
+    def _release(self, interpreter, helper):
+        with self.condition:
+            self.idle.setdefault(interpreter, []).append(helper)
+            self.condition.notify()
+
+    def _discard(self, interpreter, helper):
+        if helper is not None:
+            helper.close()
+        with self.condition:
+            self.count[interpreter] = self.count.get(interpreter, 1) - 1
+            self.condition.notify()
+
+    def introspect(self, script_path, interpreter):
+        """
+        Run a script in a helper of the given interpreter up to its first
+        parse_args call and return the result dict (ok, found, actions or
+        error).
+        """
+        helper = self._acquire(interpreter)
+        try:
+            result = helper.request(os.path.abspath(script_path),
+                                    self.timeout)
+        except Exception as e:
+            self._discard(interpreter, helper)
+            return {"ok": False, "error": str(e)}
+        if helper.alive():
+            self._release(interpreter, helper)
+        else:
+            self._discard(interpreter, None)
+        return result
+
+    def shutdown(self):
+        """
+        Close the idle helpers. Helpers still running an introspection stay
+        counted and are handed back to the pool when they finish.
+        """
+        with self.condition:
+            helpers = []
+            for interpreter, idle in self.idle.items():
+                self.count[interpreter] = \
+                    self.count.get(interpreter, 0) - len(idle)
+                helpers.extend(idle)
+            self.idle = {}
+        for helper in helpers:
+            helper.close()
+
+
+def spec_from_actions(actions):
+    """
+    Convert the argparse actions reported by a helper into a ScriptSpec.
+    """
+    arguments = []
+    for action in actions:
+        option_strings = action["option_strings"]
+        raw_flag = option_strings[0] if option_strings else action["dest"]
+        kind = action["action"]
+        arg_type = util.TYPE_MAP.get(action["type"], str)
+        if kind in ("store_true", "store_false"):
+            arg_type = bool
+        arguments.append(util.ArgumentSpec(
+            raw_flag, raw_flag.lstrip("-"), action["help"] or "", arg_type,
+            action["required"], action["default"], action["dest"],
+            action["choices"], action["nargs"], kind))
+    return util.ScriptSpec(arguments, True)
+
+
+INTROSPECTION_CACHE = util.ScriptArgumentCache(
+    util.get_cache_path("script_introspect_cache.json"))
+INTROSPECTION_POOL = IntrospectionPool()
+
+
+def get_cached_spec(script_path, interpreter):
+    """
+    Return the cached introspected ScriptSpec of a script if it is still
+    up to date, else None. Never runs the script.
+    """
+    return INTROSPECTION_CACHE.lookup(script_path, interpreter)
+
+
+def get_script_spec(script_path, interpreter):
+    """
+    Get the ScriptSpec of a script by introspecting its real parser with the
+    given interpreter. Results are cached per interpreter by size/mtime and
+    content hash. If introspection fails, or the script never calls
+    parse_args, the static (AST) spec is used and cached instead.
+    """
+    spec = INTROSPECTION_CACHE.lookup(script_path, interpreter)
+    if spec is not None:
+        return spec
+    try:
+        with open(script_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            data = f.read()
+    except OSError as e:
+        print(f"Error reading {script_path}: {e}")
+        return util.ScriptSpec()
+    digest = hashlib.sha1(data).hexdigest()
+    scanned = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+               "digest": digest, "spec": None}
+    if digest == INTROSPECTION_CACHE.known_digest(script_path, interpreter):
+        spec = INTROSPECTION_CACHE.store(script_path, scanned, interpreter)
+        if spec is not None:
+            return spec
+    static_spec = util.get_script_arguments(script_path)
+    if not static_spec.has_argparse:
+        # Never execute scripts without any add_argument call
+        spec = static_spec
+    else:
+        result = INTROSPECTION_POOL.introspect(script_path, interpreter)
+        if result.get("ok") and result.get("found"):
+            spec = spec_from_actions(result["actions"])
+        else:
+            if not result.get("ok"):
+                print(f"Introspection of {script_path} failed: "
+                      f"{result.get('error')}")
+            spec = static_spec
+    scanned["spec"] = spec
+    return INTROSPECTION_CACHE.store(script_path, scanned, interpreter)
+
+
+def introspect_scripts(script_paths, interpreter, cancel_event=None):
+    """
+    Warm the introspection cache for many scripts, using every helper of
+    the pool in parallel.
+    """
+    def introspect(path):
+        if cancel_event is None or not cancel_event.is_set():
+            get_script_spec(path, interpreter)
+
+    with ThreadPoolExecutor(INTROSPECTION_POOL.max_helpers) as executor:
+        list(executor.map(introspect, script_paths))
+    INTROSPECTION_CACHE.save()
+
+
+def save_introspection_cache():
+    INTROSPECTION_CACHE.save()
+
+
+def shutdown():
+    INTROSPECTION_POOL.shutdown()
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import threading
+import scriptrunner.lib.utilities as util
+
+JOURNAL_FILE = "queue_journal.jsonl"
+
+
+# ==============================================================================
+#                          Queue Journal
+# ==============================================================================
+
+
+def get_journal_path():
+    """
+    Path to the queue journal, next to the config file.
+    """
+    return util.get_cache_path(JOURNAL_FILE)
+
+
+class QueueJournal:
+    """
+    Append-only journal of a queue run, one JSON record per line, used to
+    resume the queue after a crash (see read_journal).
+
+    Records are written and flushed to the OS at once, so they survive a
+    crash of the program. They are fsync'ed in batches by a background
+    thread, at most sync_interval seconds after being written, so they also
+    survive a crash of the machine without an fsync per record.
+    """
+
+    def __init__(self, path=None, sync_interval=1.0):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.file = None
+        self.pending = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def open(self):
+        """Start a new journal, replacing the previous one."""
+        if self.path is None:
+            self.path = get_journal_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                    exist_ok=True)
+        self.file = open(self.path, "w")
+        self.pending = False
+        self.thread = threading.Thread(target=self.sync_loop, daemon=True)
+        self.thread.start()
+
+    def append(self, event, **data):
+        """Write a record {"event": event, "time": ..., **data}."""
+        line = json.dumps(dict(event=event, time=round(time.time(), 3),
+                               **data))
+        with self.condition:
+            if self.file is None:
+                return
+            self.file.write(line + "\n")
+            self.file.flush()
+            self.pending = True
+            self.condition.notify_all()
+
+    def sync_loop(self):
+        while True:
+            with self.condition:
+                while self.file is not None and not self.pending:
+                    self.condition.wait()
+                # Batch the records written within sync_interval
+                deadline = time.monotonic() + self.sync_interval
+                while self.file is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.file is None:
+                    return
+                self.pending = False
+                fileno = self.file.fileno()
+            # Outside the lock, so that append() doesn't wait for the disk.
+            # close() joins this thread before closing the file.
+            os.fsync(fileno)
+
+    def close(self):
+        """Sync and close the journal."""
+        with self.condition:
+            file, self.file = self.file, None
+            self.condition.notify_all()
+        if file is None:
+            return
+        self.thread.join()
+        os.fsync(file.fileno())
+        file.close()
+
+    def discard(self):
+        """Close and delete the journal."""
+        self.close()
+        try:
+            os.remove(self.path or get_journal_path())
+        except OSError:
+            pass
+
+
+def read_journal(path=None):
+    """
+    Read the journal of a queue run that didn't finish (the program or
+    machine crashed), to resume it. A torn last record is ignored.
+
+    Returns
+    -------
+    dict or None
+        {"tasks", "folder", "interpreter", "queue_iterations",
+        "max_concurrent", "total_cores", "total_memory", "iteration"} where
+        tasks hold the progress of the interrupted queue iteration
+        ('status', 'runs_done', 'points_done'), to pass to a Scheduler with
+        start_iteration=iteration. None if there is no journal or its queue
+        run finished.
+    """
+    try:
+        with open(path or get_journal_path(), "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    state = None
+    for line in lines:
+        try:
+            record = json.loads(line)
+            event = record["event"]
+        except (ValueError, KeyError, TypeError):
+            continue
+        if event == "queue":
+            state = {key: record.get(key) for key in (
+                "folder", "interpreter", "queue_iterations", "max_concurrent",
+                "total_cores", "total_memory")}
+            state["tasks"] = []
+            state["iteration"] = record.get("iteration", 0)
+        elif state is None:
+            continue
+        elif event == "enqueued":
+            state["tasks"].append(record["task"])
+        elif event == "end":
+            return None
+        elif event == "pass":
+            state["iteration"] = record["iteration"]
+            for task in state["tasks"]:
+                task['status'] = util.STATUS_PENDING
+                task.pop('runs_done', None)
+                task.pop('points_done', None)
+        else:
+            try:
+                task = state["tasks"][record["task"]]
+            except (KeyError, IndexError, TypeError):
+                continue
+            if event == "run_done":
+                task['runs_done'] = record["run"] + 1
+                task.pop('points_done', None)
+            elif event == "point_done":
+                task.setdefault('points_done', []).append(record["point"])
+            elif event == "finished":
+                task['status'] = record["status"]
+                task.pop('runs_done', None)
+                task.pop('points_done', None)
+    if state is None or not state["tasks"]:
+        return None
+    # Failed and skipped tasks are tried again, like when re-running a queue
+    for task in state["tasks"]:
+        if task['status'] != util.STATUS_DONE:
+            task['status'] = util.STATUS_PENDING
+    if all(task['status'] == util.STATUS_DONE for task in state["tasks"]):
+        # Stopped between two queue iterations
+        state["iteration"] += 1
+        if state["iteration"] >= (state["queue_iterations"] or 1):
+            return None
+        for task in state["tasks"]:
+            task['status'] = util.STATUS_PENDING
+    return state
@@ -0,0 +1,172 @@
+import os
+import time
+import signal
+import subprocess
+
+# Seconds to wait after SIGINT, then after SIGTERM, before escalating
+STOP_GRACE_PERIODS = (3.0, 3.0)
+# Seconds to wait for the processes to go after SIGKILL
+KILL_WAIT = 2.0
+
+
+# ==============================================================================
+#                          Process Groups
+# ==============================================================================
+
+
+def popen_in_group(command, **kwargs):
+    """
+    Start a command with subprocess.Popen in its own session (a new
+    process group on Windows), so that it and every process it spawns can
+    be stopped together with stop_process_group.
+    """
+    if os.name == "nt":
+        kwargs["creationflags"] = (kwargs.get("creationflags", 0)
+                                   | subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen(command, **kwargs)
+
+
+def get_session_pids(session_id):
+    """
+    PIDs of the live (not zombie) processes of a session, read from /proc.
+    Returns None if /proc is not available.
+    """
+    try:
+        names = os.listdir("/proc")
+    except OSError:
+        return None
+    pids = []
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Fields after the command name, which may contain spaces:
+        # state, ppid, pgrp, session, ...
+        fields = stat[stat.rindex(")") + 2:].split()
+        if int(fields[3]) == session_id and fields[0] not in ("Z", "X"):
+            pids.append(int(name))
+    return pids
+
+
+def group_is_alive(process, pids):
+    if pids is not None:
+        return bool(pids)
+    try:
+        os.killpg(process.pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def signal_group(process, signum, pids):
+    # Processes that started their own group within the session are only
+    # reached by their PIDs
+    for pid in pids or ():
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+    try:
+        os.killpg(process.pid, signum)
+    except OSError:
+        pass
+
+
+def stop_process_group(process, grace_periods=STOP_GRACE_PERIODS):
+    """
+    Stop a process started with popen_in_group and all its descendants:
+    send SIGINT to the whole session, then SIGTERM and finally SIGKILL,
+    each after its grace period if processes remain.
+
+    Returns
+    -------
+    pids : list of int
+        The processes of the session seen while stopping it and confirmed
+        gone at the end. Those that survived SIGKILL are left out.
+    signal_name : str or None
+        The last signal sent, None if nothing was running.
+    """
+    if os.name == "nt":
+        return stop_windows_process(process, grace_periods)
+    seen = set()
+    signal_name = None
+    steps = ((signal.SIGINT, grace_periods[0]),
+             (signal.SIGTERM, grace_periods[1]),
+             (signal.SIGKILL, KILL_WAIT))
+    for signum, grace in steps:
+        pids = get_session_pids(process.pid)
+        seen.update(pids or ())
+        if not group_is_alive(process, pids):
+            break
+        signal_group(process, signum, pids)
+        # Suspended processes only get the signal once continued
+        signal_group(process, signal.SIGCONT, pids)
+        signal_name = signum.name
+        # The processes are not all our children, they can't be waited on
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            pids = get_session_pids(process.pid)
+            seen.update(pids or ())
+            if not group_is_alive(process, pids):
+                break
+    remaining = get_session_pids(process.pid)
+    if remaining is None:
+        # Without /proc, only the process itself is known
+        if signal_name is None or group_is_alive(process, None):
+            return [], signal_name
+        return [process.pid], signal_name
+    return sorted(seen.difference(remaining)), signal_name
+
+
+def suspend_process_group(process):
+    """
+    Freeze a process started with popen_in_group and all its descendants
+    with SIGSTOP. Returns False if not supported (Windows).
+    """
+    if os.name == "nt":
+        return False
+    signal_group(process, signal.SIGSTOP, get_session_pids(process.pid))
+    return True
+
+
+def resume_process_group(process):
+    """
+    Thaw a process group frozen by suspend_process_group with SIGCONT.
+    """
+    if os.name != "nt":
+        signal_group(process, signal.SIGCONT, get_session_pids(process.pid))
+
+
+def stop_windows_process(process, grace_periods=STOP_GRACE_PERIODS):
+    # CTRL_BREAK_EVENT reaches the whole process group, taskkill /T the
+    # whole process tree
+    if process.poll() is not None:
+        return [], None
+    steps = ((signal.CTRL_BREAK_EVENT, "CTRL_BREAK_EVENT", grace_periods[0]),
+             (None, "taskkill", KILL_WAIT))
+    signal_name = None
+    for signum, name, grace in steps:
+        try:
+            if signum is None:
+                subprocess.run(["taskkill", "/T", "/F", "/PID",
+                                str(process.pid)], capture_output=True)
+            else:
+                process.send_signal(signum)
+        except OSError:
+            pass
+        signal_name = name
+        try:
+            process.wait(grace)
+            break
+        except subprocess.TimeoutExpired:
+            continue
+    if process.poll() is None:
+        return [], signal_name
+    return [process.pid], signal_name
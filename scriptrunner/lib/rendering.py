@@ -1,26 +1,13 @@
 import os
 import time
 import queue
-import threading
 import tkinter as tk
 from pathlib import Path
 import importlib.resources
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk
 import tkinter.font as tkFont
 import scriptrunner.lib.utilities as util
 
-try:
-    from idlelib.colorizer import ColorDelegator
-    from idlelib.percolator import Percolator
-except ImportError:
-    ColorDelegator = None
-    Percolator = None
-
-
-# ==============================================================================
-#                           Editor Panel
-# ==============================================================================
-
 
 def get_icon_path():
     with importlib.resources.path("scriptrunner.assets",
@@ -28,244 +15,12 @@ def get_icon_path():
         return str(icon)
 
 
-class EditorPanel(ttk.Frame):
-
-    def __init__(self, parent, file_path, refresh_callback, close_callback):
-        super().__init__(parent)
-        self.file_path = file_path
-        self.filename = os.path.basename(file_path)
-        self.directory = os.path.dirname(file_path)
-        self.refresh_callback = refresh_callback
-        self.close_callback = close_callback
-        # Toolbar
-        toolbar = ttk.Frame(self, padding=2)
-        toolbar.pack(side=tk.TOP, fill=tk.X)
-        self.btn_edit = ttk.Button(toolbar, text="Edit",
-                                   command=self.enable_editing,
-                                   style="Small.TButton")
-        self.btn_edit.pack(side=tk.LEFT, padx=2)
-        self.btn_save = ttk.Button(toolbar, text="Save (Ctrl+S)",
-                                   command=self.save_file, state=tk.DISABLED,
-                                   style="Small.TButton")
-        self.btn_save.pack(side=tk.LEFT, padx=2)
-
-        ttk.Separator(toolbar, orient="vertical").pack(side=tk.LEFT, fill=tk.Y,
-                                                       padx=5)
-
-        ttk.Label(toolbar, text="Name:",
-                  font=(util.FONT_FAMILY, 8)).pack(side=tk.LEFT, padx=2)
-        self.entry_new_name = ttk.Entry(toolbar,
-                                        width=12, font=(util.FONT_FAMILY, 9))
-        self.entry_new_name.pack(side=tk.LEFT, padx=2)
-
-        self.btn_copy = ttk.Button(toolbar, text="Copy", command=self.copy_file,
-                                   style="Small.TButton")
-        self.btn_copy.pack(side=tk.LEFT, padx=2)
-
-        ttk.Separator(toolbar, orient="vertical").pack(side=tk.LEFT, fill=tk.Y,
-                                                       padx=5)
-
-        self.btn_delete = ttk.Button(toolbar, text="Delete",
-                                     command=self.delete_file,
-                                     style="Small.TButton")
-        self.btn_delete.pack(side=tk.LEFT, padx=2)
-        # Close "X" Button
-        self.btn_close = ttk.Button(toolbar, text="X", width=2,
-                                    command=lambda: self.close_callback(self),
-                                    style="Small.TButton")
-        self.btn_close.pack(side=tk.RIGHT, padx=2)
-        self.lbl_info = ttk.Label(toolbar, text=self.filename,
-                                  foreground="blue",
-                                  font=(util.FONT_FAMILY, 9, "bold"))
-        self.lbl_info.pack(side=tk.RIGHT, padx=5)
-        # Main Content
-        content_frame = ttk.Frame(self)
-        content_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-        self.vsb = ttk.Scrollbar(content_frame, orient="vertical")
-        self.hsb = ttk.Scrollbar(content_frame, orient="horizontal")
-        # Line Numbers
-        self.line_numbers = tk.Text(content_frame, width=4, padx=4, takefocus=0,
-                                    border=0, background=util.LINE_NUM_BG,
-                                    foreground=util.LINE_NUM_FG,
-                                    state='disabled',
-                                    font=("Consolas", util.CODE_FONT_SIZE))
-        self.line_numbers.pack(side=tk.LEFT, fill=tk.Y)
-        # Text Area
-        self.text_area = tk.Text(content_frame, wrap="none",
-                                 font=("Consolas", util.CODE_FONT_SIZE),
-                                 undo=True, yscrollcommand=self.vsb.set,
-                                 xscrollcommand=self.hsb.set)
-        self.text_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        # Configure Scrollbars
-        self.vsb.config(command=self._on_vsb_scroll)
-        self.hsb.config(command=self.text_area.xview)
-        self.vsb.pack(side=tk.RIGHT, fill=tk.Y)
-        self.hsb.pack(side=tk.BOTTOM, fill=tk.X)
-        # Events
-        self.text_area.bind("<Configure>", lambda e: self.after_idle(
-            self._update_line_numbers))
-        self.text_area.bind("<KeyPress>", lambda e: self.after_idle(
-            self._update_line_numbers))
-        self.text_area.bind("<Button-1>", lambda e: self.after_idle(
-            self._update_line_numbers))
-        self.text_area.bind("<MouseWheel>", lambda e: self.after_idle(
-            self._update_line_numbers))
-        self.text_area.bind("<Control-s>", self.save_file)
-        # Syntax Highlighting
-        if ColorDelegator and Percolator:
-            self.percolator = Percolator(self.text_area)
-            self.color_delegator = ColorDelegator()
-            self.percolator.insertfilter(self.color_delegator)
-
-        self.load_content()
-
-    def _on_vsb_scroll(self, *args):
-        self.text_area.yview(*args)
-        self.line_numbers.yview(*args)
-
-    def _update_line_numbers(self, event=None):
-        lines = int(self.text_area.index('end-1c').split('.')[0])
-        line_content = "\n".join(str(i) for i in range(1, lines + 1))
-        self.line_numbers.config(state='normal')
-        self.line_numbers.delete('1.0', tk.END)
-        self.line_numbers.insert('1.0', line_content)
-        self.line_numbers.config(state='disabled')
-        self.line_numbers.yview_moveto(self.text_area.yview()[0])
-
-    def load_content(self):
-        self.text_area.config(state=tk.NORMAL)
-        self.text_area.delete('1.0', tk.END)
-        try:
-            with open(self.file_path, 'r') as f:
-                content = f.read()
-            self.text_area.insert('1.0', content)
-        except Exception as e:
-            self.text_area.insert('1.0', f"# Error: {e}")
-
-        self.after_idle(self._update_line_numbers)
-        self.text_area.config(state=tk.DISABLED)
-        self.reset_buttons()
-
-    def reset_buttons(self):
-        self.btn_edit.config(state=tk.NORMAL)
-        self.btn_save.config(state=tk.DISABLED)
-        self.btn_copy.config(state=tk.NORMAL)
-        self.btn_delete.config(state=tk.NORMAL)
-
-    def enable_editing(self):
-        self.text_area.config(state=tk.NORMAL)
-        self.btn_edit.config(state=tk.DISABLED)
-        self.btn_save.config(state=tk.NORMAL)
-        self.text_area.focus_set()
-
-    def save_file(self, event=None):
-        if str(self.btn_save['state']) == 'disabled':
-            return
-        content = self.text_area.get('1.0', 'end-1c')
-        try:
-            with open(self.file_path, 'w') as f:
-                f.write(content)
-            messagebox.showinfo("Success", "File saved.", parent=self)
-            if self.refresh_callback:
-                self.refresh_callback()
-        except Exception as e:
-            messagebox.showerror("Error", str(e), parent=self)
-
-    def copy_file(self):
-        new_name = self.entry_new_name.get().strip()
-        if not new_name:
-            base, ext = os.path.splitext(self.filename)
-            c = 1
-            while True:
-                cand = f"{base}_copy_{c}{ext}"
-                if not os.path.exists(os.path.join(self.directory, cand)):
-                    new_name = cand
-                    break
-                c += 1
-        else:
-            if not new_name.endswith(".py"):
-                new_name += ".py"
-        new_path = os.path.join(self.directory, new_name)
-        if os.path.exists(new_path):
-            messagebox.showerror("Error", "File exists.", parent=self)
-            return
-        try:
-            content = self.text_area.get('1.0', 'end-1c')
-            with open(new_path, 'w') as f:
-                f.write(content)
-            if self.refresh_callback:
-                self.refresh_callback()
-            # Reload this pane
-            self.file_path = new_path
-            self.filename = new_name
-            self.directory = os.path.dirname(new_path)
-            self.lbl_info.config(text=self.filename)
-            self.entry_new_name.delete(0, tk.END)
-            messagebox.showinfo("Success", f"Copied to {new_name}", parent=self)
-        except Exception as e:
-            messagebox.showerror("Error", str(e), parent=self)
-
-    def delete_file(self):
-        if messagebox.askyesno("Confirm", f"Delete '{self.filename}'?",
-                               parent=self):
-            try:
-                os.remove(self.file_path)
-                if self.refresh_callback:
-                    self.refresh_callback()
-                self.close_callback(self)
-            except Exception as e:
-                messagebox.showerror("Error", str(e), parent=self)
-
-
-# ==============================================================================
-#                          Code Editor Manager Window
-# ==============================================================================
-
-class CodeEditorWindow(tk.Toplevel):
-    def __init__(self, parent, refresh_callback):
-        super().__init__(parent)
-        self.refresh_callback = refresh_callback
-        self.title("Script Editor")
-
-        self.screen_width = self.winfo_screenwidth()
-        self.screen_height = self.winfo_screenheight()
-        width = int(self.screen_width * util.TEXT_WIN_RATIO)
-        height = int(self.screen_height * util.TEXT_WIN_RATIO)
-        x = (self.screen_width - width) // 2
-        y = (self.screen_height - height) // 2
-        self.geometry(f"{width}x{height}+{x}+{y}")
-        self.paned = ttk.PanedWindow(self, orient=tk.HORIZONTAL)
-        self.paned.pack(fill=tk.BOTH, expand=True)
-        self.panes = []
-        self.lift_window()
-
-    def add_file(self, file_path):
-        # Check existing
-        for pane in self.panes:
-            if pane.file_path == file_path:
-                return
-        # Split View Logic
-        if len(self.panes) >= 2:
-            old_pane = self.panes.pop()
-            old_pane.destroy()
-        new_pane = EditorPanel(self.paned, file_path, self.refresh_callback,
-                               self.close_pane)
-        self.paned.add(new_pane, weight=1)
-        self.panes.append(new_pane)
-        self.lift_window()
-
-    def close_pane(self, pane_obj):
-        if pane_obj in self.panes:
-            self.panes.remove(pane_obj)
-            pane_obj.destroy()
-
-        if not self.panes:
-            self.destroy()
-
-    def lift_window(self):
-        self.deiconify()
-        self.lift()
-        self.focus_force()
+def __getattr__(name):
+    # The editor (and idlelib) is only imported when first used
+    if name in ("EditorPanel", "CodeEditorWindow"):
+        from scriptrunner.lib import editor
+        return getattr(editor, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ==============================================================================
@@ -275,7 +30,8 @@ class CodeEditorWindow(tk.Toplevel):
 
 class ScriptRunnerRendering(tk.Tk):
     def __init__(self, initial_folder):
-        super().__init__()
+        with util.STARTUP_PROFILE.section("Tk init"):
+            super().__init__()
 
         self.screen_width = self.winfo_screenwidth()
         self.screen_height = self.winfo_screenheight()
@@ -295,16 +51,35 @@ class ScriptRunnerRendering(tk.Tk):
         self.log_to_file_var = tk.BooleanVar(value=False)
         self.log_file_path_var = tk.StringVar(value="")
         self.show_all_var = tk.BooleanVar(value=False)
+        self.recursive_var = tk.BooleanVar(value=False)
+        self.introspect_var = tk.BooleanVar(value=False)
+        self.suspend_var = tk.BooleanVar(value=False)
+        self.preempt_var = tk.StringVar(value="off")
 
-        self.process = None
+        self.scheduler = None
+        self.direct_runner = None
         self.msg_queue = queue.Queue()
         self.shutdown_flag = False
 
         self.script_inputs = {}
+        self.listed_scripts = []
+        self.scan_id = 0
+        self.scan_job = None
+        self.scan_results = 0
+        # A refresh asked for while a scan runs, done once it finished
+        self.refresh_pending = False
+        # Scripts being introspected in the background for the GUI
+        self.introspecting = set()
         self.current_script = None
         self.entries = {}
         self.entry_sched_index = None
         self.entry_sched_iter = None
+        self.entry_sched_after = None
+        self.entry_sched_cores = None
+        self.entry_sched_memory = None
+        self.entry_sched_priority = None
+        self.sched_sweep_var = tk.StringVar(value="no")
+        self.sched_option_entries = {}
 
         self.scheduled_tasks = []
         self.scheduler_entries = {}
@@ -314,12 +89,15 @@ class ScriptRunnerRendering(tk.Tk):
 
         self.sleep_duration_var = tk.StringVar(value="5.0")
         self.sleep_position_var = tk.StringVar(value="-1")
-        self.task_output_complete = threading.Event()
 
         self.editor_window = None
-        self.setup_window()
-        self.setup_styles()
-        self.create_layout()
+        profile = util.STARTUP_PROFILE
+        with profile.section("setup_window"):
+            self.setup_window()
+        with profile.section("setup_styles"):
+            self.setup_styles()
+        with profile.section("create_layout"):
+            self.create_layout()
 
     def setup_window(self):
         width, height, x_offset, y_offset = self.define_window_geometry(
@@ -414,11 +192,15 @@ class ScriptRunnerRendering(tk.Tk):
                                             variable=self.show_all_var)
         self.chk_show_all.grid(row=0, column=2, padx=5, pady=5)
 
+        self.chk_recursive = ttk.Checkbutton(frame, text="Subfolders",
+                                             variable=self.recursive_var)
+        self.chk_recursive.grid(row=0, column=3, padx=5, pady=5)
+
         self.btn_select_base = ttk.Button(frame, text="Select base")
-        self.btn_select_base.grid(row=0, column=3, padx=5, pady=5)
+        self.btn_select_base.grid(row=0, column=4, padx=5, pady=5)
 
         self.btn_refresh_scripts = ttk.Button(frame, text="Refresh")
-        self.btn_refresh_scripts.grid(row=0, column=4, padx=(0, 5), pady=5)
+        self.btn_refresh_scripts.grid(row=0, column=5, padx=(0, 5), pady=5)
 
     def create_interpreter_bar(self):
         frame = ttk.Frame(self, padding=0, relief="groove", borderwidth=1)
@@ -439,6 +221,10 @@ class ScriptRunnerRendering(tk.Tk):
         self.btn_check_interpreter = ttk.Button(frame, text="Check")
         self.btn_check_interpreter.grid(row=0, column=3, padx=5, pady=5)
 
+        self.chk_introspect = ttk.Checkbutton(frame, text="Introspect",
+                                              variable=self.introspect_var)
+        self.chk_introspect.grid(row=0, column=4, padx=(0, 5), pady=5)
+
     def create_middle_panel(self):
         mid_pane = ttk.PanedWindow(self, orient=tk.HORIZONTAL)
         mid_pane.grid(row=2, column=0, sticky="nsew", padx=5, pady=5)
@@ -536,6 +322,21 @@ class ScriptRunnerRendering(tk.Tk):
         self.entry_queue_iter = ttk.Entry(col_queue, width=3)
         self.entry_queue_iter.insert(0, "1")
         self.entry_queue_iter.pack(side=tk.LEFT, padx=(0, 5), pady=5)
+        # Maximum number of script tasks running at once
+        ttk.Label(col_queue, text="Parallel:").pack(side=tk.LEFT, padx=(0, 2),
+                                                    pady=5)
+        self.entry_max_parallel = ttk.Entry(col_queue, width=3)
+        self.entry_max_parallel.insert(0, "1")
+        self.entry_max_parallel.pack(side=tk.LEFT, padx=(0, 5), pady=5)
+        # Node resources shared by the task reservations
+        ttk.Label(col_queue, text="Cores:").pack(side=tk.LEFT, padx=(0, 2),
+                                                 pady=5)
+        self.entry_total_cores = ttk.Entry(col_queue, width=4)
+        self.entry_total_cores.pack(side=tk.LEFT, padx=(0, 5), pady=5)
+        ttk.Label(col_queue, text="RAM (GB):").pack(side=tk.LEFT, padx=(0, 2),
+                                                    pady=5)
+        self.entry_total_memory = ttk.Entry(col_queue, width=5)
+        self.entry_total_memory.pack(side=tk.LEFT, padx=(0, 5), pady=5)
 
         self.btn_sched_run = ttk.Button(col_queue, text="Run queue")
         self.btn_sched_run.pack(side=tk.LEFT, padx=(0, 5), pady=5)
@@ -552,6 +353,17 @@ class ScriptRunnerRendering(tk.Tk):
                                          state=tk.DISABLED)
         self.btn_sched_stop.pack(side=tk.LEFT, padx=0, pady=5)
 
+        # Pause also freezes the running scripts (SIGSTOP)
+        self.chk_suspend = ttk.Checkbutton(col_queue, text="Freeze on pause",
+                                           variable=self.suspend_var)
+        self.chk_suspend.pack(side=tk.LEFT, padx=(5, 0), pady=5)
+        # Running tasks of lower priority make room for urgent ones
+        ttk.Label(col_queue, text="Preempt:").pack(side=tk.LEFT, padx=(5, 2),
+                                                   pady=5)
+        ttk.Combobox(col_queue, textvariable=self.preempt_var, width=8,
+                     values=("off", "suspend", "requeue"),
+                     state="readonly").pack(side=tk.LEFT, padx=0, pady=5)
+
         self.btn_sched_clear = ttk.Button(col_queue, text="Clear")
         self.btn_sched_clear.pack(side=tk.LEFT, padx=(15, 5), pady=5)
 
@@ -580,7 +392,7 @@ class ScriptRunnerRendering(tk.Tk):
 
         table_frame = ttk.Frame(sched_pane)
         sched_pane.add(table_frame, weight=2)
-        cols = ("ID", "Iter", "Name/Details", "Status")
+        cols = ("ID", "Iter", "Name/Details", "After", "Status")
         self.sched_tree = ttk.Treeview(table_frame, columns=cols,
                                        show="headings", selectmode="browse",
                                        height=5)
@@ -590,6 +402,7 @@ class ScriptRunnerRendering(tk.Tk):
         self.sched_tree.column("ID", width=30, stretch=False)
         self.sched_tree.column("Iter", width=40, stretch=False)
         self.sched_tree.column("Name/Details", width=250)
+        self.sched_tree.column("After", width=60, stretch=False)
         self.sched_tree.column("Status", width=70)
 
         sb_sched = ttk.Scrollbar(table_frame, orient="vertical",
@@ -682,6 +495,7 @@ class ScriptRunnerRendering(tk.Tk):
         initial_name = os.path.basename(
             initial_file) if initial_file else "script_runner_log.txt"
 
+        from tkinter import filedialog
         filepath = filedialog.asksaveasfilename(
             defaultextension=".txt",
             initialdir=initial_dir,
@@ -0,0 +1,1606 @@
+import os
+import re
+import json
+import math
+import time
+import uuid
+import heapq
+import threading
+import subprocess
+import scriptrunner.lib.utilities as util
+from scriptrunner.lib.processes import (popen_in_group, stop_process_group,
+                                        suspend_process_group,
+                                        resume_process_group,
+                                        STOP_GRACE_PERIODS)
+from scriptrunner.lib.triggers import (get_first_run, get_next_run,
+                                       is_recurring, format_clock)
+
+
+# ==============================================================================
+#                          Queue Execution
+# ==============================================================================
+
+
+# Environment variables limiting the threads of common numeric libraries,
+# set to the number of reserved cores unless already defined
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS",
+                   "OPENBLAS_NUM_THREADS")
+# How running tasks of lower priority make room for a ready task: frozen
+# until it fits again, or stopped and queued again
+PREEMPT_MODES = ("suspend", "requeue")
+
+
+def get_available_cores():
+    """
+    Ids of the CPU cores this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def get_total_memory():
+    """
+    Physical memory in GB, or None if unknown.
+    """
+    try:
+        return (os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+                / 1024 ** 3)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_task_resources(task):
+    """
+    Return the (cores, memory in GB) reserved by a task, 0 if not set.
+    """
+    try:
+        cores = max(int(task.get('cores') or 0), 0)
+    except (TypeError, ValueError):
+        cores = 0
+    try:
+        memory = max(float(task.get('memory') or 0), 0.0)
+    except (TypeError, ValueError):
+        memory = 0.0
+    return cores, memory
+
+
+def get_retry_policy(task):
+    """
+    Return the (timeout in s, retries, backoff in s, retry_codes) of a task.
+    timeout 0 means no timeout; an empty retry_codes means that any
+    non-zero exit code is retryable.
+    """
+    try:
+        timeout = max(float(task.get('timeout') or 0), 0.0)
+    except (TypeError, ValueError):
+        timeout = 0.0
+    try:
+        retries = max(int(task.get('retries') or 0), 0)
+    except (TypeError, ValueError):
+        retries = 0
+    try:
+        backoff = max(float(task.get('backoff', 1.0)), 0.0)
+    except (TypeError, ValueError):
+        backoff = 1.0
+    try:
+        retry_codes = [int(code) for code in task.get('retry_codes') or ()]
+    except (TypeError, ValueError):
+        retry_codes = []
+    return timeout, retries, backoff, retry_codes
+
+
+def get_task_priority(task):
+    """
+    Return the priority of a task, higher first, 0 if not set.
+    """
+    try:
+        return int(task.get('priority') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_exit_codes(text):
+    """
+    Parse exit codes such as "1, 75" or "1 75". Raises ValueError on
+    anything else.
+    """
+    return [int(item) for item in text.replace(",", " ").split()]
+
+
+def new_task_id():
+    return uuid.uuid4().hex[:12]
+
+
+def make_script_task(name, params=None, iterations=1, after=None,
+                     task_id=None, cores=0, memory=0.0, timeout=0, retries=0,
+                     backoff=1.0, retry_codes=None, priority=0):
+    return {'type': 'script', 'name': name, 'params': dict(params or {}),
+            'status': util.STATUS_PENDING, 'iterations': iterations,
+            'id': task_id or new_task_id(), 'after': list(after or []),
+            'cores': cores, 'memory': memory, 'timeout': timeout,
+            'retries': retries, 'backoff': backoff,
+            'retry_codes': list(retry_codes or []), 'priority': priority}
+
+
+def make_sleep_task(duration, after=None, task_id=None):
+    return {'type': 'sleep', 'name': 'Sleep',
+            'params': {'duration': float(duration)},
+            'status': util.STATUS_PENDING, 'iterations': 1,
+            'id': task_id or new_task_id(), 'after': list(after or [])}
+
+
+def make_sweep_task(name, params=None, mode="product", parallel=0,
+                    iterations=1, after=None, task_id=None, cores=0,
+                    memory=0.0, timeout=0, retries=0, backoff=1.0,
+                    retry_codes=None, priority=0):
+    task = make_script_task(name, params, iterations, after, task_id, cores,
+                            memory, timeout, retries, backoff, retry_codes,
+                            priority)
+    task.update(type='sweep', mode=mode, parallel=parallel)
+    return task
+
+
+# How the swept parameters of a sweep task are combined
+SWEEP_MODES = ("product", "zip")
+
+
+def parse_sweep_values(text):
+    """
+    Parse the values swept by a parameter: a list "[a, b, c]" or a range
+    "range(start, stop[, step])", with the stop value excluded as in
+    Python. Float ranges are allowed.
+
+    Returns
+    -------
+    (length, value_at) or None
+        Number of values and a function giving the value (str) at an
+        index. None if text is a single value.
+    """
+    text = str(text).strip()
+    if text.startswith("[") and text.endswith("]"):
+        if not text[1:-1].strip():
+            raise ValueError(f"Empty sweep list: {text}")
+        items = [item.strip().strip("'\"") for item in text[1:-1].split(",")]
+        return len(items), items.__getitem__
+    match = re.fullmatch(r"range\((.*)\)", text)
+    if match is None:
+        return None
+    numbers = [item.strip() for item in match.group(1).split(",")]
+    if not 1 <= len(numbers) <= 3:
+        raise ValueError(f"Invalid sweep range: {text}")
+    try:
+        values = range(*(int(n) for n in numbers))
+    except ValueError:
+        values = None
+    if values is not None:
+        if not values:
+            raise ValueError(f"Empty sweep range: {text}")
+        return len(values), lambda k: str(values[k])
+    try:
+        numbers = [float(n) for n in numbers]
+    except ValueError:
+        raise ValueError(f"Invalid sweep range: {text}") from None
+    if len(numbers) == 1:
+        numbers.insert(0, 0.0)
+    start, stop, step = (numbers + [1.0])[:3]
+    if step == 0:
+        raise ValueError(f"Sweep range step must not be zero: {text}")
+    length = max(math.ceil((stop - start) / step - 1e-9), 0)
+    if length == 0:
+        raise ValueError(f"Empty sweep range: {text}")
+    return length, lambda k: repr(round(start + k * step, 12))
+
+
+class ParameterSweep:
+    """
+    Points of a parameter sweep: the params of a sweep task where the
+    swept values (see parse_sweep_values) are replaced by one value each.
+    In "product" mode every combination of the swept values is a point,
+    the last parameter changing fastest; in "zip" mode the n-th point takes
+    the n-th value of each swept parameter. Points are computed on demand,
+    so a sweep of any size costs only its list of axes.
+    """
+
+    def __init__(self, params, mode="product"):
+        if mode not in SWEEP_MODES:
+            raise ValueError(f"Invalid sweep mode: {mode}")
+        self.params = dict(params)
+        self.mode = mode
+        self.axes = []
+        for name, value in self.params.items():
+            axis = parse_sweep_values(value)
+            if axis is not None:
+                self.axes.append((name,) + axis)
+        if not self.axes:
+            raise ValueError("No parameter to sweep, use e.g. '[1, 2, 3]' or "
+                             "'range(0, 100, 10)'")
+        lengths = [length for _, length, _ in self.axes]
+        if mode == "zip":
+            if len(set(lengths)) > 1:
+                raise ValueError(f"Zipped parameters have different numbers "
+                                 f"of values: {lengths}")
+            self.length = lengths[0]
+        else:
+            self.length = math.prod(lengths)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, number):
+        if not 0 <= number < self.length:
+            raise IndexError(number)
+        params = dict(self.params)
+        if self.mode == "zip":
+            for name, _, value_at in self.axes:
+                params[name] = value_at(number)
+        else:
+            for name, length, value_at in reversed(self.axes):
+                number, k = divmod(number, length)
+                params[name] = value_at(k)
+        return params
+
+    def __iter__(self):
+        return (self[number] for number in range(self.length))
+
+
+def parse_task_positions(text):
+    """
+    Parse task numbers (1-based positions) such as "2, 3" or "2 3".
+    Raises ValueError on anything else.
+    """
+    positions = []
+    for item in text.replace(",", " ").split():
+        position = int(item)
+        if position < 1:
+            raise ValueError(f"Invalid task number: {item}")
+        positions.append(position)
+    return positions
+
+
+def ids_to_positions(tasks, task_ids):
+    """
+    Convert task ids to the 1-based positions of those tasks in the queue.
+    Unknown ids are dropped.
+    """
+    position_of = {task.get('id'): i + 1 for i, task in enumerate(tasks)}
+    return [position_of[task_id] for task_id in task_ids
+            if task_id in position_of]
+
+
+def load_queue_file(file_path, defaults=None):
+    """
+    Load a queue file. It is either a JSON list of tasks or an object with
+    "tasks" and optional "folder" (relative to the file) and "iterations".
+    Tasks use the scheduler's dict format; "status" and "iterations" may be
+    omitted. Dependencies ("after") are given as task ids or as 1-based
+    task numbers. Script tasks may reserve "cores" and "memory" (GB) and
+    set a "timeout" (s), a retry policy ("retries", "backoff" in s,
+    "retry_codes") and a "priority". Sweep tasks take a "mode" and a
+    number of "parallel" points. Tasks may start "at" a time and recur
+    "every" interval or on a "cron" pattern (see triggers). defaults
+    gives the value of the options the tasks leave unset (see parse_tasks).
+
+    Returns
+    -------
+    tasks : list of dict
+    folder : str or None
+    iterations : int
+    """
+    with open(file_path, "r") as f:
+        data = json.load(f)
+    folder = None
+    iterations = 1
+    if isinstance(data, dict):
+        if data.get("folder"):
+            folder = os.path.join(os.path.dirname(os.path.abspath(file_path)),
+                                  os.path.expanduser(data["folder"]))
+        iterations = int(data.get("iterations", 1))
+        data = data.get("tasks", [])
+    if not isinstance(data, list):
+        raise ValueError(f"Invalid queue file: {file_path}")
+    return parse_tasks(data, defaults), folder, max(iterations, 1)
+
+
+def parse_tasks(items, defaults=None):
+    """
+    Build scheduler tasks from their JSON form, as in queue files (see
+    load_queue_file). Integer 'after' entries are 1-based numbers of tasks
+    in items. defaults ({option: value}, e.g. {"timeout": 60}) replaces
+    the default of each option an item leaves unset. Raises ValueError,
+    KeyError or TypeError if an item is invalid.
+    """
+    default = dict({"cores": 0, "memory": 0, "timeout": 0, "retries": 0,
+                    "backoff": 1.0, "retry_codes": [], "priority": 0},
+                   **(defaults or {}))
+    tasks = []
+    for item in items:
+        options = {"cores": int(item.get("cores", default["cores"])),
+                   "memory": float(item.get("memory", default["memory"])),
+                   "timeout": float(item.get("timeout", default["timeout"])),
+                   "retries": int(item.get("retries", default["retries"])),
+                   "backoff": float(item.get("backoff", default["backoff"])),
+                   "retry_codes": [int(code) for code in item.get(
+                       "retry_codes", default["retry_codes"])],
+                   "priority": int(item.get("priority",
+                                            default["priority"]))}
+        task_id = item.get("id")
+        task_id = None if task_id is None else str(task_id)
+        task_type = item.get("type", "script")
+        if task_type == "sleep":
+            task = make_sleep_task(item["params"]["duration"],
+                                   task_id=task_id)
+        elif task_type == "sweep":
+            task = make_sweep_task(item["name"], item.get("params"),
+                                   item.get("mode", "product"),
+                                   int(item.get("parallel", 0)),
+                                   max(int(item.get("iterations", 1)), 1),
+                                   task_id=task_id, **options)
+        else:
+            task = make_script_task(item["name"], item.get("params"),
+                                    max(int(item.get("iterations", 1)), 1),
+                                    task_id=task_id, **options)
+        task['after'] = item.get("after", [])
+        for key in ("at", "every", "cron"):
+            if item.get(key) not in (None, ""):
+                task[key] = item[key]
+        get_first_run(task, time.time())
+        tasks.append(task)
+    for task in tasks:
+        after = []
+        for dep in task['after']:
+            if isinstance(dep, int):
+                if not 1 <= dep <= len(tasks):
+                    raise ValueError(f"Invalid task number in 'after': {dep}")
+                after.append(tasks[dep - 1]['id'])
+            else:
+                after.append(str(dep))
+        task['after'] = after
+    return tasks
+
+
+class Scheduler:
+    """
+    Run a queue of scheduled tasks, without any GUI.
+
+    Tasks are the dicts built by make_script_task/make_sweep_task/
+    make_sleep_task, with script names relative to folder; their status is
+    updated in place. Up to max_concurrent scripts run at once, each task
+    in its own thread, by priority and within the total_cores and
+    total_memory reservations (see run_pass). Scripts run locally, or
+    through executor (AgentPool or BatchSystem) if given. If a journal
+    (QueueJournal) is given, the run is recorded in it to be resumed after
+    a crash (see run). Progress is reported to on_event (see emit).
+
+    run() and serve() block; pause(), suspend(), resume(), stop(), submit()
+    and cancel() can be called from any thread and take effect at once.
+    """
+
+    def __init__(self, tasks, folder, interpreter_path="", queue_iterations=1,
+                 introspect=False, on_event=None, max_concurrent=1,
+                 total_cores=None, total_memory=None, journal=None,
+                 start_iteration=0, grace_periods=STOP_GRACE_PERIODS,
+                 executor=None, preempt=None):
+        self.tasks = tasks
+        self.folder = folder
+        self.interpreter_path = interpreter_path
+        self.queue_iterations = max(int(queue_iterations), 1)
+        self.introspect = introspect
+        self.on_event = on_event
+        self.journal = journal
+        self.grace_periods = grace_periods
+        self.stop_threads = []
+        self.start_iteration = start_iteration
+        self.max_concurrent = max(int(max_concurrent), 1)
+        cores = get_available_cores()
+        if total_cores:
+            cores = cores[:max(int(total_cores), 1)]
+        self.total_cores = len(cores)
+        self.free_cores = cores
+        if total_memory:
+            self.total_memory = float(total_memory)
+        else:
+            self.total_memory = get_total_memory() or float("inf")
+        self.free_memory = self.total_memory
+        self.allocations = {}
+        self.processes = {}
+        self.active = 0
+        self.running_tasks = 0
+        self.completed = []
+        self.condition = threading.Condition()
+        self.emit_lock = threading.Lock()
+        self.running = False
+        self.serving = False
+        self.paused = False
+        self.stopped = False
+        # Tasks added by submit() and tasks cancelled by cancel(), for
+        # run_pass to pick up, and the tasks it has started
+        self.index_of = {task.get('id'): i for i, task in enumerate(tasks)}
+        self.submitted = []
+        self.cancelled = []
+        self.started_tasks = set()
+        # Set once the last pass ended: submit() refuses tasks
+        self.closed = False
+        # Time of the suspend() call, and {index: (time, status before)}
+        # of the suspended tasks
+        self.suspended_at = None
+        self.suspended = {}
+        # {index: (slots, time, status before)} of the tasks frozen by a
+        # preemption, and the tasks being stopped to be requeued
+        self.preempt = preempt
+        self.preempted = {}
+        self.requeued = set()
+        self.executor = executor
+        if executor is not None:
+            executor.on_change = self.on_executor_changed
+
+    def on_executor_changed(self, message):
+        # Capacity of the executor changed, e.g. an agent registered
+        if message:
+            self.emit("info", message)
+        with self.condition:
+            self.condition.notify_all()
+
+    def get_max_concurrent(self):
+        """Scripts that can run at once (see executor)."""
+        if self.executor is None:
+            return self.max_concurrent
+        return min(self.max_concurrent, self.executor.capacity())
+
+    def emit(self, kind, data):
+        """
+        Report progress by calling on_event(kind, data), serialized across
+        task threads:
+
+        - "status": (index, status)
+        - "start": (index, command), a script process is started
+        - "output": (index, line)
+        - "end": (index, command, returncode)
+        - "info" / "error": message
+        """
+        if self.on_event is not None:
+            with self.emit_lock:
+                self.on_event(kind, data)
+
+    def log(self, event, **data):
+        if self.journal is not None:
+            self.journal.append(event, **data)
+
+    def set_status(self, index, status):
+        self.tasks[index]['status'] = status
+        self.emit("status", (index, status))
+
+    def pause(self):
+        with self.condition:
+            self.paused = True
+            self.condition.notify_all()
+
+    def suspend(self):
+        """
+        Pause the queue and freeze the running scripts with SIGSTOP. Falls
+        back to pause() where it isn't supported (Windows).
+        """
+        if os.name == "nt":
+            self.emit("error", "Suspending processes is not supported on "
+                               "this platform, pausing the queue only")
+            self.pause()
+            return
+        with self.condition:
+            self.paused = True
+            if self.suspended_at is None:
+                self.suspended_at = time.monotonic()
+            for (index, _), process in self.processes.items():
+                if index not in self.preempted:
+                    self.suspend_process(index, process)
+            self.condition.notify_all()
+
+    def suspend_process(self, index, process):
+        # Called with the condition held
+        if self.executor is not None:
+            process.suspend()
+        else:
+            suspend_process_group(process)
+        if index not in self.suspended:
+            self.suspended[index] = (time.monotonic(),
+                                     self.tasks[index]['status'])
+            self.set_status(index, util.STATUS_SUSPENDED)
+            self.log("suspended", task=index)
+
+    def resume_process(self, process):
+        if self.executor is not None:
+            process.resume()
+        else:
+            resume_process_group(process)
+
+    def get_suspended_times(self):
+        """Seconds each suspended task has been suspended, {index: s}."""
+        with self.condition:
+            now = time.monotonic()
+            return {index: now - start
+                    for index, (start, _) in self.suspended.items()}
+
+    def resume(self):
+        """Resume the queue, and the scripts frozen by suspend()."""
+        with self.condition:
+            self.paused = False
+            if self.suspended_at is not None:
+                self.suspended_at = None
+                for (index, _), process in self.processes.items():
+                    if index not in self.preempted:
+                        self.resume_process(process)
+            suspended, self.suspended = self.suspended, {}
+            now = time.monotonic()
+            for index, (start, status) in sorted(suspended.items()):
+                self.set_status(index, status)
+                self.emit("info", f"Task {index + 1} resumed after "
+                                  f"{now - start:.1f} seconds suspended")
+                self.log("resumed", task=index,
+                         duration=round(now - start, 3))
+            self.condition.notify_all()
+
+    def stop(self):
+        """
+        Stop the queue and, in the background, every running script with
+        its descendants (see stop_process).
+        """
+        with self.condition:
+            self.stopped = True
+            self.suspended_at = None
+            self.suspended = {}
+            processes = list(self.processes.items())
+            self.condition.notify_all()
+        for (index, _), process in processes:
+            thread = threading.Thread(target=self.stop_process,
+                                      args=(index, process), daemon=True)
+            thread.start()
+            self.stop_threads.append(thread)
+
+    def submit(self, tasks):
+        """
+        Add tasks to the queue of serve() or run(). Their 'after' ids must
+        be of tasks already in the queue or in tasks. Returns their indexes,
+        None if the queue is closed (its run ended). Raises ValueError on an
+        unknown dependency or a duplicate id.
+        """
+        with self.condition:
+            if self.closed:
+                return None
+            ids = [task['id'] for task in tasks]
+            if len(set(ids)) != len(ids) or any(task_id in self.index_of
+                                                for task_id in ids):
+                raise ValueError("Duplicate task id")
+            for task in tasks:
+                for task_id in task.get('after', ()):
+                    if task_id not in self.index_of and task_id not in ids:
+                        raise ValueError(f"Unknown dependency {task_id}")
+            start = len(self.tasks)
+            for task in tasks:
+                self.index_of[task['id']] = len(self.tasks)
+                self.tasks.append(task)
+                self.log("enqueued", task=task)
+            indexes = list(range(start, len(self.tasks)))
+            self.submitted.extend(indexes)
+            self.condition.notify_all()
+        return indexes
+
+    def cancel(self, index):
+        """
+        Cancel task index: a pending task won't run, a running one is
+        stopped (see stop_process) and not retried. The tasks depending on
+        it are skipped. Returns False if the task is already finished.
+        """
+        with self.condition:
+            task = self.tasks[index]
+            if task.get('cancelled') or task['status'] in (
+                    util.STATUS_DONE, util.STATUS_FAILED,
+                    util.STATUS_SKIPPED, util.STATUS_CANCELLED):
+                return False
+            task['cancelled'] = True
+            if index not in self.started_tasks:
+                self.cancelled.append(index)
+            processes = [process for (i, _), process
+                         in self.processes.items() if i == index]
+            self.condition.notify_all()
+        for process in processes:
+            thread = threading.Thread(target=self.stop_process,
+                                      args=(index, process), daemon=True)
+            thread.start()
+            self.stop_threads.append(thread)
+        return True
+
+    def is_cancelled(self, index):
+        return (self.stopped or bool(self.tasks[index].get('cancelled'))
+                or index in self.requeued)
+
+    def is_frozen(self, index):
+        return self.suspended_at is not None or index in self.preempted
+
+    def wait_stopped(self):
+        """Wait until the scripts stopped by stop() are gone."""
+        for thread in list(self.stop_threads):
+            thread.join()
+
+    def stop_process(self, index, process):
+        """
+        Stop the session of a script process, escalating from SIGINT to
+        SIGKILL, and report the PIDs confirmed gone.
+        """
+        if self.executor is not None:
+            pids, signal_name = process.stop(self.grace_periods)
+        else:
+            pids, signal_name = stop_process_group(process,
+                                                   self.grace_periods)
+        if pids:
+            self.emit("info", f"Task {index + 1}: stopped with {signal_name}"
+                              f", reaped PIDs "
+                              f"{', '.join(str(pid) for pid in pids)}")
+            self.log("reaped", task=index, pids=pids, signal=signal_name)
+
+    def wait_if_paused(self):
+        with self.condition:
+            while self.paused and not self.stopped:
+                self.condition.wait()
+
+    def get_script_spec(self, script_path, interpreter):
+        if self.introspect:
+            import scriptrunner.lib.introspection as introspection
+            return introspection.get_script_spec(script_path, interpreter)
+        return util.get_script_arguments(script_path)
+
+    def build_command(self, task):
+        """
+        Build the command line of a script task. Raises ValueError if a
+        parameter is invalid.
+        """
+        script_path = os.path.join(self.folder, task['name'])
+        interpreter, _ = util.resolve_interpreter(script_path,
+                                                  self.interpreter_path)
+        command = [interpreter, "-u", script_path]
+        spec = self.get_script_spec(script_path, interpreter)
+        if spec.has_argparse:
+            command.extend(spec.build_argv(task['params']))
+        return command
+
+    def run_script(self, index, task, slot=0):
+        """
+        Run a script task once, streaming its output and retrying it as set
+        by the retry policy of task index. Returns True if it exited with
+        code 0. slot is the run of a sweep task.
+        """
+        try:
+            command = self.build_command(task)
+        except ValueError as e:
+            self.emit("error", f"Error: {e}")
+            return False
+        timeout, retries, backoff, retry_codes = get_retry_policy(
+            self.tasks[index])
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                delay = backoff * 2 ** (attempt - 1)
+                self.emit("info", f"Task {index + 1}: retry {attempt}/"
+                                  f"{retries} in {delay:g} seconds...")
+                self.log("retry", task=index, attempt=attempt, delay=delay)
+                if not self.wait_backoff(index, delay):
+                    return False
+                self.wait_if_paused()
+            returncode, timed_out = self.run_command(index, command, slot,
+                                                     timeout)
+            if returncode is None or self.is_cancelled(index):
+                return False
+            if returncode == 0:
+                return True
+            if not (timed_out or not retry_codes
+                    or returncode in retry_codes):
+                return False
+        return False
+
+    def run_command(self, index, command, slot=0, timeout=0):
+        """
+        Run a command of task index, stopping it (see stop_process) after
+        timeout seconds (0: no timeout). With an executor, it runs on a
+        worker agent with free capacity (AgentPool) or as a batch job
+        (BatchSystem), and is not pinned to cores. Returns (returncode,
+        timed_out); returncode is None if it didn't start.
+        """
+        with self.condition:
+            # A preempted sweep starts no new points until resumed
+            while index in self.preempted and not self.is_cancelled(index):
+                self.condition.wait()
+            if self.is_cancelled(index):
+                return None, False
+            cores = None
+            if index in self.allocations:
+                count = get_task_resources(self.tasks[index])[0]
+                cores = self.allocations[index][0][slot * count:
+                                                   (slot + 1) * count]
+            env = {}
+            if cores:
+                env = {name: str(len(cores)) for name in THREAD_ENV_VARS
+                       if name not in os.environ}
+            try:
+                if self.executor is not None:
+                    process = self.executor.run(command, env)
+                else:
+                    process = popen_in_group(
+                        command, stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT, text=True, bufsize=1,
+                        env=dict(os.environ, **env) if env else None)
+            except OSError as e:
+                self.emit("error", f"Scheduler Error: {e}")
+                return None, False
+            if cores and self.executor is None:
+                self.pin_process(process, cores)
+            self.processes[index, slot] = process
+            if self.suspended_at is not None:
+                # Started just as the queue was suspended
+                self.suspend_process(index, process)
+        timed_out = threading.Event()
+        if timeout:
+            threading.Thread(target=self.watch_timeout,
+                             args=(index, slot, process, timeout, timed_out),
+                             daemon=True).start()
+        try:
+            self.emit("start", (index, command))
+            for line in iter(process.stdout.readline, ''):
+                self.emit("output", (index, line))
+            process.stdout.close()
+            returncode = process.wait()
+        finally:
+            with self.condition:
+                self.processes.pop((index, slot), None)
+                self.condition.notify_all()
+        if timed_out.is_set():
+            self.emit("error", f"Task {index + 1} timed out after "
+                               f"{timeout:g} seconds")
+        self.log("exit", task=index, returncode=returncode,
+                 timed_out=timed_out.is_set())
+        self.emit("end", (index, command, returncode))
+        return returncode, timed_out.is_set()
+
+    def watch_timeout(self, index, slot, process, timeout, timed_out):
+        """
+        Stop a script process still running after timeout seconds, not
+        counting the time it was suspended or preempted.
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.processes.get((index, slot)) is process:
+                if self.is_frozen(index):
+                    frozen_at = time.monotonic()
+                    while self.is_frozen(index) and \
+                            self.processes.get((index, slot)) is process:
+                        self.condition.wait()
+                    deadline += time.monotonic() - frozen_at
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out.set()
+                    break
+                self.condition.wait(remaining)
+        if timed_out.is_set():
+            self.stop_process(index, process)
+
+    def wait_backoff(self, index, delay):
+        """
+        Wait delay seconds before retrying task index. A script task frees
+        its slot and reservation meanwhile, so other tasks keep running, and
+        takes them back before the retry. Returns False if stopped.
+        """
+        deadline = time.monotonic() + delay
+        with self.condition:
+            slots = 0
+            if self.tasks[index]['type'] == 'script':
+                slots = self.release(index)
+                self.active -= slots
+                self.condition.notify_all()
+            while not self.is_cancelled(index):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            if slots:
+                while not self.is_cancelled(index) and \
+                        not self.can_start(index):
+                    self.condition.wait()
+                if self.is_cancelled(index):
+                    return False
+                self.active += slots
+                self.reserve(index, slots)
+            return not self.is_cancelled(index)
+
+    def pin_process(self, process, cores):
+        # Done right after the start, before the script creates threads or
+        # subprocesses, which inherit the affinity
+        if hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(process.pid, cores)
+            except OSError as e:
+                self.emit("error", f"Can't pin task to cores {cores}: {e}")
+
+    def run_sleep(self, index, task):
+        duration = float(task['params']['duration'])
+        self.emit("info", f"Sleeping for {duration} seconds...")
+        # Wait on the condition until a monotonic deadline, woken at once by
+        # pause/resume/stop/cancel. Time spent paused doesn't count.
+        deadline = time.monotonic() + duration
+        with self.condition:
+            while not self.is_cancelled(index):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self.paused:
+                    while self.paused and not self.stopped:
+                        self.condition.wait()
+                    deadline = time.monotonic() + remaining
+                else:
+                    self.condition.wait(remaining)
+
+    def run_sweep(self, index, task):
+        """
+        Run the points of a sweep task with its reserved slots. Returns
+        False if a point failed.
+        """
+        try:
+            sweep = ParameterSweep(task['params'], task.get('mode', 'product'))
+        except ValueError as e:
+            self.emit("error", f"Error: {e}")
+            return False
+        total = len(sweep)
+        points_done = task.setdefault('points_done', [])
+        skipped = set(points_done)
+        points = (number for number in range(total) if number not in skipped)
+        lock = threading.Lock()
+        counts = {'done': len(skipped), 'failed': 0}
+
+        def finish_point(number, success):
+            with lock:
+                if success:
+                    points_done.append(number)
+                    self.log("point_done", task=index, point=number)
+                counts['done'] += 1
+                counts['failed'] += not success
+                status = f"Sweep {counts['done']}/{total}"
+                if counts['failed']:
+                    status += f" ({counts['failed']} failed)"
+                self.set_status(index, status)
+
+        def run_points(slot):
+            while True:
+                self.wait_if_paused()
+                with lock:
+                    number = next(points, None)
+                if number is None or self.is_cancelled(index):
+                    return
+                point = {'name': task['name'], 'params': sweep[number]}
+                finish_point(number, self.run_script(index, point, slot))
+
+        slots = self.allocations.get(index, ([], 0, 1))[2]
+        if hasattr(self.executor, "submit_array"):
+            self.run_sweep_array(index, task, sweep, list(points), slots,
+                                 finish_point)
+        else:
+            threads = [threading.Thread(target=run_points, args=(slot,),
+                                        daemon=True)
+                       for slot in range(1, slots)]
+            for thread in threads:
+                thread.start()
+            run_points(0)
+            for thread in threads:
+                thread.join()
+        if counts['failed'] and index not in self.requeued:
+            self.emit("error", f"Task {index + 1}: {counts['failed']} of "
+                               f"{total} sweep points failed")
+        return counts['failed'] == 0 and not self.is_cancelled(index)
+
+    def run_sweep_array(self, index, task, sweep, numbers, slots,
+                        finish_point):
+        """
+        Run the points numbers of a sweep as job arrays of the executor (see
+        BatchSystem.submit_array), up to slots of them at once, calling
+        finish_point(number, success) as they finish. The failed points are
+        retried together, as set by the retry policy of the task.
+        """
+        timeout, retries, backoff, retry_codes = get_retry_policy(task)
+        env = {}
+        cores = get_task_resources(task)[0]
+        if cores:
+            env = {name: str(cores) for name in THREAD_ENV_VARS
+                   if name not in os.environ}
+        for attempt in range(retries + 1):
+            if not numbers or self.is_cancelled(index):
+                return
+            if attempt > 0:
+                delay = backoff * 2 ** (attempt - 1)
+                self.emit("info", f"Task {index + 1}: retry {attempt}/"
+                                  f"{retries} of {len(numbers)} points in "
+                                  f"{delay:g} seconds...")
+                self.log("retry", task=index, attempt=attempt, delay=delay)
+                if not self.wait_backoff(index, delay):
+                    return
+            self.wait_if_paused()
+            commands = []
+            for number in numbers:
+                point = {'name': task['name'], 'params': sweep[number]}
+                try:
+                    commands.append((number, self.build_command(point)))
+                except ValueError as e:
+                    self.emit("error", f"Error: {e}")
+                    finish_point(number, False)
+            retry = []
+
+            def on_exit(i, returncode, last=attempt == retries):
+                number, command = commands[i]
+                if returncode is not None:
+                    self.log("exit", task=index, returncode=returncode,
+                             timed_out=False)
+                    self.emit("end", (index, command, returncode))
+                if returncode == 0:
+                    finish_point(number, True)
+                elif returncode is None or last or self.is_cancelled(index) \
+                        or (retry_codes and returncode not in retry_codes
+                            and returncode >= 0):
+                    finish_point(number, False)
+                else:
+                    retry.append(number)
+
+            numbers = retry
+            if commands:
+                self.run_array(index, commands, env, slots, timeout, on_exit)
+
+    def run_array(self, index, commands, env, parallel, timeout, on_exit):
+        """
+        Submit the commands [(number, command)] of task index as one job
+        array and wait for them to finish, or for a stop or cancel.
+        """
+        remaining = [len(commands)]
+
+        def on_element_exit(i, returncode):
+            on_exit(i, returncode)
+            with self.condition:
+                remaining[0] -= 1
+                self.condition.notify_all()
+
+        if self.is_cancelled(index):
+            return
+        try:
+            array = self.executor.submit_array(
+                [command for _, command in commands], env, parallel, timeout,
+                on_start=lambda i: self.emit("start", (index, commands[i][1])),
+                on_line=lambda i, line: self.emit("output",
+                                                  (index, line + "\n")),
+                on_exit=on_element_exit)
+        except OSError as e:
+            self.emit("error", f"Scheduler Error: {e}")
+            for i in range(len(commands)):
+                on_exit(i, None)
+            return
+        self.emit("info", f"Task {index + 1}: submitted {len(commands)} "
+                          f"points as job array {array.job_id}")
+        with self.condition:
+            self.processes[index, 0] = array
+            if self.is_cancelled(index):
+                # Cancelled while being submitted
+                thread = threading.Thread(target=self.stop_process,
+                                          args=(index, array), daemon=True)
+                thread.start()
+                self.stop_threads.append(thread)
+            try:
+                # Cancelled elements are reported once gone from the queue
+                while remaining[0] > 0:
+                    self.condition.wait()
+            finally:
+                self.processes.pop((index, 0), None)
+
+    def run_task(self, index, task):
+        """
+        Run all iterations of a task, after its 'runs_done' ones. A script
+        run lasting more than the task's 'timeout' (s) is stopped. A failed
+        run is retried up to 'retries' times if its exit code is in
+        'retry_codes' (any non-zero code if empty) or it timed out, after a
+        backoff doubling from 'backoff' seconds (see wait_backoff). Returns
+        False if one of them failed.
+        """
+        total_runs = task.get('iterations', 1)
+        for run_idx in range(task.get('runs_done', 0), total_runs):
+            if self.stopped:
+                return True
+            self.wait_if_paused()
+            status = util.STATUS_RUNNING if total_runs == 1 \
+                else f"Run {run_idx + 1}/{total_runs}"
+            self.set_status(index, status)
+            self.log("started", task=index, run=run_idx)
+            if task['type'] == 'sweep':
+                if not self.run_sweep(index, task):
+                    return False
+            elif task['type'] == 'sleep':
+                try:
+                    self.run_sleep(index, task)
+                except (KeyError, TypeError, ValueError):
+                    return False
+            elif task['type'] == 'script':
+                if not self.run_script(index, task):
+                    return False
+            if task.get('cancelled'):
+                return False
+            if self.stopped:
+                return True
+            task['runs_done'] = run_idx + 1
+            task.pop('points_done', None)
+            self.log("run_done", task=index, run=run_idx)
+        return True
+
+    def reset_task(self, index):
+        task = self.tasks[index]
+        task.pop('runs_done', None)
+        task.pop('points_done', None)
+        task.pop('cancelled', None)
+        self.set_status(index, util.STATUS_PENDING)
+
+    def finish_task(self, index, success):
+        if self.tasks[index].get('cancelled'):
+            status = util.STATUS_CANCELLED
+        elif not success:
+            status = util.STATUS_FAILED
+        elif not self.stopped:
+            status = util.STATUS_DONE
+        else:
+            return
+        task = self.tasks[index]
+        task.pop('runs_done', None)
+        task.pop('points_done', None)
+        self.set_status(index, status)
+        self.log("finished", task=index, status=status)
+
+    def run_in_thread(self, index, task):
+        success = False
+        try:
+            success = self.run_task(index, task)
+            if success or index not in self.requeued:
+                self.finish_task(index, success)
+        finally:
+            with self.condition:
+                self.active -= self.release(index)
+                self.preempted.pop(index, None)
+                self.running_tasks -= 1
+                self.started_tasks.discard(index)
+                if index in self.requeued:
+                    self.requeued.discard(index)
+                    if not success:
+                        # Back to the ready tasks (see preempt_for)
+                        success = None
+                self.completed.append((index, success))
+                self.condition.notify_all()
+
+    def get_task_slots(self, task):
+        """
+        Number of scripts a task runs at once: 0 for a sleep, 1 for a
+        script, and for a sweep its 'parallel' value, bounded by
+        max_concurrent, by its number of points and by how many of its
+        reservations fit in the totals.
+        """
+        if task['type'] == 'sleep':
+            return 0
+        if task['type'] != 'sweep':
+            return 1
+        max_concurrent = max(self.get_max_concurrent(), 1)
+        slots = min(int(task.get('parallel') or 0) or max_concurrent,
+                    max_concurrent)
+        cores, memory = get_task_resources(task)
+        if cores:
+            slots = min(slots, self.total_cores // cores)
+        if memory:
+            slots = min(slots, int(self.total_memory // memory))
+        try:
+            slots = min(slots, len(ParameterSweep(task['params'],
+                                                  task.get('mode',
+                                                           'product'))))
+        except ValueError:
+            pass
+        return max(slots, 1)
+
+    def can_start(self, index, slots=None):
+        # Called with the condition held
+        task = self.tasks[index]
+        if slots is None:
+            slots = self.get_task_slots(task)
+        if slots == 0:
+            return True
+        cores, memory = get_task_resources(task)
+        return (self.active + slots <= self.get_max_concurrent()
+                and cores * slots <= len(self.free_cores)
+                and memory * slots <= self.free_memory)
+
+    def preempt_for(self, index):
+        """
+        Make room for ready task index by preempting running tasks of lower
+        priority (see preempt), the lowest priority and the latest in the
+        queue first, if that is enough for it to fit. Returns True if it
+        can start now.
+        """
+        # Called with the condition held
+        task = self.tasks[index]
+        priority = get_task_priority(task)
+        slots = self.get_task_slots(task)
+        cores, memory = get_task_resources(task)
+        victims = sorted((i for i in self.allocations
+                          if i not in self.preempted and
+                          get_task_priority(self.tasks[i]) < priority),
+                         key=lambda i: (i not in self.requeued,
+                                        get_task_priority(self.tasks[i]),
+                                        -i))
+        active = self.active
+        free_cores = len(self.free_cores)
+        free_memory = self.free_memory
+        chosen = []
+        for i in victims:
+            if (active + slots <= self.get_max_concurrent()
+                    and cores * slots <= free_cores
+                    and memory * slots <= free_memory):
+                break
+            victim_cores, victim_memory, victim_slots = self.allocations[i]
+            active -= victim_slots
+            free_cores += len(victim_cores)
+            free_memory += victim_memory
+            chosen.append(i)
+        if not (active + slots <= self.get_max_concurrent()
+                and cores * slots <= free_cores
+                and memory * slots <= free_memory):
+            return False
+        for i in chosen:
+            if i not in self.requeued:
+                self.preempt_task(i, index)
+        return self.can_start(index)
+
+    def preempt_task(self, index, by):
+        """
+        Take the slots and reservation of running task index for task by.
+        With "suspend" its scripts are frozen until it fits again (see
+        resume_preempted), with "requeue" they are stopped and the task goes
+        back to the ready tasks, to redo its current iteration (a sweep
+        keeps its finished points).
+        """
+        # Called with the condition held
+        processes = [process for (i, _), process in self.processes.items()
+                     if i == index]
+        self.log("preempted", task=index, by=by, mode=self.preempt)
+        if self.preempt == "requeue":
+            self.emit("info", f"Task {index + 1}: stopped for task {by + 1}, "
+                              f"requeued")
+            self.requeued.add(index)
+            for process in processes:
+                thread = threading.Thread(target=self.stop_process,
+                                          args=(index, process), daemon=True)
+                thread.start()
+                self.stop_threads.append(thread)
+        else:
+            self.emit("info", f"Task {index + 1}: suspended for task "
+                              f"{by + 1}")
+            for process in processes:
+                if self.executor is not None:
+                    process.suspend()
+                else:
+                    suspend_process_group(process)
+            slots = self.release(index)
+            self.active -= slots
+            self.preempted[index] = (slots, time.monotonic(),
+                                     self.tasks[index]['status'])
+            self.set_status(index, util.STATUS_PREEMPTED)
+        self.condition.notify_all()
+
+    def resume_preempted(self, index):
+        """Give a task frozen by preempt_for its slots back and thaw it."""
+        # Called with the condition held
+        slots, start, status = self.preempted.pop(index)
+        self.active += slots
+        self.reserve(index, slots)
+        count = get_task_resources(self.tasks[index])[0]
+        cores = self.allocations[index][0]
+        for (i, slot), process in self.processes.items():
+            if i != index:
+                continue
+            self.resume_process(process)
+            if count and self.executor is None:
+                # The reserved cores may have changed
+                self.pin_process(process, cores[slot * count:
+                                                (slot + 1) * count])
+        duration = time.monotonic() - start
+        self.set_status(index, status)
+        self.emit("info", f"Task {index + 1} resumed after {duration:.1f} "
+                          f"seconds preempted")
+        self.log("resumed", task=index, duration=round(duration, 3))
+        self.condition.notify_all()
+
+    def reserve(self, index, slots):
+        """
+        Take the 'cores' and 'memory' (GB) of a task, per slot, from what is
+        left of total_cores and total_memory (default: the cores this
+        process may use and the physical memory). Local scripts are pinned
+        to their reserved cores (see pin_process).
+        """
+        cores, memory = get_task_resources(self.tasks[index])
+        cores *= slots
+        memory *= slots
+        self.allocations[index] = (self.free_cores[:cores], memory, slots)
+        self.free_cores = self.free_cores[cores:]
+        self.free_memory -= memory
+
+    def release(self, index):
+        """Free the reservation of a task, return its number of slots."""
+        allocation = self.allocations.pop(index, None)
+        if allocation is None:
+            return 0
+        cores, memory, slots = allocation
+        self.free_cores = sorted(self.free_cores + cores)
+        self.free_memory += memory
+        return slots
+
+    def start_task(self, index):
+        # Called with the condition held
+        task = self.tasks[index]
+        slots = self.get_task_slots(task)
+        if slots:
+            self.active += slots
+            self.reserve(index, slots)
+        self.running_tasks += 1
+        self.started_tasks.add(index)
+        threading.Thread(target=self.run_in_thread, args=(index, task),
+                         daemon=True).start()
+
+    def wait_all_finished(self):
+        with self.condition:
+            while self.running_tasks > 0:
+                self.condition.wait()
+
+    def build_dependencies(self):
+        """
+        Return, for each task, a dict {index of a task it waits for: hard}.
+        Tasks listed in its 'after' ids are hard dependencies: if one of them
+        fails, the task is skipped. Sleep tasks add soft (ordering only)
+        dependencies: a sleep waits for the tasks before it, and the tasks
+        after it wait for the sleep.
+        """
+        index_of = {task.get('id'): i for i, task in enumerate(self.tasks)}
+        dependencies = []
+        barrier = None
+        since_barrier = []
+        for i, task in enumerate(self.tasks):
+            deps = {}
+            if barrier is not None:
+                deps[barrier] = False
+            if task['type'] == 'sleep':
+                deps.update((j, False) for j in since_barrier)
+                barrier = i
+                since_barrier = []
+            else:
+                since_barrier.append(i)
+            for task_id in task.get('after', ()):
+                j = index_of.get(task_id)
+                if j is None:
+                    self.emit("error", f"Task {i + 1}: unknown dependency "
+                                       f"{task_id}, ignored")
+                elif j != i:
+                    deps[j] = True
+            dependencies.append(deps)
+        return dependencies
+
+    def run_pass(self, final=True):
+        """
+        Run every task not done yet, once. A task becomes ready when all the
+        tasks it depends on are finished; ready tasks start by priority,
+        then in queue order, while fewer than max_concurrent scripts are
+        running and their reservations fit, preempting tasks of lower
+        priority if set (see preempt_for). A ready task that doesn't fit yet
+        lets smaller ready tasks after it start (backfilling). Preempted
+        tasks resume before the ready tasks of lower priority. When a task
+        fails, the tasks depending on it (and on those, ...) are skipped;
+        the other tasks carry on. The final pass closes the queue to
+        submit() when it ends.
+
+        A task with an 'at' start time (see parse_start_time) becomes ready
+        at that time. A task with an 'every' interval (see parse_interval)
+        or a 'cron' pattern (see CronPattern) recurs: after each run it
+        waits for its next time, skipping the times missed while it ran,
+        until stop() or its cancellation, and the tasks after it wait for
+        its first run. All these times are kept in a single heap, and the
+        scheduler only wakes up at the earliest one.
+        """
+        tasks = self.tasks
+        with self.condition:
+            dependencies = self.build_dependencies()
+            # Tasks submitted before the pass are part of it
+            self.submitted = []
+        unfinished = set()
+        dependents = [[] for _ in dependencies]
+        remaining = [0] * len(dependencies)
+        # Heap of (-priority, index) of the ready tasks
+        ready = []
+        # Heap of (time, index) of the tasks waiting for their start time,
+        # the time each one is due, and the recurring tasks
+        timers = []
+        due = {}
+        recurring = set()
+
+        def push(i):
+            heapq.heappush(ready, (-get_task_priority(tasks[i]), i))
+
+        def make_ready(i):
+            # A task with a start time waits for its timer
+            now = time.time()
+            try:
+                start = get_first_run(tasks[i], now)
+            except ValueError as e:
+                self.emit("error", f"Task {i + 1}: {e}")
+                self.set_status(i, util.STATUS_FAILED)
+                resolve(i, False)
+                return
+            if is_recurring(tasks[i]):
+                recurring.add(i)
+            if start is None:
+                due[i] = now
+                push(i)
+            else:
+                schedule(i, start)
+
+        def schedule(i, start):
+            due[i] = start
+            heapq.heappush(timers, (start, i))
+            self.set_status(i, f"{util.STATUS_SCHEDULED} "
+                               f"{format_clock(start)}")
+
+        def resolve(index, success):
+            stack = [(index, success)]
+            while stack:
+                i, ok = stack.pop()
+                unfinished.discard(i)
+                for d in dependents[i]:
+                    if d not in unfinished:
+                        continue
+                    if not ok and dependencies[d][i]:
+                        skip(d)
+                        stack.append((d, False))
+                        continue
+                    remaining[d] -= 1
+                    if remaining[d] == 0:
+                        make_ready(d)
+
+        def skip(i):
+            unfinished.discard(i)
+            self.set_status(i, util.STATUS_SKIPPED)
+            self.log("finished", task=i, status=util.STATUS_SKIPPED)
+
+        def add(indexes):
+            # Queue tasks not done yet, linked to the unfinished tasks they
+            # depend on. A task depending on one that already failed is
+            # skipped.
+            unfinished.update(i for i in indexes
+                              if tasks[i]['status'] != util.STATUS_DONE
+                              or is_recurring(tasks[i]))
+            for i in indexes:
+                if i not in unfinished:
+                    continue
+                failed = False
+                for j, hard in dependencies[i].items():
+                    if j in unfinished:
+                        dependents[j].append(i)
+                        remaining[i] += 1
+                    elif hard and tasks[j]['status'] != util.STATUS_DONE:
+                        failed = True
+                if failed:
+                    skip(i)
+                    resolve(i, False)
+                elif remaining[i] == 0:
+                    make_ready(i)
+            for i in indexes:
+                if i not in unfinished:
+                    continue
+                cores, memory = get_task_resources(tasks[i])
+                if tasks[i]['type'] != 'sleep' and (
+                        cores > self.total_cores or
+                        memory > self.total_memory):
+                    self.emit("error", f"Task {i + 1} reserves {cores} cores "
+                                       f"and {memory} GB, more than the "
+                                       f"{self.total_cores} cores and "
+                                       f"{self.total_memory:.1f} GB "
+                                       f"available")
+                    self.set_status(i, util.STATUS_FAILED)
+                    resolve(i, False)
+
+        self.completed = []
+        add(range(len(dependencies)))
+        try:
+            while True:
+                with self.condition:
+                    if self.stopped:
+                        self.closed = True
+                        break
+                    # Tasks submitted and cancelled while running
+                    submitted, self.submitted = self.submitted, []
+                    for i in submitted:
+                        dependencies.append({self.index_of[task_id]: True
+                                             for task_id
+                                             in tasks[i].get('after', ())})
+                        dependents.append([])
+                        remaining.append(0)
+                    add(submitted)
+                    cancelled, self.cancelled = self.cancelled, []
+                    for i in cancelled:
+                        if (i in unfinished or i in recurring) \
+                                and i not in self.started_tasks:
+                            self.finish_task(i, False)
+                            recurring.discard(i)
+                            if i in unfinished:
+                                resolve(i, False)
+                    completed, self.completed = self.completed, []
+                    for index, success in completed:
+                        if success is None:
+                            # Preempted and requeued
+                            self.set_status(index, util.STATUS_PENDING)
+                            push(index)
+                            continue
+                        if index in unfinished or index not in recurring:
+                            resolve(index, success)
+                        if index in recurring:
+                            if tasks[index].get('cancelled'):
+                                recurring.discard(index)
+                                continue
+                            schedule(index, get_next_run(
+                                tasks[index], due[index], time.time()))
+                    if not (unfinished or recurring or self.serving):
+                        # Decided with the condition held, so a task is
+                        # either taken above or refused by submit()
+                        if final:
+                            self.closed = True
+                        break
+                    # Start times reached
+                    fired = False
+                    while timers and timers[0][0] <= time.time():
+                        _, index = heapq.heappop(timers)
+                        if (index in unfinished or index in recurring) \
+                                and index not in self.started_tasks:
+                            self.set_status(index, util.STATUS_PENDING)
+                            push(index)
+                            fired = True
+                    started = False
+                    waiting = []
+                    # Preempted tasks, best first, resumed when they fit
+                    # again and no ready task comes before them
+                    frozen = sorted((-get_task_priority(tasks[i]), i)
+                                    for i in self.preempted)
+                    while (ready or frozen) and not self.stopped \
+                            and not self.paused:
+                        if frozen and (not ready or frozen[0] < ready[0]):
+                            _, index = frozen.pop(0)
+                            if self.can_start(index,
+                                              self.preempted[index][0]):
+                                self.resume_preempted(index)
+                                started = True
+                                continue
+                            # Tasks after it wait for it
+                            break
+                        entry = heapq.heappop(ready)
+                        index = entry[1]
+                        if index not in unfinished and \
+                                index not in recurring or \
+                                index in self.started_tasks:
+                            continue
+                        if not self.can_start(index) and not (
+                                self.preempt and self.preempt_for(index)):
+                            waiting.append(entry)
+                            if self.active >= self.get_max_concurrent():
+                                break
+                            continue
+                        self.start_task(index)
+                        started = True
+                    for entry in waiting:
+                        heapq.heappush(ready, entry)
+                    if completed or started or submitted or cancelled or \
+                            fired:
+                        continue
+                    if self.paused:
+                        # Submissions and cancellations are still taken
+                        self.condition.wait()
+                        continue
+                    if unfinished and self.running_tasks == 0 and not ready \
+                            and not timers:
+                        # Nothing runs and nothing can start
+                        numbers = ", ".join(str(i + 1)
+                                            for i in sorted(unfinished))
+                        self.emit("error", f"Dependency cycle between tasks "
+                                           f"{numbers}")
+                        for i in sorted(unfinished):
+                            self.set_status(i, util.STATUS_FAILED)
+                        unfinished.clear()
+                        continue
+                    if timers:
+                        self.condition.wait(max(timers[0][0] - time.time(),
+                                                0.0))
+                    elif unfinished or recurring or self.serving:
+                        self.condition.wait()
+        finally:
+            self.wait_all_finished()
+
+    def serve(self):
+        """
+        Run the tasks given and those added with submit() as they come,
+        until stop(). Submitted tasks only wait for their 'after' tasks;
+        their sleep tasks are not barriers.
+        """
+        self.running = True
+        self.serving = True
+        with self.condition:
+            self.closed = False
+        try:
+            self.run_pass()
+        finally:
+            with self.condition:
+                self.closed = True
+            self.serving = False
+            self.running = False
+
+    def run(self):
+        """
+        Run the queue queue_iterations times, from start_iteration. Tasks
+        already done are skipped, a sweep skips its 'points_done' points;
+        a fully finished queue is reset first. Returns True if every task
+        succeeded.
+        """
+        self.running = True
+        with self.condition:
+            self.closed = False
+        if self.tasks and all(t['status'] in (util.STATUS_DONE,
+                                              util.STATUS_FAILED,
+                                              util.STATUS_SKIPPED,
+                                              util.STATUS_CANCELLED)
+                              for t in self.tasks):
+            self.emit("info", "Queue is finished. Resetting for new run...")
+            for i in range(len(self.tasks)):
+                self.reset_task(i)
+        start = min(max(int(self.start_iteration), 0),
+                    self.queue_iterations - 1)
+        if self.journal is not None:
+            try:
+                self.journal.open()
+            except OSError as e:
+                self.emit("error", f"Can't write the queue journal: {e}")
+                self.journal = None
+        if self.journal is not None:
+            total_memory = self.total_memory
+            self.log("queue", folder=self.folder,
+                     interpreter=self.interpreter_path,
+                     queue_iterations=self.queue_iterations,
+                     max_concurrent=self.max_concurrent,
+                     total_cores=self.total_cores,
+                     total_memory=None if math.isinf(total_memory)
+                     else total_memory, iteration=start)
+            for task in self.tasks:
+                self.log("enqueued", task=task)
+        try:
+            for q_run in range(start, self.queue_iterations):
+                if self.stopped:
+                    break
+                if q_run > start:
+                    self.emit("info", f"--- Restarting Queue (Iteration "
+                                      f"{q_run + 1}/{self.queue_iterations})"
+                                      f" ---")
+                    self.log("pass", iteration=q_run)
+                    for i in range(len(self.tasks)):
+                        self.reset_task(i)
+                elif self.queue_iterations > 1:
+                    self.emit("info", f"--- Starting Queue (Iteration "
+                                      f"{q_run + 1}/{self.queue_iterations})"
+                                      f" ---")
+                self.run_pass(final=q_run == self.queue_iterations - 1)
+        finally:
+            with self.condition:
+                self.closed = True
+            self.running = False
+            self.start_iteration = 0
+            # Tasks added to the list once closed are not part of this run
+            success = not self.stopped and all(
+                t['status'] == util.STATUS_DONE for t in self.tasks
+                if t.get('id') in self.index_of)
+            if self.journal is not None:
+                self.log("end", result="ok" if success else
+                         ("stopped" if self.stopped else "failed"))
+                self.journal.close()
+        return success
@@ -0,0 +1,605 @@
+import os
+import re
+import json
+import time
+import socket
+import itertools
+import threading
+import collections
+import socketserver
+import http.client
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import scriptrunner.lib.utilities as util
+from scriptrunner.lib.scheduling import parse_tasks, new_task_id
+
+SOCKET_FILE = "server.sock"
+# Events kept for GET /events, the oldest are dropped first
+MAX_EVENTS = 10000
+# Longest wait of a GET /events request (s)
+MAX_POLL_TIMEOUT = 30.0
+FINISHED_STATUSES = (util.STATUS_DONE, util.STATUS_FAILED,
+                     util.STATUS_SKIPPED, util.STATUS_CANCELLED)
+
+
+# ==============================================================================
+#                          Job Server
+# ==============================================================================
+
+
+def get_server_address(text=None):
+    """
+    Address of a job server from its text form: "PORT" or "HOST:PORT" for
+    HTTP over TCP (host 127.0.0.1 by default), else the path of a Unix
+    domain socket. None gives the default socket, next to the config file.
+    """
+    if not text:
+        return util.get_cache_path(SOCKET_FILE)
+    if isinstance(text, tuple):
+        return text
+    match = re.fullmatch(r"(?:([\w.-]+):)?(\d+)", str(text).strip())
+    if match:
+        return match.group(1) or "127.0.0.1", int(match.group(2))
+    return os.path.abspath(os.path.expanduser(text))
+
+
+def format_address(address):
+    if isinstance(address, tuple):
+        return f"{address[0]}:{address[1]}"
+    return address
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """HTTP/JSON requests of a JobServer, see JobServer.handle."""
+
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        return str(self.client_address or "local")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        parts = [urllib.parse.unquote(part)
+                 for part in url.path.split("/") if part]
+        query = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            code, data = self.server.job_server.handle(method, parts, query,
+                                                       body)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            code, data = 400, {"error": str(e)}
+        content = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class JobServer:
+    """
+    Serve the queue of a Scheduler (see Scheduler.serve) as a local job
+    server, with an HTTP/JSON API on a Unix domain socket (only usable by
+    its owner) or a TCP port (usable by every local user), see
+    get_server_address. Requests are handled in their own threads, and a
+    submission only appends to the queue, so clients never hold up the
+    running tasks.
+
+    - POST /tasks: a task or {"tasks": [...]} in the queue file format (see
+      parse_tasks); returns {"tasks": [{"index", "id"}]}. Script names are
+      relative to the scheduler folder, or absolute. task_defaults (e.g. a
+      retry policy) fill the keys script tasks don't set.
+    - GET /tasks, GET /tasks/<id>, GET /tasks/by-index/<index>: the tasks
+      and their status.
+    - DELETE /tasks/<id>, DELETE /tasks/by-index/<index>: cancel a task
+      (see Scheduler.cancel).
+    - GET /status: counts of tasks by status, paused, running tasks.
+    - POST /pause, /resume, /suspend.
+    - GET /events?since=N&timeout=S: the scheduler events numbered N and
+      after, waiting up to S seconds for one; returns {"events", "next",
+      "first"}, events older than "first" were dropped.
+    """
+
+    def __init__(self, scheduler, address=None, task_defaults=None,
+                 max_events=MAX_EVENTS):
+        self.scheduler = scheduler
+        self.address = get_server_address(address)
+        self.task_defaults = task_defaults or {}
+        self.events = collections.deque(maxlen=max_events)
+        self.next_event = 0
+        self.events_condition = threading.Condition()
+        self.httpd = None
+        self.thread = None
+        self.forward = scheduler.on_event
+        scheduler.on_event = self.on_event
+
+    def on_event(self, kind, data):
+        # Called by the scheduler, serialized
+        record = {"event": kind, "time": round(time.time(), 3)}
+        if kind in ("status", "start", "output", "end"):
+            index = data[0]
+            record.update(task=index,
+                          id=self.scheduler.tasks[index].get('id'))
+            if kind == "status":
+                record["status"] = data[1]
+            elif kind == "start":
+                record["command"] = data[1]
+            elif kind == "output":
+                record["line"] = data[1].rstrip("\n")
+            else:
+                record.update(command=data[1], returncode=data[2])
+        else:
+            record["message"] = data
+        with self.events_condition:
+            record["seq"] = self.next_event
+            self.next_event += 1
+            self.events.append(record)
+            self.events_condition.notify_all()
+        if self.forward is not None:
+            self.forward(kind, data)
+
+    def get_events(self, since=0, timeout=0.0):
+        """
+        Events numbered since and after, waiting up to timeout seconds for
+        one. Returns (events, next number, first number kept).
+        """
+        deadline = time.monotonic() + min(max(timeout, 0.0),
+                                          MAX_POLL_TIMEOUT)
+        with self.events_condition:
+            while self.next_event <= since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.events_condition.wait(remaining)
+            first = self.next_event - len(self.events)
+            start = min(max(since - first, 0), len(self.events))
+            events = list(itertools.islice(self.events, start, None))
+            return events, self.next_event, first
+
+    def find_task(self, parts):
+        """
+        Index of the task of the path parts [id] or ["by-index", index],
+        KeyError if unknown.
+        """
+        scheduler = self.scheduler
+        with scheduler.condition:
+            if len(parts) == 1 and parts[0] in scheduler.index_of:
+                return scheduler.index_of[parts[0]]
+            if len(parts) == 2 and parts[0] == "by-index" and \
+                    parts[1].isdigit() and int(parts[1]) < len(scheduler.tasks):
+                return int(parts[1])
+        raise KeyError("/".join(parts))
+
+    def get_task_info(self, index):
+        with self.scheduler.condition:
+            task = self.scheduler.tasks[index]
+            return dict(task, index=index,
+                        after=list(task.get('after', ())))
+
+    def submit(self, body):
+        items = body.get("tasks") if isinstance(body, dict) \
+            and "tasks" in body else body
+        if isinstance(items, dict):
+            items = [items]
+        if not isinstance(items, list) or not items:
+            raise ValueError("Expected a task or a list of tasks")
+        for item in items:
+            if item.get("type", "script") != "sleep":
+                for key, value in self.task_defaults.items():
+                    if not item.get(key):
+                        item[key] = value
+        tasks = parse_tasks(items)
+        indexes = self.scheduler.submit(tasks)
+        if indexes is None:
+            raise ValueError("The queue is closed")
+        return [{"index": index, "id": task['id']}
+                for index, task in zip(indexes, tasks)]
+
+    def get_status(self):
+        scheduler = self.scheduler
+        with scheduler.condition:
+            counts = collections.Counter(task['status']
+                                         for task in scheduler.tasks)
+            return {"tasks": dict(counts), "total": len(scheduler.tasks),
+                    "running": scheduler.running_tasks,
+                    "paused": scheduler.paused,
+                    "suspended": scheduler.suspended_at is not None,
+                    "max_concurrent": scheduler.max_concurrent,
+                    "folder": scheduler.folder}
+
+    def handle(self, method, parts, query, body):
+        """
+        Handle a request to the path parts. Returns (HTTP code, JSON data);
+        raises ValueError, KeyError or TypeError on invalid requests.
+        """
+        route = (method, parts[0] if parts else "", min(len(parts), 2))
+        scheduler = self.scheduler
+        try:
+            if route == ("POST", "tasks", 1):
+                return 201, {"tasks": self.submit(body)}
+            if route == ("GET", "tasks", 1):
+                with scheduler.condition:
+                    count = len(scheduler.tasks)
+                return 200, {"tasks": [self.get_task_info(i)
+                                       for i in range(count)]}
+            if route == ("GET", "tasks", 2):
+                return 200, self.get_task_info(self.find_task(parts[1:]))
+            if route == ("DELETE", "tasks", 2):
+                index = self.find_task(parts[1:])
+                return 200, {"index": index,
+                             "cancelled": scheduler.cancel(index)}
+        except KeyError as e:
+            return 404, {"error": f"Unknown task {e}"}
+        if route == ("GET", "status", 1):
+            return 200, self.get_status()
+        if route == ("GET", "events", 1):
+            events, next_event, first = self.get_events(
+                int(query.get("since", 0)), float(query.get("timeout", 0)))
+            return 200, {"events": events, "next": next_event,
+                         "first": first}
+        if method == "POST" and len(parts) == 1 and \
+                parts[0] in ("pause", "resume", "suspend"):
+            getattr(scheduler, parts[0])()
+            return 200, self.get_status()
+        return 404, {"error": f"Unknown request {method} "
+                              f"/{'/'.join(parts)}"}
+
+    def start(self):
+        """
+        Listen on the address, handling requests in the background.
+        Raises OSError if it is in use.
+        """
+        if isinstance(self.address, tuple):
+            self.httpd = ThreadingHTTPServer(self.address, JobRequestHandler)
+            self.address = self.httpd.server_address[:2]
+        else:
+            if os.path.exists(self.address):
+                # Left by a server that crashed, unless it still answers
+                probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    probe.connect(self.address)
+                except OSError:
+                    os.remove(self.address)
+                else:
+                    raise OSError(f"A server is running on {self.address}")
+                finally:
+                    probe.close()
+            os.makedirs(os.path.dirname(self.address), exist_ok=True)
+            old_mask = os.umask(0o177)
+            try:
+                self.httpd = UnixHTTPServer(self.address, JobRequestHandler)
+            finally:
+                os.umask(old_mask)
+        self.httpd.job_server = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Serve the queue until the scheduler is stopped."""
+        if self.httpd is None:
+            self.start()
+        try:
+            self.scheduler.serve()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.httpd is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd = None
+        if not isinstance(self.address, tuple):
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
+
+
+# ==============================================================================
+#                          Job Client
+# ==============================================================================
+
+
+def get_task_path(key):
+    """API path of a task from its id (str) or its index (int)."""
+    if isinstance(key, int):
+        return f"/tasks/by-index/{key}"
+    return f"/tasks/{urllib.parse.quote(str(key), safe='')}"
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class JobClient:
+    """
+    Client of a JobServer, keeping a connection per thread. Raises OSError
+    if the server can't be reached and ValueError if it rejects a request.
+    """
+
+    def __init__(self, address=None, timeout=MAX_POLL_TIMEOUT + 30.0):
+        self.address = get_server_address(address)
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def get_connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            if isinstance(self.address, tuple):
+                connection = http.client.HTTPConnection(
+                    *self.address, timeout=self.timeout)
+            else:
+                connection = UnixHTTPConnection(self.address, self.timeout)
+            self.local.connection = connection
+        return connection
+
+    def request(self, method, path, data=None):
+        body = None if data is None else json.dumps(data).encode()
+        headers = {"Content-Type": "application/json"}
+        for attempt in range(2):
+            connection = self.get_connection()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                content = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # Kept-alive connection closed by the server, reconnect
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise OSError(f"No answer from the job server at "
+                                  f"{format_address(self.address)}")
+        result = json.loads(content)
+        if response.status >= 400:
+            raise ValueError(result.get("error", response.reason))
+        return result
+
+    def submit(self, tasks):
+        """Submit tasks (dicts), return their [{"index", "id"}]."""
+        return self.request("POST", "/tasks", {"tasks": tasks})["tasks"]
+
+    def get_tasks(self):
+        return self.request("GET", "/tasks")["tasks"]
+
+    def get_task(self, key):
+        """The task of an id (str) or of an index (int)."""
+        return self.request("GET", get_task_path(key))
+
+    def cancel(self, key):
+        """Cancel the task of an id (str) or of an index (int)."""
+        return self.request("DELETE", get_task_path(key))
+
+    def get_status(self):
+        return self.request("GET", "/status")
+
+    def pause(self):
+        return self.request("POST", "/pause")
+
+    def resume(self):
+        return self.request("POST", "/resume")
+
+    def suspend(self):
+        return self.request("POST", "/suspend")
+
+    def get_events(self, since=0, timeout=0.0):
+        return self.request("GET", f"/events?since={int(since)}"
+                                   f"&timeout={timeout:g}")
+
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+class ServerQueue:
+    """
+    Run a queue of tasks on a job server, with the methods of Scheduler
+    used by the GUI (run, pause, resume, suspend, stop, wait_stopped).
+
+    The tasks are submitted with new ids, one segment between sleep tasks
+    at a time so that a sleep still waits for the tasks before it. Their
+    status is followed through the server events, and reported by
+    on_event(kind, data) with the task indexes of the queue. pause(),
+    resume() and suspend() act on the whole server; stop() cancels the
+    tasks of this queue only.
+    """
+
+    def __init__(self, client, tasks, folder, queue_iterations=1,
+                 on_event=None, max_concurrent=1, poll_timeout=1.0):
+        self.client = client
+        self.tasks = tasks
+        self.folder = folder
+        self.queue_iterations = max(int(queue_iterations), 1)
+        self.on_event = on_event
+        self.max_concurrent = max_concurrent
+        self.poll_timeout = poll_timeout
+        self.lock = threading.Lock()
+        self.local_index = {}
+        self.unfinished = set()
+        self.running = False
+        self.paused = False
+        self.stopped = False
+        self.suspended = {}
+
+    def emit(self, kind, data):
+        if self.on_event is not None:
+            self.on_event(kind, data)
+
+    def call(self, method):
+        try:
+            return getattr(self.client, method)()
+        except (OSError, ValueError) as e:
+            self.emit("error", f"Job server error: {e}")
+        finally:
+            # Connections are per thread, don't keep one for the caller's
+            self.client.close()
+
+    def pause(self):
+        self.paused = True
+        self.call("pause")
+
+    def suspend(self):
+        self.paused = True
+        self.call("suspend")
+
+    def resume(self):
+        self.paused = False
+        self.call("resume")
+
+    def stop(self):
+        """Cancel the unfinished tasks of the queue on the server."""
+        with self.lock:
+            self.stopped = True
+            pending = sorted(self.unfinished)
+        try:
+            for index in pending:
+                self.client.cancel(index)
+        except (OSError, ValueError) as e:
+            self.emit("error", f"Job server error: {e}")
+        finally:
+            self.client.close()
+
+    def wait_stopped(self):
+        pass
+
+    def get_suspended_times(self):
+        return {}
+
+    def run(self):
+        """
+        Run the queue queue_iterations times on the server. Returns True if
+        every task succeeded.
+        """
+        self.running = True
+        try:
+            since = self.client.get_events()["next"]
+            for q_run in range(self.queue_iterations):
+                if self.stopped:
+                    break
+                if self.queue_iterations > 1:
+                    self.emit("info", f"--- Starting Queue (Iteration "
+                                      f"{q_run + 1}/{self.queue_iterations})"
+                                      f" ---")
+                for i, task in enumerate(self.tasks):
+                    if q_run > 0 or task['status'] != util.STATUS_DONE:
+                        task['status'] = util.STATUS_PENDING
+                        self.emit("status", (i, task['status']))
+                prefix = new_task_id()
+                segments = self.get_segments()
+                submitted = {self.tasks[i]['id'] for segment in segments
+                             for i in segment}
+                for segment in segments:
+                    if self.stopped:
+                        break
+                    since = self.run_segment(segment, prefix, submitted,
+                                             since)
+        except (OSError, ValueError) as e:
+            self.emit("error", f"Job server error: {e}")
+            return False
+        finally:
+            self.client.close()
+            self.running = False
+        return not self.stopped and all(
+            task['status'] == util.STATUS_DONE for task in self.tasks)
+
+    def get_segments(self):
+        """Indexes of the tasks to run, split before and after sleeps."""
+        segments = [[]]
+        for i, task in enumerate(self.tasks):
+            if task['status'] == util.STATUS_DONE:
+                continue
+            if task['type'] == 'sleep':
+                segments.extend([[i], []])
+            else:
+                segments[-1].append(i)
+        return [segment for segment in segments if segment]
+
+    def run_segment(self, segment, prefix, submitted, since):
+        """
+        Submit the tasks of segment, wait for them to finish and return the
+        number of the next server event. Dependencies on tasks not in
+        submitted (the ids of the tasks of this pass) are dropped.
+        """
+        items = []
+        for i in segment:
+            task = self.tasks[i]
+            item = dict(task, id=f"{prefix}-{task['id']}",
+                        after=[f"{prefix}-{task_id}" for task_id
+                               in task.get('after', ())
+                               if task_id in submitted])
+            if task['type'] != 'sleep':
+                item['name'] = os.path.join(self.folder, task['name'])
+            items.append(item)
+        with self.lock:
+            results = self.client.submit(items)
+            for i, result in zip(segment, results):
+                self.local_index[result["index"]] = i
+                self.unfinished.add(result["index"])
+        while True:
+            with self.lock:
+                if not self.unfinished:
+                    return since
+            data = self.client.get_events(since, self.poll_timeout)
+            if data["first"] > since:
+                # Events dropped by the server, read the statuses instead
+                for index in list(self.unfinished):
+                    info = self.client.get_task(index)
+                    self.on_server_event({"event": "status", "task": index,
+                                          "status": info['status']})
+            for record in data["events"]:
+                self.on_server_event(record)
+            since = data["next"]
+
+    def on_server_event(self, record):
+        kind = record["event"]
+        if kind == "error":
+            self.emit("error", f"Job server: {record['message']}")
+            return
+        i = self.local_index.get(record.get("task"))
+        if i is None:
+            return
+        if kind == "status":
+            status = record["status"]
+            self.tasks[i]['status'] = status
+            if status in FINISHED_STATUSES:
+                with self.lock:
+                    self.unfinished.discard(record["task"])
+            self.emit("status", (i, status))
+        elif kind == "start":
+            self.emit("start", (i, record["command"]))
+        elif kind == "output":
+            self.emit("output", (i, record["line"] + "\n"))
+        elif kind == "end":
+            self.emit("end", (i, record["command"], record["returncode"]))
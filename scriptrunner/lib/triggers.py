@@ -0,0 +1,353 @@
+import os
+import re
+import math
+import time
+import select
+import datetime
+import threading
+from scriptrunner.lib.watching import FolderWatcher
+
+# Suffixes of the intervals of recurring tasks, in seconds
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+# (lowest, highest) values of the fields of a cron pattern: minute, hour,
+# day of month, month, day of week (0 or 7 is Sunday)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+# Steps tried when looking for the next time matching a cron pattern, about
+# 8 years of days, enough for patterns matching on February 29th only
+CRON_MAX_STEPS = 100000
+# Seconds a new file must stay unchanged before it is taken as complete
+SETTLE_TIME = 2.0
+# Seconds between two scans of a folder watched without inotify
+POLL_INTERVAL = 1.0
+# Seconds of inotify events gathered into one check, so a burst of files
+# is stat-ed and reported in one go
+DEBOUNCE_TIME = 0.2
+
+
+# ==============================================================================
+#                          Time Triggers
+# ==============================================================================
+
+
+def parse_start_time(value, now=None):
+    """
+    Epoch time of a task start time: epoch seconds, "YYYY-MM-DD HH:MM[:SS]"
+    (or with a "T") in local time, or "HH:MM[:SS]", the next time the clock
+    shows it. Raises ValueError if invalid.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    now = time.time() if now is None else now
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})(?::(\d{2}))?", text)
+    if match:
+        hour, minute, second = (int(part or 0) for part in match.groups())
+        if hour > 23 or minute > 59 or second > 59:
+            raise ValueError(f"Invalid start time: {text}")
+        day = datetime.datetime.fromtimestamp(now)
+        start = day.replace(hour=hour, minute=minute, second=second,
+                            microsecond=0)
+        if start.timestamp() <= now:
+            start += datetime.timedelta(days=1)
+        return start.timestamp()
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid start time (expected HH:MM or "
+                         f"YYYY-MM-DD HH:MM): {text}") from None
+
+
+def parse_interval(value):
+    """
+    Seconds of an interval: a number of seconds, or a number with an s, m,
+    h or d suffix ("90", "5m", "1.5h"). Raises ValueError if invalid or not
+    positive.
+    """
+    text = str(value).strip().lower()
+    unit = 1
+    if text[-1:] in INTERVAL_UNITS:
+        text, unit = text[:-1], INTERVAL_UNITS[text[-1]]
+    try:
+        seconds = float(text) * unit
+    except ValueError:
+        raise ValueError(f"Invalid interval: {value}") from None
+    if not seconds > 0:
+        raise ValueError(f"Interval must be positive: {value}")
+    return seconds
+
+
+def format_clock(timestamp, now=None):
+    """Local time of timestamp, with its date if not today."""
+    now = time.time() if now is None else now
+    if time.localtime(timestamp)[:3] == time.localtime(now)[:3]:
+        return time.strftime("%H:%M:%S", time.localtime(timestamp))
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+
+class CronPattern:
+    """
+    A cron pattern "minute hour day-of-month month day-of-week" in local
+    time. Each field is "*", a number, a range "a-b", a step "*/n" or
+    "a-b/n", or a comma-separated list of those. As in cron, when both days
+    are restricted a time matches either of them.
+    """
+
+    def __init__(self, text):
+        self.text = str(text).strip()
+        fields = self.text.split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron pattern (expected 5 fields): "
+                             f"{self.text}")
+        (self.minutes, self.hours, self.days, self.months,
+         self.weekdays) = [self.parse_field(field, low, high)
+                           for field, (low, high) in zip(fields, CRON_FIELDS)]
+        # Sunday is 0 or 7
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def parse_field(self, field, low, high):
+        values = set()
+        for part in field.split(","):
+            match = re.fullmatch(r"(\*|(\d+)(?:-(\d+))?)(?:/(\d+))?", part)
+            if match is None:
+                raise ValueError(f"Invalid cron field: {field}")
+            if match.group(1) == "*":
+                start, stop = low, high
+            else:
+                start = int(match.group(2))
+                stop = int(match.group(3) or start)
+            step = int(match.group(4) or 1)
+            if not low <= start <= stop <= high or step < 1:
+                raise ValueError(f"Invalid cron field: {field}")
+            if match.group(4) and match.group(2) and not match.group(3):
+                # "a/n" means from a to the highest value
+                stop = high
+            values.update(range(start, stop + 1, step))
+        return values
+
+    def match_day(self, moment):
+        day = moment.day in self.days
+        # Python counts weekdays from Monday, cron from Sunday
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, timestamp):
+        """First epoch time after timestamp matching the pattern."""
+        moment = datetime.datetime.fromtimestamp(timestamp).replace(
+            second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        for _ in range(CRON_MAX_STEPS):
+            if moment.month not in self.months:
+                month = moment.month % 12 + 1
+                moment = moment.replace(
+                    year=moment.year + (month == 1), month=month, day=1,
+                    hour=0, minute=0)
+            elif not self.match_day(moment):
+                moment = moment.replace(hour=0, minute=0) + \
+                    datetime.timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + \
+                    datetime.timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"Cron pattern never matches: {self.text}")
+
+
+def is_recurring(task):
+    return bool(task.get('every') or task.get('cron'))
+
+
+def get_first_run(task, now):
+    """
+    Epoch time of the first run of a task, from its 'at' start time, its
+    'every' interval and its 'cron' pattern, None to run it now. Raises
+    ValueError if they are invalid.
+    """
+    start = None
+    if task.get('at') not in (None, ""):
+        start = parse_start_time(task['at'], now)
+    if task.get('cron'):
+        return CronPattern(task['cron']).next_after(max(start or now, now)
+                                                    - 1e-6)
+    if task.get('every') and start is not None and start < now:
+        # Keep the phase of the recurrence
+        every = parse_interval(task['every'])
+        return start + math.ceil((now - start) / every) * every
+    if start is None or start <= now:
+        return None
+    return start
+
+
+def get_next_run(task, last_run, now):
+    """
+    Epoch time of the run of a recurring task after the one due at
+    last_run, never before now (runs missed meanwhile are skipped). None
+    if the task doesn't recur.
+    """
+    if task.get('cron'):
+        return CronPattern(task['cron']).next_after(now)
+    if task.get('every'):
+        every = parse_interval(task['every'])
+        return last_run + max(math.floor((now - last_run) / every) + 1,
+                              1) * every
+    return None
+
+
+# ==============================================================================
+#                          File Triggers
+# ==============================================================================
+
+
+def get_file_fields(path, regex=None):
+    """
+    Fields of a file used in the parameters of the script it triggers:
+    path, folder, name, stem (name without extension), number (the last
+    digits of the stem, e.g. "00042" for "scan_00042.h5", "" if none) and
+    the named groups of regex, searched in the name. None if the name
+    doesn't match regex.
+    """
+    name = os.path.basename(path)
+    stem = os.path.splitext(name)[0]
+    numbers = re.findall(r"\d+", stem)
+    fields = {"path": path, "folder": os.path.dirname(path), "name": name,
+              "stem": stem, "number": numbers[-1] if numbers else ""}
+    if regex is not None:
+        match = re.search(regex, name)
+        if match is None:
+            return None
+        fields.update(match.groupdict(default=""))
+    return fields
+
+
+def fill_params(params, fields):
+    """
+    Script parameters with their {field} placeholders replaced by the
+    fields of a file (see get_file_fields). Raises ValueError on an unknown
+    field.
+    """
+    filled = {}
+    for key, value in params.items():
+        try:
+            filled[key] = str(value).format_map(fields)
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"Invalid placeholder in {key}={value}: "
+                             f"{e}") from None
+    return filled
+
+
+class FileTrigger:
+    """
+    Watch a folder for new files matching a glob pattern and report each
+    one once it stops changing for settle seconds, i.e. once it is fully
+    written. A file is reported once, until it is removed.
+
+    Changes come from a FolderWatcher: with inotify, events are gathered
+    for debounce seconds then only the files they name are stat-ed;
+    otherwise the folder is scanned every poll_interval seconds. Files
+    settled at the same check are reported together, sorted by name, with
+    on_files(paths) called from the watching thread, so a burst of
+    hundreds of files costs a few calls. With existing, the files already
+    there are reported too.
+    """
+
+    def __init__(self, folder, pattern, on_files, settle=SETTLE_TIME,
+                 poll_interval=POLL_INTERVAL, debounce=DEBOUNCE_TIME,
+                 existing=False, use_inotify=True):
+        self.folder = os.path.abspath(folder)
+        self.on_files = on_files
+        self.settle = max(float(settle), 0.0)
+        self.poll_interval = max(float(poll_interval), 0.01)
+        self.debounce = max(float(debounce), 0.0)
+        self.existing = existing
+        self.watcher = FolderWatcher(self.folder, pattern, use_inotify)
+        # {name: (stat, monotonic time of its last change)} of the files not
+        # settled yet, and the names of those already reported
+        self.pending = {}
+        self.reported = set()
+        self.closed = threading.Event()
+        self.thread = None
+
+    @property
+    def uses_inotify(self):
+        return self.watcher.uses_inotify
+
+    def start(self):
+        """Take the current files as known and watch in the background."""
+        names = self.watcher.reset()
+        if self.existing:
+            now = time.monotonic()
+            for name in names:
+                self.pending[name] = (self.watcher.entries[name], now)
+        else:
+            self.reported.update(names)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.closed.is_set():
+            timeout = self.poll_interval
+            if self.pending:
+                first = min(changed for _, changed in self.pending.values())
+                timeout = min(max(first + self.settle - time.monotonic(),
+                                  0.0), timeout)
+            self.wait_changes(timeout)
+            if self.closed.is_set():
+                break
+            paths = self.check()
+            if paths:
+                self.on_files(paths)
+
+    def wait_changes(self, timeout):
+        inotify = self.watcher.inotify
+        if inotify is None:
+            self.closed.wait(timeout)
+            return
+        try:
+            readable, _, _ = select.select([inotify], [], [], timeout)
+        except (OSError, TypeError, ValueError):
+            # Closed meanwhile
+            return
+        if readable:
+            self.closed.wait(self.debounce)
+
+    def check(self):
+        """
+        Take the changes of the folder, return the paths of the files
+        settled since the last check.
+        """
+        added, removed, modified = self.watcher.poll()
+        now = time.monotonic()
+        for name in removed:
+            self.pending.pop(name, None)
+            self.reported.discard(name)
+        for name in added + modified:
+            if name not in self.reported:
+                self.pending[name] = (self.watcher.entries[name], now)
+        settled = []
+        for name, (stat, changed) in list(self.pending.items()):
+            if now - changed < self.settle:
+                continue
+            # Changes may not be seen yet (e.g. between two scans)
+            current = self.watcher.stat_file(name)
+            if current is None:
+                del self.pending[name]
+            elif current != stat:
+                self.pending[name] = (current, now)
+            else:
+                del self.pending[name]
+                self.reported.add(name)
+                settled.append(name)
+        return [os.path.join(self.folder, name) for name in sorted(settled)]
+
+    def close(self):
+        """Stop watching."""
+        self.closed.set()
+        if self.thread is not None:
+            self.thread.join(self.poll_interval + 1.0)
+            self.thread = None
+        self.watcher.close()
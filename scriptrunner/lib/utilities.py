@@ -1,7 +1,15 @@
 import os
+import re
+import sys
 import ast
+import fnmatch
 import platform
 import json
+import mmap
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
 
 # ==============================================================================
 #                          Configuration & Constants
@@ -27,10 +35,28 @@ PATH_COLOR = "#0055aa"
 LINE_NUM_BG = "#e0e0e0"
 LINE_NUM_FG = "#555555"
 
+# Maximum number of GUI messages handled per event-loop tick
+MAX_MESSAGES_PER_TICK = 500
+
 STATUS_PENDING = "Pending"
 STATUS_RUNNING = "Running..."
 STATUS_DONE = "Done"
 STATUS_FAILED = "Failed"
+STATUS_SKIPPED = "Skipped"
+STATUS_SUSPENDED = "Suspended"
+STATUS_CANCELLED = "Cancelled"
+STATUS_PREEMPTED = "Preempted"
+STATUS_SCHEDULED = "Scheduled"
+
+# Folders never searched for scripts
+IGNORE_DIRS = ("__pycache__", ".git", ".hg", ".svn", ".tox", ".nox",
+               ".venv", "venv", ".mypy_cache", ".pytest_cache", ".idea",
+               "node_modules", "*.egg-info")
+# Per-folder .gitignore-style file of patterns to skip
+IGNORE_FILE = ".scriptrunnerignore"
+
+# Token every script with an add_argument call contains
+ARGPARSE_TOKEN = b"add_argument"
 
 TYPE_MAP = {
     "str": str,
@@ -45,39 +71,367 @@ TYPE_MAP = {
 # ==============================================================================
 
 
-def find_possible_scripts(folder):
+def find_possible_scripts(folder, recursive=False, max_depth=None,
+                          ignore_patterns=None):
     if not os.path.isdir(folder):
         return []
-    return [f for f in os.listdir(folder) if f.endswith('.py')]
+    return list(iter_possible_scripts(folder, recursive, max_depth,
+                                      ignore_patterns))
+
+
+def gitignore_to_regex(pattern):
+    """
+    Translate a .gitignore-style pattern into a regex matched against
+    "/"-separated paths relative to the base folder.
+
+    Returns (regex, negate, dir_only). Patterns with a "/" (other than a
+    trailing one) are anchored to the base folder, others match at any
+    level. "*" and "?" don't cross "/", "**" does.
+    """
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    # Before stripping, so that "/build/" stays anchored
+    anchored = "/" in pattern.rstrip("/")
+    pattern = pattern.strip("/")
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                chars = pattern[i + 1:end].replace("\\", "\\\\")
+                if chars.startswith("!"):
+                    chars = "^" + chars[1:]
+                regex += "[" + chars + "]"
+                i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(prefix + regex + "$"), negate, dir_only
+
+
+def compile_ignore_patterns(patterns):
+    """
+    Compile .gitignore-style lines, skipping blanks and comments.
+    """
+    rules = []
+    for line in patterns or []:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            rules.append(gitignore_to_regex(line))
+    return rules
+
+
+def load_ignore_patterns(folder):
+    """
+    Read the ignore file of a base folder, if any.
+    """
+    try:
+        with open(os.path.join(folder, IGNORE_FILE), "r") as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+
+def is_ignored(rel_path, is_dir, rules):
+    """
+    Apply compiled rules in order, the last matching one wins.
+    """
+    ignored = False
+    for regex, negate, dir_only in rules:
+        if dir_only and not is_dir:
+            continue
+        if regex.match(rel_path):
+            ignored = not negate
+    return ignored
+
+
+def is_virtualenv(path):
+    return (os.path.exists(os.path.join(path, "pyvenv.cfg"))
+            or os.path.isdir(os.path.join(path, "conda-meta")))
 
 
-def get_script_arguments(script_path):
+def iter_script_entries(folder, recursive=False, max_depth=None,
+                        ignore_patterns=None, pattern="*.py"):
+    """
+    Walk a folder with os.scandir and yield (relative_path, DirEntry) of
+    files matching a glob pattern, lazily so the first results are
+    available at once.
+
+    Parameters
+    ----------
+    folder : str
+        Base folder.
+    recursive : bool
+        Descend into subfolders. Relative paths use "/" as separator.
+    max_depth : int or None
+        Maximum subfolder depth, 0 is the base folder only.
+    ignore_patterns : list of str
+        .gitignore-style patterns. Folders in IGNORE_DIRS and virtual
+        environments are always skipped without being listed.
+    pattern : str
+        Glob pattern on file names.
+    """
+    rules = compile_ignore_patterns(ignore_patterns)
+    stack = [("", 0)]
+    while stack:
+        rel_dir, depth = stack.pop()
+        try:
+            with os.scandir(os.path.join(folder, rel_dir)) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        sub_dirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                is_file = not is_dir and entry.is_file()
+            except OSError:
+                continue
+            if is_dir:
+                if not recursive or (max_depth is not None
+                                     and depth >= max_depth):
+                    continue
+                if any(fnmatch.fnmatchcase(entry.name, name)
+                       for name in IGNORE_DIRS):
+                    continue
+                if is_ignored(rel_path, True, rules) \
+                        or is_virtualenv(entry.path):
+                    continue
+                sub_dirs.append((rel_path, depth + 1))
+            elif is_file and fnmatch.fnmatchcase(entry.name, pattern):
+                if not is_ignored(rel_path, False, rules):
+                    yield rel_path, entry
+        stack.extend(reversed(sub_dirs))
+
+
+def iter_possible_scripts(folder, recursive=False, max_depth=None,
+                          ignore_patterns=None):
+    """
+    Yield relative paths of the .py files of a folder, see
+    iter_script_entries.
+    """
+    for rel_path, _ in iter_script_entries(folder, recursive, max_depth,
+                                           ignore_patterns):
+        yield rel_path
+
+
+def get_dest(flags):
+    """
+    Attribute name argparse derives from the flags of an argument: the
+    first long option, else the first short option, else the positional
+    name, with dashes replaced by underscores.
+    """
+    long_flags = [f for f in flags if f.startswith("--")]
+    name = (long_flags or flags)[0].lstrip("-")
+    return name.replace("-", "_")
+
+
+def parse_bool(value):
+    """
+    Interpret a parameter string such as "True", "yes", "1" or "off".
+    """
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "y", "on"):
+        return True
+    if text in ("", "0", "false", "no", "n", "off", "none"):
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+
+class ArgumentSpec:
+    """
+    One add_argument call of a script. Unpacks and indexes like the tuple
+    (raw_flag, clean_name, help_text, arg_type, required, default_value);
+    dest, choices, nargs and action are available as attributes.
+    """
+    __slots__ = ("raw_flag", "clean_name", "help_text", "arg_type",
+                 "required", "default_value", "dest", "choices", "nargs",
+                 "action")
+
+    def __init__(self, raw_flag, clean_name, help_text="", arg_type=str,
+                 required=False, default_value=None, dest=None, choices=None,
+                 nargs=None, action="store"):
+        self.raw_flag = raw_flag
+        self.clean_name = clean_name
+        self.help_text = help_text
+        self.arg_type = arg_type
+        self.required = required
+        self.default_value = default_value
+        self.dest = dest if dest is not None else get_dest([raw_flag])
+        self.choices = choices
+        self.nargs = nargs
+        self.action = action
+
+    @property
+    def is_positional(self):
+        return not self.raw_flag.startswith("-")
+
+    def as_tuple(self):
+        return (self.raw_flag, self.clean_name, self.help_text, self.arg_type,
+                self.required, self.default_value)
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __iter__(self):
+        return iter(self.as_tuple())
+
+    def __getitem__(self, index):
+        return self.as_tuple()[index]
+
+    def __len__(self):
+        return len(self.as_tuple())
+
+    def __eq__(self, other):
+        if isinstance(other, ArgumentSpec):
+            return self.values() == other.values()
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ArgumentSpec{self.values()!r}"
+
+    def __reduce__(self):
+        return self.__class__, self.values()
+
+    def to_json(self):
+        values = list(self.values())
+        values[3] = self.arg_type.__name__
+        return values
+
+    @classmethod
+    def from_json(cls, values):
+        values = list(values)
+        values[3] = TYPE_MAP.get(values[3], str)
+        return cls(*values)
+
+
+class ScriptSpec:
+    """
+    Parsed arguments of a script. Unpacks as (arguments, has_argparse) and
+    holds clean_name -> flag and clean_name -> type dicts so building a
+    command is linear in the number of parameters.
+    """
+    __slots__ = ("arguments", "has_argparse", "flags", "types", "by_name")
+
+    def __init__(self, arguments=(), has_argparse=False):
+        self.arguments = tuple(arguments)
+        self.has_argparse = has_argparse
+        self.by_name = {}
+        for arg in self.arguments:
+            self.by_name.setdefault(arg.clean_name, arg)
+        self.flags = {name: arg.raw_flag for name, arg in self.by_name.items()}
+        self.types = {name: arg.arg_type for name, arg in self.by_name.items()}
+
+    def __iter__(self):
+        return iter((self.arguments, self.has_argparse))
+
+    def __getitem__(self, index):
+        return (self.arguments, self.has_argparse)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, ScriptSpec):
+            return (self.arguments == other.arguments
+                    and self.has_argparse == other.has_argparse)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ScriptSpec({list(self.arguments)!r}, {self.has_argparse!r})"
+
+    def __reduce__(self):
+        return self.__class__, (self.arguments, self.has_argparse)
+
+    def build_argv(self, params):
+        """
+        Convert {clean_name: value} parameters into command-line arguments.
+        Empty values are skipped, unknown names are passed as --name.
+        Flag actions (store_true, store_false, count) only emit the flag,
+        values of nargs arguments are split on whitespace. Raises ValueError
+        if a value doesn't convert to its declared type or choices.
+        """
+        argv = []
+        for clean_name, val in params.items():
+            if not val:
+                continue
+            arg = self.by_name.get(clean_name)
+            if arg is None:
+                argv.extend([f"--{clean_name}", val])
+                continue
+            action = arg.action
+            try:
+                if action in ("store_true", "store_false"):
+                    if parse_bool(val) == (action == "store_true"):
+                        argv.append(arg.raw_flag)
+                    continue
+                if action == "count":
+                    argv.extend([arg.raw_flag] * int(val))
+                    continue
+                values = [val]
+                if arg.nargs not in (None, "?") or action == "extend":
+                    values = val.split()
+                for value in values:
+                    converted = arg.arg_type(value)
+                    if arg.choices and converted not in arg.choices \
+                            and value not in arg.choices:
+                        raise ValueError
+            except Exception:
+                raise ValueError(f"Invalid param {clean_name}={val}")
+            if not arg.is_positional:
+                argv.append(arg.raw_flag)
+            argv.extend(values)
+        return argv
+
+    def to_json(self):
+        return {"arguments": [arg.to_json() for arg in self.arguments],
+                "has_argparse": self.has_argparse}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls([ArgumentSpec.from_json(values)
+                    for values in data["arguments"]], data["has_argparse"])
+
+
+def parse_script_arguments(source, script_path="<script>"):
     """
     Inspect a script's argparse.ArgumentParser.add_argument calls.
 
     Returns:
-        (arguments, has_argparse)
+        ScriptSpec, which unpacks as (arguments, has_argparse)
 
     where:
-        arguments   list of (raw_flag, clean_name, help_text, arg_type,
-                    required, default_value) or empty if no
+        arguments   tuple of ArgumentSpec (raw_flag, clean_name, help_text,
+                    arg_type, required, default_value) or empty if no
                     argparse.add_argument was found.
 
         has_argparse = True  if we detected at least one .add_argument call
                        False if no argparse usage was detected (or parse failed)
     """
-    try:
-        with open(script_path, "r", encoding="utf-8") as f:
-            source = f.read()
-    except Exception as e:
-        print(f"Error reading {script_path}: {e}")
-        return [], False
-
     try:
         tree = ast.parse(source, filename=script_path)
     except SyntaxError as e:
         print(f"Syntax error parsing {script_path}: {e}")
-        return [], False
+        return ScriptSpec()
 
     arguments = []
     has_argparse = False
@@ -134,9 +488,308 @@ def get_script_arguments(script_path):
             except Exception:
                 # Fallback: string repr for non-literal defaults
                 default_value = None
-        arguments.append((raw_flag, clean_name, help_text, arg_type,
-                          required, default_value))
-    return arguments, has_argparse
+        # dest, choices, nargs, action (literal values only)
+        dest = get_dest(flags)
+        choices = None
+        nargs = None
+        action = "store"
+        for key in ("dest", "choices", "nargs", "action"):
+            if key not in kw_map:
+                continue
+            try:
+                value = ast.literal_eval(kw_map[key])
+            except Exception:
+                continue
+            if key == "dest" and isinstance(value, str):
+                dest = value
+            elif key == "choices" and isinstance(value, (list, tuple, set)):
+                choices = list(value)
+            elif key == "nargs" and isinstance(value, (int, str)):
+                nargs = value
+            elif key == "action" and isinstance(value, str):
+                action = value
+        if action in ("store_true", "store_false"):
+            arg_type = bool
+            if default_value is None:
+                default_value = action == "store_false"
+        arguments.append(ArgumentSpec(raw_flag, clean_name, help_text,
+                                      arg_type, required, default_value,
+                                      dest, choices, nargs, action))
+    return ScriptSpec(arguments, has_argparse)
+
+
+def get_cache_path(file_name="script_args_cache.json"):
+    """
+    Get path to an on-disk cache file, e.g. parsed script arguments. It lives
+    next to the config file.
+    """
+    return os.path.join(os.path.dirname(get_config_path()), file_name)
+
+
+class ScriptArgumentCache:
+    """
+    In-memory and on-disk cache of parsed script arguments (ScriptSpec).
+
+    Entries are keyed on the absolute script path and validated against the
+    file size, mtime (ns) and a content hash: if size and mtime are unchanged
+    the cached result is returned without reading the file; otherwise the
+    file is read and hashed, and only re-parsed if its content changed.
+    An optional variant string (e.g. an interpreter path) keeps several
+    specs per script.
+    """
+    version = 3
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.loaded = False
+        self.dirty = False
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _key(script_path, variant=""):
+        path = os.path.abspath(script_path)
+        return f"{variant}|{path}" if variant else path
+
+    def _get_path(self):
+        if self.cache_path is None:
+            self.cache_path = get_cache_path()
+        return self.cache_path
+
+    def load(self):
+        """
+        Load cached entries from disk. A missing or corrupt cache file is
+        ignored.
+        """
+        with self.lock:
+            self.loaded = True
+            try:
+                with open(self._get_path(), "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return
+            if not isinstance(data, dict) or \
+                    data.get("version") != self.version:
+                return
+            for path, entry in data.get("entries", {}).items():
+                try:
+                    self.entries[path] = {
+                        "size": entry["size"], "mtime_ns": entry["mtime_ns"],
+                        "digest": entry["digest"],
+                        "spec": ScriptSpec.from_json(entry["spec"])}
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+    def save(self):
+        """
+        Write the cache to disk if it changed since the last save.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = {}
+            for path, entry in self.entries.items():
+                record = dict(entry, spec=entry["spec"].to_json())
+                try:
+                    json.dumps(record)
+                except (TypeError, ValueError):
+                    # Non-JSON defaults (sets, bytes...) stay in memory only
+                    continue
+                entries[path] = record
+            data = {"version": self.version, "entries": entries}
+            cache_path = self._get_path()
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                tmp_path = cache_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, cache_path)
+                self.dirty = False
+            except OSError as e:
+                print(f"Error saving argument cache {cache_path}: {e}")
+
+    def invalidate(self, script_path=None):
+        """
+        Drop the entries of a script, or all entries if no path is given.
+        """
+        with self.lock:
+            if script_path is None:
+                if self.entries:
+                    self.entries.clear()
+                    self.dirty = True
+                return
+            path = os.path.abspath(script_path)
+            for key in list(self.entries):
+                if key == path or key.endswith("|" + path):
+                    del self.entries[key]
+                    self.dirty = True
+
+    def lookup(self, script_path, variant=""):
+        """
+        Return the cached ScriptSpec of a script if its size and mtime still
+        match, else None.
+        """
+        path = os.path.abspath(script_path)
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            entry = self.entries.get(self._key(path, variant))
+            if entry is None:
+                return None
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.invalidate(path)
+                return None
+            if entry["size"] == stat.st_size \
+                    and entry["mtime_ns"] == stat.st_mtime_ns:
+                return entry["spec"]
+            return None
+
+    def known_digest(self, script_path, variant=""):
+        """
+        Return the content hash of the cached entry of a script, if any.
+        """
+        with self.lock:
+            entry = self.entries.get(self._key(script_path, variant))
+            return None if entry is None else entry["digest"]
+
+    def store(self, script_path, scanned, variant=""):
+        """
+        Store a result of scan_script_file. If the scan found the content
+        unchanged (spec is None), only the stat of the entry is updated.
+        Returns the ScriptSpec, or None if an unparsed result no longer
+        matches any entry.
+        """
+        key = self._key(script_path, variant)
+        with self.lock:
+            entry = self.entries.get(key)
+            if scanned["spec"] is None:
+                if entry is None or entry["digest"] != scanned["digest"]:
+                    return None
+                entry["size"] = scanned["size"]
+                entry["mtime_ns"] = scanned["mtime_ns"]
+            else:
+                entry = dict(scanned)
+                self.entries[key] = entry
+            self.dirty = True
+            return entry["spec"]
+
+    def get(self, script_path):
+        """
+        Return the ScriptSpec of a script, parsing it only if it is not
+        cached or its content changed.
+        """
+        spec = self.lookup(script_path)
+        if spec is not None:
+            return spec
+        scanned = scan_script_file(script_path,
+                                   self.known_digest(script_path))
+        if scanned is None:
+            self.invalidate(script_path)
+            return ScriptSpec()
+        spec = self.store(script_path, scanned)
+        if spec is None:
+            scanned = scan_script_file(script_path)
+            if scanned is None:
+                return ScriptSpec()
+            spec = self.store(script_path, scanned)
+        return spec
+
+
+def has_argparse_tokens(script_file):
+    """
+    Cheap first-stage check on an open binary file: memory-map it and look
+    for the add_argument token. A script without it can't have any
+    add_argument call, so it is rejected without being read or parsed.
+    """
+    try:
+        with mmap.mmap(script_file.fileno(), 0,
+                       access=mmap.ACCESS_READ) as mapped:
+            return mapped.find(ARGPARSE_TOKEN) != -1
+    except (OSError, ValueError):
+        # Empty files can't be mapped, some file systems don't support it
+        script_file.seek(0)
+        return ARGPARSE_TOKEN in script_file.read()
+
+
+def scan_script_file(script_path, known_digest=None):
+    """
+    Read, hash and parse a script.
+
+    Returns a dict with size, mtime_ns, digest and spec (ScriptSpec), or
+    None if the file can't be read. Files failing has_argparse_tokens are
+    returned with an empty spec and no digest, without being parsed. If the
+    content hash equals known_digest the parse is skipped and spec is None.
+    Being a plain module-level function, it can be run in a worker process.
+    """
+    try:
+        with open(script_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            scanned = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                       "digest": None, "spec": ScriptSpec()}
+            if not has_argparse_tokens(f):
+                return scanned
+            f.seek(0)
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+        scanned["digest"] = digest
+        if digest == known_digest:
+            scanned["spec"] = None
+            return scanned
+        source = data.decode("utf-8")
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Error reading {script_path}: {e}")
+        return None
+    scanned["spec"] = parse_script_arguments(source, script_path)
+    return scanned
+
+
+ARGUMENT_CACHE = ScriptArgumentCache()
+
+
+def get_script_arguments(script_path, use_cache=True):
+    """
+    Get the ScriptSpec of a script, see parse_script_arguments. Results
+    are served from ARGUMENT_CACHE unless use_cache is False.
+    """
+    if use_cache:
+        return ARGUMENT_CACHE.get(script_path)
+    scanned = scan_script_file(script_path)
+    if scanned is None:
+        return ScriptSpec()
+    return scanned["spec"]
+
+
+def save_argument_cache():
+    """
+    Persist the argument cache so the next session can reuse it.
+    """
+    ARGUMENT_CACHE.save()
+
+
+def resolve_interpreter(script_path, manual_path=""):
+    """
+    Pick the interpreter to run a script with: a valid manual path first,
+    then the script's shebang, then the current interpreter.
+
+    Returns (interpreter_path, source_description).
+    """
+    manual_path = manual_path.strip()
+    if manual_path:
+        if os.path.exists(manual_path) and os.path.isfile(manual_path):
+            return manual_path, "Manual Entry"
+    try:
+        with open(script_path, 'r') as f:
+            first_line = f.readline().strip()
+            if first_line.startswith("#!"):
+                potential_path = first_line[2:].strip()
+                if os.path.exists(potential_path) and os.path.isfile(
+                        potential_path):
+                    return potential_path, "Script Shebang (#!)"
+    except Exception:
+        pass
+    return sys.executable, "System Default"
 
 
 def save_config(data):
@@ -174,3 +827,55 @@ def load_config():
             return json.load(f)
     except FileNotFoundError:
         return None
+
+
+class StartupProfile:
+    """
+    Record how long startup steps take (--profile-startup). Does nothing
+    until enabled. Times are measured from the enable() call.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start_time = 0.0
+        self.steps = []
+        self.reported = False
+
+    def enable(self):
+        self.enabled = True
+        self.start_time = time.perf_counter()
+
+    @contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, t0 - self.start_time,
+                               time.perf_counter() - t0))
+
+    def mark(self, name):
+        """Record a point in time, e.g. the first frame drawn."""
+        if self.enabled:
+            self.steps.append((name, time.perf_counter() - self.start_time,
+                               None))
+
+    def report(self):
+        """Print the recorded steps, once."""
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        print("\n" + "=" * 52)
+        print(f"{'Startup step':<28}{'at (ms)':>10}{'took (ms)':>14}")
+        print("-" * 52)
+        for name, offset, duration in sorted(self.steps,
+                                             key=lambda step: step[1]):
+            took = "" if duration is None else f"{duration * 1000:.1f}"
+            print(f"{name:<28}{offset * 1000:>10.1f}{took:>14}")
+        print("=" * 52 + "\n")
+
+
+STARTUP_PROFILE = StartupProfile()
@@ -0,0 +1,224 @@
+import os
+import sys
+import struct
+import ctypes
+import ctypes.util
+import fnmatch
+from stat import S_ISREG
+import scriptrunner.lib.utilities as util
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+              | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+              | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+# ==============================================================================
+#                          Folder Watching
+# ==============================================================================
+
+
+class InotifyWatch:
+    """
+    Non-blocking inotify watch on a single folder (Linux only).
+
+    Raises OSError if inotify is not available.
+    """
+
+    def __init__(self, folder):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed on {folder}")
+
+    def fileno(self):
+        return self.fd
+
+    def read_changes(self):
+        """
+        Drain pending events. Returns (names, overflow) where names is the
+        set of changed file names and overflow is True if events were lost
+        (queue overflow, watched folder moved or deleted).
+        """
+        names = set()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & (IN_Q_OVERFLOW | IN_IGNORED | IN_DELETE_SELF
+                           | IN_MOVE_SELF):
+                    overflow = True
+                elif name:
+                    names.add(os.fsdecode(name))
+        return names, overflow
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class FolderWatcher:
+    """
+    Keep a stat snapshot (size, mtime_ns) of the files of a folder matching
+    a glob pattern and report what changed since the last check.
+
+    With inotify, only the files named in events are stat-ed, so a check
+    costs nothing when nothing changed. Otherwise, the folder is re-listed
+    with os.scandir and diffed against the snapshot. Recursive watchers
+    (see util.iter_script_entries) always use the scandir fallback.
+    """
+
+    def __init__(self, folder, pattern="*.py", use_inotify=True,
+                 recursive=False, max_depth=None, ignore_patterns=None):
+        self.folder = os.path.abspath(folder)
+        self.pattern = pattern
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.ignore_patterns = ignore_patterns
+        self.ignore_rules = util.compile_ignore_patterns(ignore_patterns)
+        self.entries = {}
+        # False until a snapshot is fully taken (see iter_reset)
+        self.complete = False
+        self.inotify = None
+        if use_inotify and not recursive:
+            try:
+                self.inotify = InotifyWatch(self.folder)
+            except (OSError, AttributeError):
+                self.inotify = None
+
+    @property
+    def uses_inotify(self):
+        return self.inotify is not None
+
+    def matches(self, name):
+        """Whether a file name is listed by a scan (see iter_scan)."""
+        return (fnmatch.fnmatchcase(name, self.pattern)
+                and not util.is_ignored(name, False, self.ignore_rules))
+
+    def stat_file(self, name):
+        try:
+            stat = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return None
+        if not S_ISREG(stat.st_mode):
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def iter_scan(self, entries):
+        """
+        Fill entries with the current stat of matching files, yielding each
+        name as soon as it is found.
+        """
+        for rel_path, entry in util.iter_script_entries(
+                self.folder, self.recursive, self.max_depth,
+                self.ignore_patterns, self.pattern):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries[rel_path] = (stat.st_size, stat.st_mtime_ns)
+            yield rel_path
+
+    def scan(self):
+        entries = {}
+        for _ in self.iter_scan(entries):
+            pass
+        return entries
+
+    def iter_reset(self):
+        """
+        Take a new snapshot, yielding matching file names as they are found.
+        The snapshot is swapped in once the generator is exhausted; until
+        then, e.g. if it is abandoned, complete is False and poll() results
+        are not reliable.
+        """
+        self.complete = False
+        if self.inotify is not None:
+            self.inotify.read_changes()
+        entries = {}
+        yield from self.iter_scan(entries)
+        self.entries = entries
+        self.complete = True
+
+    def reset(self):
+        """
+        Take a new snapshot and return the matching file names.
+        """
+        return list(self.iter_reset())
+
+    def _apply(self, new_entries, names):
+        added, removed, modified = [], [], []
+        for name in names:
+            old = self.entries.get(name)
+            new = new_entries.get(name)
+            if old == new:
+                continue
+            if old is None:
+                added.append(name)
+                self.entries[name] = new
+            elif new is None:
+                removed.append(name)
+                del self.entries[name]
+            else:
+                modified.append(name)
+                self.entries[name] = new
+        return sorted(added), sorted(removed), sorted(modified)
+
+    def poll(self):
+        """
+        Return (added, removed, modified) file names since the last check
+        and update the snapshot.
+        """
+        if self.inotify is not None:
+            names, overflow = self.inotify.read_changes()
+            if not overflow:
+                names = [name for name in names if self.matches(name)]
+                new_entries = {}
+                for name in names:
+                    stat = self.stat_file(name)
+                    if stat is not None:
+                        new_entries[name] = stat
+                return self._apply(new_entries, names)
+            # Events were lost or the watch is gone, re-arm it
+            self.close()
+            try:
+                self.inotify = InotifyWatch(self.folder)
+            except OSError:
+                self.inotify = None
+        new_entries = self.scan()
+        return self._apply(new_entries, set(self.entries) | set(new_entries))
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
@@ -1,8 +1,14 @@
 import os
+import re
+import sys
+import json
+import time
+import signal
 import argparse
 from scriptrunner.lib import utilities as util
-from scriptrunner.lib.interactions import ScriptRunnerInteractions
 from scriptrunner import __version__
+from scriptrunner.lib.processes import STOP_GRACE_PERIODS
+from scriptrunner.lib.triggers import SETTLE_TIME, POLL_INTERVAL
 
 
 display_msg = """
@@ -15,6 +21,12 @@ display_msg = """
 ===============================================================================
 """
 
+# Subcommands running scripts without the GUI (no tkinter import)
+HEADLESS_COMMANDS = ("run", "run-queue", "serve", "watch", "submit",
+                     "status", "cancel", "agent")
+# Subcommands talking to a job server
+CLIENT_COMMANDS = ("submit", "status", "cancel")
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -26,11 +38,520 @@ def parse_args():
                         help="Specify the type of python script: 'cli' or 'all'")
     parser.add_argument("-b", "--base", type=str, default=None,
                         help="Specify the base folder")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Search scripts in subfolders of the base folder")
+    parser.add_argument("-d", "--depth", type=int, default=None,
+                        help="Maximum subfolder depth of the recursive search")
+    parser.add_argument("-i", "--introspect", action="store_true",
+                        help="Get script arguments by running each script's "
+                             "interpreter up to its parse_args call")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print the time spent in each startup step")
+    parser.add_argument("--server", type=str, default=None,
+                        metavar="ADDRESS", nargs="?", const="",
+                        help="Run the queue on a job server (scriptrunner "
+                             "serve), at a socket path or [HOST:]PORT "
+                             "(default: the default socket)")
+    parser.add_argument("--agents", type=str, default=None,
+                        metavar="[HOST:]PORT",
+                        help="Run the queue scripts on worker agents "
+                             "(scriptrunner agent) connecting to this "
+                             "address")
+    parser.add_argument("--batch", type=str, default=None,
+                        choices=["slurm", "shim"],
+                        help="Run the queue scripts as jobs of a batch "
+                             "system (shim: local stand-in for testing)")
     parser.add_argument("path", type=str, nargs='?', default=None,
                         help="Specify the base folder (positional alternative)")
     return parser.parse_args()
 
 
+def parse_headless_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="scriptrunner",
+        description="Run scripts or a queue file without the GUI. Progress "
+                    "is written as JSON lines.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-n", "--iterations", type=int, default=1,
+                        help="Number of runs (of the script or whole queue)")
+    common.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Maximum number of script tasks running at once")
+    common.add_argument("--cores", type=int, default=None,
+                        help="Cores shared by the task reservations (default: "
+                             "all usable cores)")
+    common.add_argument("--memory", type=float, default=None,
+                        help="RAM in GB shared by the task reservations "
+                             "(default: physical memory)")
+    common.add_argument("--timeout", type=float, default=0,
+                        help="Kill a script run after this many seconds "
+                             "(default: no timeout)")
+    common.add_argument("--retries", type=int, default=0,
+                        help="Retry a failed script run up to this many "
+                             "times")
+    common.add_argument("--backoff", type=float, default=1.0,
+                        help="Seconds before the first retry, doubling for "
+                             "each next one")
+    common.add_argument("--retry-codes", type=int, nargs="+", default=[],
+                        metavar="CODE",
+                        help="Exit codes to retry (default: any non-zero)")
+    common.add_argument("--grace", type=float, nargs=2,
+                        default=list(STOP_GRACE_PERIODS),
+                        metavar=("INT_S", "TERM_S"),
+                        help="Seconds given to stopped scripts after SIGINT "
+                             "and after SIGTERM, before SIGKILL")
+    common.add_argument("--preempt", type=str, default=None,
+                        choices=["suspend", "requeue"],
+                        help="Make room for a ready task of higher priority "
+                             "by freezing running tasks of lower priority "
+                             "(suspend) or by stopping and requeuing them")
+    common.add_argument("--agents", type=str, default=None,
+                        metavar="[HOST:]PORT",
+                        help="Run the scripts on worker agents (scriptrunner "
+                             "agent) connecting to this address, e.g. "
+                             "0.0.0.0:8766 for agents on other hosts")
+    common.add_argument("--agent-token", type=str,
+                        default=os.environ.get("SCRIPTRUNNER_AGENT_TOKEN"),
+                        help="Token the agents must give (default: "
+                             "$SCRIPTRUNNER_AGENT_TOKEN)")
+    common.add_argument("--batch", type=str, default=None,
+                        choices=["slurm", "shim"],
+                        help="Submit the scripts as jobs of a batch system, "
+                             "sweeps as job arrays (shim: local stand-in of "
+                             "sbatch/squeue/scancel for testing)")
+    common.add_argument("--batch-option", type=str, action="append",
+                        default=[], metavar="ARG",
+                        help="Extra sbatch option, e.g. --batch-option="
+                             "--partition=short (repeatable)")
+    common.add_argument("--batch-dir", type=str, default=None,
+                        help="Folder of the job scripts and output files, "
+                             "seen by the compute nodes (default: in the "
+                             "config folder)")
+    common.add_argument("-e", "--interpreter", type=str, default="",
+                        help="Python interpreter used to run the scripts")
+    common.add_argument("-i", "--introspect", action="store_true",
+                        help="Get script arguments by introspection")
+    common.add_argument("-o", "--output", type=str, default=None,
+                        help="Write the progress lines to this file instead "
+                             "of stdout")
+
+    timing = argparse.ArgumentParser(add_help=False)
+    timing.add_argument("--at", type=str, default=None,
+                        metavar="TIME",
+                        help="Start the script at this local time, "
+                             "'HH:MM[:SS]' or 'YYYY-MM-DD HH:MM'")
+    timing.add_argument("--every", type=str, default=None,
+                        metavar="INTERVAL",
+                        help="Run the script again at this interval, e.g. "
+                             "'30s', '5m', '2h', until stopped")
+    timing.add_argument("--cron", type=str, default=None,
+                        metavar="PATTERN",
+                        help="Run the script at the times of this cron "
+                             "pattern, e.g. '0 2 * * *', until stopped")
+
+    run_parser = subparsers.add_parser("run", parents=[common, timing],
+                                       help="Run a single script")
+    run_parser.add_argument("script", type=str, help="Path to the script")
+    run_parser.add_argument("-p", "--param", action="append", default=[],
+                            metavar="NAME=VALUE",
+                            help="Script argument, by its name as shown in "
+                                 "the GUI (repeatable)")
+    run_parser.add_argument("--sweep", choices=("product", "zip"),
+                            default=None,
+                            help="Run the script over the parameters given "
+                                 "as '[a, b, c]' or 'range(start, stop, "
+                                 "step)', combining them as a product or "
+                                 "zip")
+    run_parser.add_argument("--parallel", type=int, default=0,
+                            help="Sweep points running at once (default: "
+                                 "--jobs)")
+
+    queue_parser = subparsers.add_parser("run-queue", parents=[common],
+                                         help="Run a queue file")
+    queue_parser.add_argument("queue", type=str,
+                              help="JSON queue file (list of tasks or "
+                                   "{folder, iterations, tasks})")
+    queue_parser.add_argument("-b", "--base", type=str, default=None,
+                              help="Folder of the scripts, overriding the "
+                                   "queue file")
+
+    watch_parser = subparsers.add_parser(
+        "watch", parents=[common],
+        help="Run a script on each new file of a folder, once written")
+    watch_parser.add_argument("folder", type=str,
+                              help="Folder where the files arrive")
+    watch_parser.add_argument("script", type=str,
+                              help="Script run for each new file")
+    watch_parser.add_argument("-g", "--glob", type=str, default="*",
+                              help="Pattern of the file names (default: all)")
+    watch_parser.add_argument("-p", "--param", action="append", default=[],
+                              metavar="NAME=VALUE",
+                              help="Script argument (repeatable). {path}, "
+                                   "{folder}, {name}, {stem}, {number} (last "
+                                   "digits of the name) and the groups of "
+                                   "--regex are those of the file, e.g. -p "
+                                   "scan={number}")
+    watch_parser.add_argument("--regex", type=str, default=None,
+                              help="Only take the files whose name matches, "
+                                   "e.g. 'scan_(?P<scan>\\d+)', its named "
+                                   "groups filling {scan}")
+    watch_parser.add_argument("--settle", type=float, default=SETTLE_TIME,
+                              help="Seconds a file must stay unchanged "
+                                   "before its script runs")
+    watch_parser.add_argument("--poll", type=float, default=POLL_INTERVAL,
+                              help="Seconds between folder scans without "
+                                   "inotify")
+    watch_parser.add_argument("--no-inotify", action="store_true",
+                              help="Scan the folder instead of using inotify "
+                                   "(e.g. for network file systems)")
+    watch_parser.add_argument("--existing", action="store_true",
+                              help="Also run the script on the files already "
+                                   "there")
+
+    address = argparse.ArgumentParser(add_help=False)
+    address.add_argument("-a", "--address", type=str, default=None,
+                         help="Socket path or [HOST:]PORT of the job server "
+                              "(default: a socket next to the config file)")
+    serve_parser = subparsers.add_parser(
+        "serve", parents=[common, address],
+        help="Run a job server taking tasks over an HTTP/JSON API")
+    serve_parser.add_argument("-b", "--base", type=str, default=None,
+                              help="Folder of relative script names "
+                                   "(default: current folder)")
+    submit_parser = subparsers.add_parser(
+        "submit", parents=[address, timing],
+        help="Submit a script or a queue file to a job server")
+    submit_parser.add_argument("file", type=str,
+                               help="Script (.py) or JSON queue file")
+    submit_parser.add_argument("-p", "--param", action="append", default=[],
+                               metavar="NAME=VALUE",
+                               help="Script argument (repeatable)")
+    submit_parser.add_argument("-n", "--iterations", type=int, default=1,
+                               help="Number of runs of the script")
+    submit_parser.add_argument("-P", "--priority", type=int, default=0,
+                               help="Priority of the tasks that set none "
+                                    "(higher runs first)")
+    status_parser = subparsers.add_parser(
+        "status", parents=[address],
+        help="Show the status of a job server or of its tasks")
+    status_parser.add_argument("task", type=str, nargs="*",
+                               help="Task ids (indexes with --index)")
+    status_parser.add_argument("-i", "--index", action="store_true",
+                               help="Take the tasks by index")
+    cancel_parser = subparsers.add_parser(
+        "cancel", parents=[address], help="Cancel tasks of a job server")
+    cancel_parser.add_argument("task", type=str, nargs="+",
+                               help="Task ids (indexes with --index)")
+    cancel_parser.add_argument("-i", "--index", action="store_true",
+                               help="Take the tasks by index")
+
+    agent_parser = subparsers.add_parser(
+        "agent", help="Run a worker agent running the scripts of a "
+                      "ScriptRunner started with --agents")
+    agent_parser.add_argument("address", type=str, metavar="HOST:PORT",
+                              help="Address given to --agents")
+    agent_parser.add_argument("-c", "--capacity", type=int,
+                              default=os.cpu_count() or 1,
+                              help="Scripts run at once (default: number "
+                                   "of CPUs)")
+    agent_parser.add_argument("--name", type=str, default=None,
+                              help="Agent name (default: HOST-PID)")
+    agent_parser.add_argument("-e", "--interpreter", type=str, default="",
+                              help="Python interpreter running the scripts "
+                                   "(default: the one sent)")
+    agent_parser.add_argument("--token", type=str,
+                              default=os.environ.get(
+                                  "SCRIPTRUNNER_AGENT_TOKEN"),
+                              help="Token of the agent pool (default: "
+                                   "$SCRIPTRUNNER_AGENT_TOKEN)")
+    agent_parser.add_argument("--grace", type=float, nargs=2,
+                              default=list(STOP_GRACE_PERIODS),
+                              metavar=("INT_S", "TERM_S"),
+                              help="Seconds given to stopped scripts after "
+                                   "SIGINT and after SIGTERM")
+    return parser.parse_args(argv)
+
+
+def run_agent(args):
+    """Run a worker agent until interrupted, return the exit code."""
+    from scriptrunner.lib.agents import WorkerAgent, parse_agent_address
+    try:
+        address = parse_agent_address(args.address)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    agent = WorkerAgent(address, args.capacity, args.name, args.interpreter,
+                        args.token, tuple(args.grace))
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: agent.close())
+    try:
+        agent.run()
+    except PermissionError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def parse_params(items):
+    """{name: value} from NAME=VALUE items, ValueError if invalid."""
+    params = {}
+    for item in items:
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid parameter (expected NAME=VALUE): "
+                             f"{item}")
+        params[name.lstrip("-")] = value
+    return params
+
+
+def set_timing(task, args):
+    """
+    Set the start time and recurrence given on the command line to a task.
+    Raises ValueError if they are invalid.
+    """
+    from scriptrunner.lib.triggers import get_first_run
+    for key in ("at", "every", "cron"):
+        if getattr(args, key):
+            task[key] = getattr(args, key)
+    get_first_run(task, time.time())
+
+
+def get_task_keys(args):
+    """Task ids, or indexes with --index. Raises ValueError."""
+    if not args.index:
+        return args.task
+    return [int(key) for key in args.task]
+
+
+def run_client(args):
+    """Run a job server client command, return the exit code."""
+    from scriptrunner.lib.server import JobClient
+    from scriptrunner.lib.scheduling import load_queue_file, make_script_task
+    client = JobClient(args.address)
+    try:
+        if args.command == "submit":
+            path = os.path.abspath(args.file)
+            if path.endswith(".py"):
+                tasks = [make_script_task(path, parse_params(args.param),
+                                          max(args.iterations, 1),
+                                          priority=args.priority)]
+                set_timing(tasks[0], args)
+            else:
+                tasks, folder, _ = load_queue_file(path)
+                folder = os.path.abspath(folder or ".")
+                for task in tasks:
+                    if task['type'] != 'sleep':
+                        task['name'] = os.path.join(folder, task['name'])
+                    if not task.get('priority'):
+                        task['priority'] = args.priority
+            results = [client.submit(tasks)]
+        elif args.command == "status":
+            if args.task:
+                results = [client.get_task(key)
+                           for key in get_task_keys(args)]
+            else:
+                results = [client.get_status()]
+        else:
+            results = [client.cancel(key) for key in get_task_keys(args)]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        client.close()
+    for result in results:
+        print(json.dumps(result))
+    return 0
+
+
+def run_headless(args):
+    """
+    Run a script or queue file, or a job server, without the GUI, return
+    the exit code.
+    """
+    if args.command in CLIENT_COMMANDS:
+        return run_client(args)
+    if args.command == "agent":
+        return run_agent(args)
+    from scriptrunner.lib.scheduling import (Scheduler, load_queue_file,
+                                             make_script_task, make_sweep_task)
+    queue_iterations = 1
+    policy = {"timeout": args.timeout, "retries": args.retries,
+              "backoff": args.backoff, "retry_codes": args.retry_codes}
+    if args.command == "serve":
+        tasks = []
+        folder = os.path.abspath(args.base or ".")
+    elif args.command == "watch":
+        from scriptrunner.lib.triggers import get_file_fields, fill_params
+        tasks = []
+        script_path = os.path.abspath(args.script)
+        folder = os.path.dirname(script_path)
+        if not os.path.isdir(args.folder):
+            print(f"Error: no folder {args.folder}", file=sys.stderr)
+            return 2
+        try:
+            params = parse_params(args.param)
+            fields = get_file_fields(os.path.join(args.folder, "0"))
+            if args.regex is not None:
+                fields.update(dict.fromkeys(re.compile(args.regex).groupindex,
+                                            ""))
+            fill_params(params, fields)
+        except (ValueError, re.error) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+    elif args.command == "run":
+        script_path = os.path.abspath(args.script)
+        try:
+            params = parse_params(args.param)
+            if args.sweep:
+                tasks = [make_sweep_task(os.path.basename(script_path),
+                                         params, args.sweep,
+                                         max(args.parallel, 0),
+                                         max(args.iterations, 1), **policy)]
+            else:
+                tasks = [make_script_task(os.path.basename(script_path),
+                                          params, max(args.iterations, 1),
+                                          **policy)]
+            set_timing(tasks[0], args)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        folder = os.path.dirname(script_path)
+    else:
+        try:
+            # The policy options apply to the tasks that leave them unset
+            tasks, folder, queue_iterations = load_queue_file(
+                args.queue, {"timeout": args.timeout,
+                             "retries": args.retries,
+                             "backoff": args.backoff,
+                             "retry_codes": args.retry_codes})
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading queue file {args.queue}: {e}",
+                  file=sys.stderr)
+            return 2
+        if args.iterations > 1:
+            queue_iterations = args.iterations
+        if args.base is not None:
+            folder = args.base
+        folder = os.path.abspath(folder or ".")
+
+    out = sys.stdout if args.output is None else open(args.output, "a")
+
+    def on_event(kind, data):
+        record = {"event": kind, "time": round(time.time(), 3)}
+        if kind == "status":
+            index, status = data
+            record.update(task=index, name=tasks[index]['name'],
+                          status=status)
+        elif kind == "start":
+            record.update(task=data[0], command=data[1])
+        elif kind == "output":
+            record.update(task=data[0], line=data[1].rstrip("\n"))
+        elif kind == "end":
+            record.update(task=data[0], returncode=data[2])
+        else:
+            record["message"] = data
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    executor = None
+    if args.batch:
+        from scriptrunner.lib.batch import BatchSystem, BATCH_COMMANDS
+        executor = BatchSystem(BATCH_COMMANDS[args.batch], args.batch_dir,
+                               args.batch_option)
+    elif args.agents:
+        from scriptrunner.lib.agents import AgentPool, parse_agent_address
+        try:
+            executor = AgentPool(parse_agent_address(args.agents),
+                                 args.agent_token)
+            executor.start()
+        except (OSError, ValueError) as e:
+            print(f"Can't listen for agents: {e}", file=sys.stderr)
+            if out is not sys.stdout:
+                out.close()
+            return 2
+        on_event("info", f"Waiting for agents on "
+                         f"{executor.address[0]}:{executor.address[1]}")
+    scheduler = Scheduler(tasks, folder, args.interpreter, queue_iterations,
+                          args.introspect, on_event, args.jobs, args.cores,
+                          args.memory, grace_periods=tuple(args.grace),
+                          executor=executor, preempt=args.preempt)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: scheduler.stop())
+    if hasattr(signal, "SIGUSR1"):
+        # Freeze and thaw the running scripts
+        signal.signal(signal.SIGUSR1, lambda *_: scheduler.suspend())
+        signal.signal(signal.SIGUSR2, lambda *_: scheduler.resume())
+    try:
+        if args.command == "serve":
+            from scriptrunner.lib.server import JobServer, format_address
+            server = JobServer(scheduler, args.address, policy)
+            try:
+                server.start()
+            except OSError as e:
+                print(f"Can't start the job server: {e}", file=sys.stderr)
+                return 2
+            on_event("info", f"Serving on {format_address(server.address)}")
+            server.run()
+            scheduler.wait_stopped()
+            return 0
+        if args.command == "watch":
+            from scriptrunner.lib.triggers import FileTrigger
+
+            def on_files(paths):
+                new_tasks = []
+                names = []
+                for path in paths:
+                    fields = get_file_fields(path, args.regex)
+                    if fields is None:
+                        continue
+                    new_tasks.append(make_script_task(
+                        os.path.basename(script_path),
+                        fill_params(params, fields),
+                        max(args.iterations, 1), **policy))
+                    names.append(fields['name'])
+                if not new_tasks:
+                    return
+                if len(names) == 1:
+                    on_event("info", f"New file {names[0]}")
+                else:
+                    on_event("info", f"{len(names)} new files, {names[0]} "
+                                     f"to {names[-1]}")
+                scheduler.submit(new_tasks)
+
+            trigger = FileTrigger(args.folder, args.glob, on_files,
+                                  args.settle, args.poll,
+                                  existing=args.existing,
+                                  use_inotify=not args.no_inotify)
+            trigger.start()
+            method = "inotify" if trigger.uses_inotify else "scanning"
+            on_event("info", f"Watching {trigger.folder} for {args.glob} "
+                             f"({method})")
+            try:
+                scheduler.serve()
+            finally:
+                trigger.close()
+            scheduler.wait_stopped()
+            return 0
+        success = scheduler.run()
+        scheduler.wait_stopped()
+        on_event("finished", "ok" if success else
+                 ("stopped" if scheduler.stopped else "failed"))
+    finally:
+        if args.introspect:
+            import scriptrunner.lib.introspection as introspection
+            introspection.save_introspection_cache()
+            introspection.shutdown()
+        util.save_argument_cache()
+        if executor is not None:
+            executor.close()
+        if out is not sys.stdout:
+            out.close()
+    if success:
+        return 0
+    return 130 if scheduler.stopped else 1
+
+
 def get_base_folder():
     """Get the base folder config."""
     config_data = util.load_config()
@@ -44,15 +565,25 @@ def get_base_folder():
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in HEADLESS_COMMANDS:
+        sys.exit(run_headless(parse_headless_args(sys.argv[1:])))
     args = parse_args()
+    profile = util.STARTUP_PROFILE
+    if args.profile_startup:
+        profile.enable()
+    with profile.section("imports"):
+        from scriptrunner.lib.interactions import ScriptRunnerInteractions
     script_type = args.stype
-    if args.base is not None:
-        base_folder = os.path.abspath(args.base)
-    elif args.path is not None:
-        base_folder = os.path.abspath(args.path)
-    else:
-        base_folder = get_base_folder()
-    app = ScriptRunnerInteractions(base_folder, script_type)
+    with profile.section("config loading"):
+        if args.base is not None:
+            base_folder = os.path.abspath(args.base)
+        elif args.path is not None:
+            base_folder = os.path.abspath(args.path)
+        else:
+            base_folder = get_base_folder()
+    app = ScriptRunnerInteractions(base_folder, script_type, args.recursive,
+                                   args.depth, args.introspect, args.server,
+                                   args.agents, args.batch)
     try:
         app.mainloop()
     except KeyboardInterrupt:
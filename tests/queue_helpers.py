@@ -0,0 +1,87 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from scriptrunner.lib import utilities as util
+from scriptrunner.lib.scheduling import Scheduler
+
+ECHO_SCRIPT = """
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument("--value", type=int, default=0)
+parser.add_argument("--fail", action="store_true")
+args = parser.parse_args()
+print("value", args.value)
+raise SystemExit(1 if args.fail else 0)
+"""
+
+# Also prints the thread count set for the reserved cores
+ENV_ECHO_SCRIPT = """
+import os
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument("--value", type=int, default=0)
+parser.add_argument("--fail", action="store_true")
+args = parser.parse_args()
+print("value", args.value, os.environ.get("OMP_NUM_THREADS"))
+raise SystemExit(1 if args.fail else 0)
+"""
+
+SLOW_SCRIPT = """
+import time
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument("--number", type=int, default=0)
+parser.parse_args()
+print("ready", flush=True)
+time.sleep(30)
+"""
+
+WAIT_SCRIPT = """
+import time
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument("--delay", type=float, default=0.5)
+args = parser.parse_args()
+print("start", time.time())
+time.sleep(args.delay)
+print("end", time.time())
+"""
+
+
+class QueueTestCase(unittest.TestCase):
+    """
+    Base of the tests running queues: the scripts (name: source) are
+    written to a temporary folder, with a fresh argument cache, and the
+    events of the schedulers made by make_scheduler are kept in events.
+    """
+
+    scripts = {"echo.py": ECHO_SCRIPT, "slow.py": SLOW_SCRIPT}
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = util.ARGUMENT_CACHE
+        util.ARGUMENT_CACHE = util.ScriptArgumentCache(
+            os.path.join(self.tmp_dir, "args.json"))
+        for name, source in self.scripts.items():
+            with open(os.path.join(self.tmp_dir, name), "w") as f:
+                f.write(source)
+        self.events = []
+
+    def tearDown(self):
+        util.ARGUMENT_CACHE = self.cache
+        shutil.rmtree(self.tmp_dir)
+
+    def output(self):
+        return [data[1].strip() for kind, data in self.events
+                if kind == "output"]
+
+    def on_event(self, kind, data):
+        self.events.append((kind, data))
+
+    def make_scheduler(self, tasks, queue_iterations=1, max_concurrent=1,
+                       **kwargs):
+        return Scheduler(tasks, self.tmp_dir, sys.executable, queue_iterations,
+                         on_event=self.on_event, max_concurrent=max_concurrent,
+                         **kwargs)
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import threading
+from unittest import mock
+from scriptrunner.lib import utilities as util
+from scriptrunner.lib.agents import (AgentPool, WorkerAgent, AGENT_LOST_CODE,
+                                     parse_agent_address)
+from scriptrunner.lib.processes import popen_in_group
+from scriptrunner.lib.scheduling import make_script_task
+from tests.queue_helpers import (QueueTestCase, ENV_ECHO_SCRIPT,
+                                 SLOW_SCRIPT, WAIT_SCRIPT)
+
+
+class TestAgents(QueueTestCase):
+    """Tests running queues on worker agents over localhost sockets."""
+
+    scripts = {"echo.py": ENV_ECHO_SCRIPT, "slow.py": SLOW_SCRIPT,
+               "wait.py": WAIT_SCRIPT}
+
+    def setUp(self):
+        super().setUp()
+        self.pool = AgentPool(("127.0.0.1", 0), token="secret")
+        self.pool.start()
+        self.agents = []
+
+    def tearDown(self):
+        for agent, thread in self.agents:
+            agent.close()
+            thread.join(10)
+        self.pool.close()
+        super().tearDown()
+
+    def start_agent(self, name, capacity=1, token="secret"):
+        agent = WorkerAgent(self.pool.address, capacity, name, token=token)
+        thread = threading.Thread(target=agent.run, args=(0.1,),
+                                  daemon=True)
+        thread.start()
+        self.agents.append((agent, thread))
+        return agent
+
+    def wait_capacity(self, capacity):
+        deadline = time.monotonic() + 10
+        while self.pool.capacity() != capacity:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def make_scheduler(self, tasks, max_concurrent=4, **kwargs):
+        return super().make_scheduler(tasks, max_concurrent=max_concurrent,
+                                      executor=self.pool, **kwargs)
+
+    def test_parse_agent_address(self):
+        self.assertEqual(parse_agent_address("8766"), ("127.0.0.1", 8766))
+        self.assertEqual(parse_agent_address("0.0.0.0:80"), ("0.0.0.0", 80))
+        with self.assertRaises(ValueError):
+            parse_agent_address("host")
+
+    def test_run_on_agents(self):
+        self.start_agent("a")
+        self.start_agent("b")
+        self.wait_capacity(2)
+        tasks = [make_script_task("wait.py", {"delay": "0.4"})
+                 for _ in range(4)]
+        tasks.append(make_script_task("echo.py", {"fail": "True"},
+                                      cores=1))
+        self.assertFalse(self.make_scheduler(tasks).run())
+        self.assertEqual([t['status'] for t in tasks],
+                         [util.STATUS_DONE] * 4 + [util.STATUS_FAILED])
+        # Two agents with one slot each: two scripts at a time
+        times = {}
+        for kind, data in self.events:
+            if kind == "output" and data[1].split()[0] in ("start", "end"):
+                times.setdefault(data[0], []).append(
+                    float(data[1].split()[1]))
+        for start, _ in times.values():
+            running = sum(s <= start < e for s, e in times.values())
+            self.assertLessEqual(running, 2)
+        self.assertIn(("output", (4, "value 0 1\n")), self.events)
+        self.assertIn(("end", (4, [sys.executable, "-u",
+                                   os.path.join(self.tmp_dir, "echo.py"),
+                                   "--fail"], 1)), self.events)
+
+    def test_tasks_wait_for_agents(self):
+        tasks = [make_script_task("echo.py", {"value": "3"})]
+        scheduler = self.make_scheduler(tasks)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        time.sleep(0.2)
+        self.assertEqual(tasks[0]['status'], util.STATUS_PENDING)
+        self.start_agent("late")
+        thread.join(10)
+        self.assertEqual(tasks[0]['status'], util.STATUS_DONE)
+        self.assertIn(("info", "Agent late registered with 1 slots"),
+                      self.events)
+
+    def test_stop_remote_script(self):
+        self.start_agent("a")
+        self.wait_capacity(1)
+        tasks = [make_script_task("slow.py")]
+        scheduler = self.make_scheduler(tasks)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        while ("output", (0, "ready\n")) not in self.events:
+            time.sleep(0.01)
+        scheduler.stop()
+        scheduler.wait_stopped()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        infos = [data for kind, data in self.events if kind == "info"]
+        self.assertTrue(any(info.startswith("Task 1: stopped with SIGINT")
+                            for info in infos))
+
+    def test_stop_while_starting(self):
+        self.start_agent("a")
+        self.wait_capacity(1)
+
+        def slow_popen(*args, **kwargs):
+            time.sleep(0.5)
+            return popen_in_group(*args, **kwargs)
+
+        with mock.patch("scriptrunner.lib.agents.popen_in_group",
+                        side_effect=slow_popen):
+            process = self.pool.run([sys.executable, "-u",
+                                     os.path.join(self.tmp_dir, "slow.py")])
+            pids, signal_name = process.stop((2.0, 2.0))
+        self.assertEqual(signal_name, "SIGINT")
+        self.assertTrue(pids)
+        self.assertTrue(process.exited.wait(10))
+        self.assertNotEqual(process.returncode, 0)
+
+    def test_lost_agent_fails_run(self):
+        agent = self.start_agent("a")
+        self.wait_capacity(1)
+        tasks = [make_script_task("slow.py")]
+        scheduler = self.make_scheduler(tasks)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        while ("output", (0, "ready\n")) not in self.events:
+            time.sleep(0.01)
+        agent.close()
+        thread.join(20)
+        self.assertEqual(tasks[0]['status'], util.STATUS_FAILED)
+        self.assertEqual([data[2] for kind, data in self.events
+                          if kind == "end"], [AGENT_LOST_CODE])
+
+    def test_invalid_token(self):
+        agent = WorkerAgent(self.pool.address, name="intruder",
+                            token="wrong")
+        with self.assertRaises(PermissionError):
+            agent.run(0.1)
+        self.assertEqual(self.pool.capacity(), 0)
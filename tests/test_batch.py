@@ -0,0 +1,105 @@
+import os
+import time
+import glob
+import threading
+import unittest
+from scriptrunner.lib import utilities as util
+from scriptrunner.lib.batch import (BatchSystem, BATCH_COMMANDS,
+                                    format_time_limit, make_job_script)
+from scriptrunner.lib.scheduling import make_script_task, make_sweep_task
+from tests.queue_helpers import (QueueTestCase, ENV_ECHO_SCRIPT,
+                                 SLOW_SCRIPT)
+
+
+@unittest.skipIf(os.name != "posix", "The batch shim runs POSIX shells")
+class TestBatchSystem(QueueTestCase):
+    """Tests running queues as batch jobs, with the local batch shim."""
+
+    scripts = {"echo.py": ENV_ECHO_SCRIPT, "slow.py": SLOW_SCRIPT}
+
+    def setUp(self):
+        super().setUp()
+        self.shim_dir = os.path.join(self.tmp_dir, "shim")
+        self.environ = os.environ.get("SCRIPTRUNNER_SHIM_DIR")
+        os.environ["SCRIPTRUNNER_SHIM_DIR"] = self.shim_dir
+        self.system = BatchSystem(BATCH_COMMANDS["shim"],
+                                  os.path.join(self.tmp_dir, "jobs"),
+                                  poll_interval=0.1)
+
+    def tearDown(self):
+        self.system.close()
+        if self.environ is None:
+            os.environ.pop("SCRIPTRUNNER_SHIM_DIR", None)
+        else:
+            os.environ["SCRIPTRUNNER_SHIM_DIR"] = self.environ
+        super().tearDown()
+
+    def make_scheduler(self, tasks, max_concurrent=4, **kwargs):
+        return super().make_scheduler(tasks, max_concurrent=max_concurrent,
+                                      executor=self.system, **kwargs)
+
+    def get_submissions(self):
+        return len(glob.glob(os.path.join(self.shim_dir, "*.job")))
+
+    def get_output(self, index=None):
+        return sorted(data[1] for kind, data in self.events
+                      if kind == "output" and index in (None, data[0]))
+
+    def test_make_job_script(self):
+        script = make_job_script([["python", "a b.py"], ["python", "c.py"]],
+                                 {"OMP_NUM_THREADS": "2"}, "/jobs", "x")
+        self.assertIn("0) env OMP_NUM_THREADS=2 python 'a b.py' ;;", script)
+        self.assertIn("1) env OMP_NUM_THREADS=2 python c.py ;;", script)
+        self.assertIn("rc_file=/jobs/x_$SLURM_ARRAY_TASK_ID.rc", script)
+        self.assertEqual(format_time_limit(90.5), "1:31")
+
+    def test_run_scripts_as_jobs(self):
+        tasks = [make_script_task("echo.py", {"value": str(i)})
+                 for i in range(3)]
+        tasks.append(make_script_task("echo.py", {"fail": "True"}))
+        self.assertFalse(self.make_scheduler(tasks).run())
+        self.assertEqual([t['status'] for t in tasks],
+                         [util.STATUS_DONE] * 3 + [util.STATUS_FAILED])
+        self.assertEqual(self.get_output(),
+                         [f"value {i} None\n" for i in (0, 0, 1, 2)])
+        # Started together: submitted as one job array
+        self.assertEqual(self.get_submissions(), 1)
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, "jobs")), [])
+
+    def test_sweep_as_job_array(self):
+        values = [str(i) for i in range(8)]
+        tasks = [make_sweep_task("echo.py", {"value": values}, cores=1)]
+        self.assertTrue(self.make_scheduler(tasks).run())
+        self.assertEqual(tasks[0]['status'], util.STATUS_DONE)
+        self.assertEqual(self.get_output(0),
+                         sorted(f"value {i} 1\n" for i in range(8)))
+        self.assertEqual(self.get_submissions(), 1)
+        self.assertEqual(len([1 for kind, _ in self.events
+                              if kind == "end"]), 8)
+
+    def test_sweep_retries_failed_points(self):
+        tasks = [make_sweep_task("echo.py", {"value": ["1", "2"],
+                                             "fail": ["True"]},
+                                 retries=1, backoff=0.1)]
+        self.assertFalse(self.make_scheduler(tasks).run())
+        self.assertEqual(tasks[0]['status'], util.STATUS_FAILED)
+        # One array per attempt
+        self.assertEqual(self.get_submissions(), 2)
+        self.assertEqual([data[2] for kind, data in self.events
+                          if kind == "end"], [1] * 4)
+
+    def test_stop_job_array(self):
+        tasks = [make_sweep_task("slow.py", {"number": ["1", "2", "3"]})]
+        scheduler = self.make_scheduler(tasks)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        deadline = time.monotonic() + 20
+        while ("output", (0, "ready\n")) not in self.events:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.02)
+        scheduler.stop()
+        scheduler.wait_stopped()
+        thread.join(20)
+        self.assertFalse(thread.is_alive())
+        infos = [data for kind, data in self.events if kind == "info"]
+        self.assertTrue(any("with scancel" in info for info in infos))
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from scriptrunner.lib import utilities as util
+from scriptrunner.lib.discovery import ScriptScanner, ScanJob
+
+DUMMY_SCRIPT_DIR = os.path.join(os.path.dirname(__file__), 'dummy_scripts')
+
+
+class TestScriptScanner(unittest.TestCase):
+    """Tests classifying scripts of a folder in a process pool."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = util.ARGUMENT_CACHE
+        util.ARGUMENT_CACHE = util.ScriptArgumentCache(
+            os.path.join(self.tmp_dir, "args.json"))
+        self.names = []
+        for i in range(6):
+            for source in ("cli_script.py", "no_argparse.py"):
+                name = f"{i}_{source}"
+                shutil.copy(os.path.join(DUMMY_SCRIPT_DIR, source),
+                            os.path.join(self.tmp_dir, name))
+                self.names.append(name)
+        self.scanner = ScriptScanner(max_workers=2, min_pool_jobs=4)
+
+    def tearDown(self):
+        self.scanner.shutdown()
+        util.ARGUMENT_CACHE = self.cache
+        shutil.rmtree(self.tmp_dir)
+
+    def scan(self, cancel_event=None):
+        results = {}
+
+        def on_result(name, spec):
+            results[name] = (len(spec.arguments), spec.has_argparse)
+
+        finished = self.scanner.scan(self.tmp_dir, self.names, on_result,
+                                     cancel_event)
+        return finished, results
+
+    def test_scan_in_pool(self):
+        finished, results = self.scan()
+        self.assertTrue(finished)
+        self.assertEqual(sorted(results), sorted(self.names))
+        for name, (num_args, has_argparse) in results.items():
+            if "cli_script" in name:
+                self.assertEqual((num_args, has_argparse), (3, True))
+            else:
+                self.assertEqual((num_args, has_argparse), (0, False))
+
+    def test_second_scan_is_served_from_cache(self):
+        self.scan()
+        with mock.patch.object(self.scanner, "_get_executor",
+                               side_effect=AssertionError):
+            finished, results = self.scan()
+        self.assertTrue(finished)
+        self.assertEqual(len(results), len(self.names))
+
+    def test_cancelled_scan(self):
+        cancel_event = threading.Event()
+        cancel_event.set()
+        finished, results = self.scan(cancel_event)
+        self.assertFalse(finished)
+        self.assertEqual(results, {})
+
+
+class TestScanJob(unittest.TestCase):
+    """Tests progress counting and cancellation of a scan job."""
+
+    def test_count_and_cancel(self):
+        job = ScanJob(1)
+        names = job.count(iter(["a.py", "b.py", "c.py"]))
+        self.assertEqual(next(names), "a.py")
+        self.assertEqual(job.listed, 1)
+        self.assertFalse(job.listing_done)
+        job.cancel()
+        self.assertEqual(list(names), [])
+        self.assertTrue(job.cancelled)
+
+    def test_listing_done(self):
+        job = ScanJob(1)
+        self.assertEqual(list(job.count(["a.py", "b.py"])), ["a.py", "b.py"])
+        self.assertEqual(job.listed, 2)
+        self.assertTrue(job.listing_done)
@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import shutil
+import threading
+import tempfile
+import unittest
+from unittest import mock
+import scriptrunner.lib.utilities as util
+import scriptrunner.lib.introspection as introspection
+
+
+CLI_SCRIPT = """
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("input")
+parser.add_argument("-m", "--mode", dest="scan_mode", choices=["fly", "step"],
+                    default="fly", help="Scan mode")
+parser.add_argument("--dry-run", action="store_true")
+parser.add_argument("-n", type=int, default=2 * 3)
+args = parser.parse_args()
+open("ran_body.txt", "w").close()
+"""
+
+DYNAMIC_SCRIPT = """
+import argparse
+
+parser = argparse.ArgumentParser()
+for name in ("alpha", "beta"):
+    parser.add_argument("--" + name, type=float, default=1.5)
+parser.parse_args()
+"""
+
+NO_CLI_SCRIPT = """
+open("executed.txt", "w").close()
+"""
+
+NO_PARSE_SCRIPT = """
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--level", type=int)
+"""
+
+SLOW_SCRIPT = """
+import time
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--delay", type=int)
+while True:
+    time.sleep(0.1)
+"""
+
+DELAYED_SCRIPT = """
+import time
+import argparse
+
+time.sleep(1)
+parser = argparse.ArgumentParser()
+parser.add_argument("--delay", type=int)
+parser.parse_args()
+"""
+
+
+class TestIntrospection(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_cache = introspection.INTROSPECTION_CACHE
+        self.old_pool = introspection.INTROSPECTION_POOL
+        introspection.INTROSPECTION_CACHE = util.ScriptArgumentCache(
+            os.path.join(self.tmp_dir, "cache.json"))
+        introspection.INTROSPECTION_POOL = introspection.IntrospectionPool(
+            max_helpers=1, timeout=10)
+
+    def tearDown(self):
+        introspection.shutdown()
+        introspection.INTROSPECTION_CACHE = self.old_cache
+        introspection.INTROSPECTION_POOL = self.old_pool
+        shutil.rmtree(self.tmp_dir)
+
+    def write_script(self, name, source):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "w") as f:
+            f.write(source)
+        return path
+
+    def test_exact_spec_from_parser(self):
+        path = self.write_script("cli.py", CLI_SCRIPT)
+        spec = introspection.get_script_spec(path, sys.executable)
+        self.assertTrue(spec.has_argparse)
+        self.assertEqual(spec.by_name["m"].dest, "scan_mode")
+        self.assertEqual(spec.by_name["m"].choices, ["fly", "step"])
+        self.assertEqual(spec.by_name["dry-run"].action, "store_true")
+        self.assertEqual(spec.by_name["n"].default_value, 6)
+        self.assertTrue(spec.by_name["input"].is_positional)
+        # The script body after parse_args is never run
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmp_dir, "ran_body.txt")))
+
+    def test_dynamic_arguments(self):
+        path = self.write_script("dynamic.py", DYNAMIC_SCRIPT)
+        static = util.get_script_arguments(path, use_cache=False)
+        spec = introspection.get_script_spec(path, sys.executable)
+        self.assertEqual(static.arguments, ())
+        self.assertEqual(sorted(spec.by_name), ["alpha", "beta"])
+        self.assertIs(spec.by_name["alpha"].arg_type, float)
+
+    def test_result_is_cached(self):
+        path = self.write_script("cli.py", CLI_SCRIPT)
+        self.assertIsNone(introspection.get_cached_spec(path,
+                                                        sys.executable))
+        spec = introspection.get_script_spec(path, sys.executable)
+        self.assertEqual(introspection.get_cached_spec(path, sys.executable),
+                         spec)
+        pool = introspection.INTROSPECTION_POOL
+        pool.introspect = mock.Mock(side_effect=AssertionError)
+        self.assertEqual(introspection.get_script_spec(path, sys.executable),
+                         spec)
+        # Same content with a new mtime is recognised by its hash
+        os.utime(path, ns=(0, 0))
+        self.assertEqual(introspection.get_script_spec(path, sys.executable),
+                         spec)
+
+    def test_script_without_argparse_is_not_run(self):
+        path = self.write_script("plain.py", NO_CLI_SCRIPT)
+        spec = introspection.get_script_spec(path, sys.executable)
+        self.assertFalse(spec.has_argparse)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmp_dir, "executed.txt")))
+
+    def test_fallback_to_static_spec(self):
+        path = self.write_script("no_parse.py", NO_PARSE_SCRIPT)
+        spec = introspection.get_script_spec(path, sys.executable)
+        self.assertEqual(spec, util.get_script_arguments(path,
+                                                         use_cache=False))
+
+    def test_timeout(self):
+        introspection.INTROSPECTION_POOL.timeout = 1
+        path = self.write_script("slow.py", SLOW_SCRIPT)
+        result = introspection.INTROSPECTION_POOL.introspect(path,
+                                                             sys.executable)
+        self.assertFalse(result["ok"])
+        self.assertIn("timed out", result["error"])
+        spec = introspection.get_script_spec(path, sys.executable)
+        self.assertEqual(list(spec.by_name), ["delay"])
+
+    def test_shutdown_during_introspection(self):
+        pool = introspection.INTROSPECTION_POOL
+        path = self.write_script("delayed.py", DELAYED_SCRIPT)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            pool.introspect(path, sys.executable)))
+        thread.start()
+        time.sleep(0.3)
+        introspection.shutdown()
+        thread.join(10)
+        self.assertTrue(results[0]["ok"])
+        self.assertEqual(pool.count[sys.executable],
+                         len(pool.idle[sys.executable]))
+        # The pool stays usable after the shutdown
+        self.assertTrue(pool.introspect(path, sys.executable)["ok"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import threading
+import unittest
+from unittest import mock
+from scriptrunner.lib import utilities as util
+from scriptrunner.lib.journal import QueueJournal, read_journal
+from scriptrunner.lib.scheduling import make_script_task, make_sweep_task
+from tests.queue_helpers import QueueTestCase, ECHO_SCRIPT
+
+
+class TestQueueJournal(QueueTestCase):
+    """Tests journaling queue runs and resuming them."""
+
+    scripts = {"echo.py": ECHO_SCRIPT}
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp_dir, "journal.jsonl")
+
+    def make_scheduler(self, tasks, queue_iterations=1, **kwargs):
+        return super().make_scheduler(tasks, queue_iterations,
+                                      journal=QueueJournal(self.path, 0.05),
+                                      **kwargs)
+
+    def read_records(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def crash_after(self, predicate):
+        """Cut the journal after the first record matching predicate."""
+        records = self.read_records()
+        end = next(i for i, r in enumerate(records) if predicate(r)) + 1
+        with open(self.path, "w") as f:
+            for record in records[:end]:
+                f.write(json.dumps(record) + "\n")
+            f.write('{"event": "fini')
+
+    def test_resume_after_crash(self):
+        tasks = [make_script_task("echo.py", {"value": "1"}, iterations=3),
+                 make_script_task("echo.py", {"value": "2"})]
+        self.assertTrue(self.make_scheduler(tasks, 2).run())
+        self.assertIsNone(read_journal(self.path))
+        seen_pass = []
+
+        def second_run_done(record):
+            if record["event"] == "pass":
+                seen_pass.append(record)
+            return seen_pass and record["event"] == "run_done" \
+                and record["run"] == 1
+        self.crash_after(second_run_done)
+
+        state = read_journal(self.path)
+        self.assertEqual(state["iteration"], 1)
+        self.assertEqual(state["queue_iterations"], 2)
+        self.assertEqual(state["folder"], self.tmp_dir)
+        self.assertEqual(state["tasks"][0]['runs_done'], 2)
+        self.assertEqual([t['status'] for t in state["tasks"]],
+                         [util.STATUS_PENDING] * 2)
+        self.events = []
+        scheduler = self.make_scheduler(state["tasks"], 2,
+                                        start_iteration=state["iteration"])
+        self.assertTrue(scheduler.run())
+        # Only the remaining iteration of task 1 and task 2 run
+        self.assertEqual(self.output(), ["value 1", "value 2"])
+        self.assertIsNone(read_journal(self.path))
+
+    def test_resume_sweep(self):
+        tasks = [make_sweep_task("echo.py", {"value": "[1, 2, 3]"},
+                                 parallel=1)]
+        self.assertTrue(self.make_scheduler(tasks).run())
+        self.crash_after(lambda r: r["event"] == "point_done")
+        state = read_journal(self.path)
+        self.assertEqual(state["tasks"][0]['points_done'], [0])
+        self.events = []
+        self.assertTrue(self.make_scheduler(state["tasks"]).run())
+        self.assertEqual(self.output(), ["value 2", "value 3"])
+
+    def test_finished_between_iterations(self):
+        tasks = [make_script_task("echo.py")]
+        self.assertTrue(self.make_scheduler(tasks, 3).run())
+        self.crash_after(lambda r: r["event"] == "finished")
+        state = read_journal(self.path)
+        self.assertEqual(state["iteration"], 1)
+        self.assertEqual(state["tasks"][0]['status'], util.STATUS_PENDING)
+
+    def test_no_journal(self):
+        self.assertIsNone(read_journal(self.path))
+        journal = QueueJournal(self.path)
+        journal.open()
+        journal.discard()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_batched_sync(self):
+        journal = QueueJournal(self.path, sync_interval=0.5)
+        with mock.patch("scriptrunner.lib.journal.os.fsync") as fsync:
+            journal.open()
+            for i in range(100):
+                journal.append("point_done", task=0, point=i)
+            # Written through to the OS at once
+            self.assertEqual(len(self.read_records()), 100)
+            journal.close()
+        self.assertLessEqual(fsync.call_count, 2)
+
+    def test_slow_sync_does_not_block_append(self):
+        journal = QueueJournal(self.path, sync_interval=0.01)
+        syncing = threading.Event()
+        release = threading.Event()
+
+        def slow_fsync(fileno):
+            syncing.set()
+            release.wait(5)
+
+        with mock.patch("scriptrunner.lib.journal.os.fsync",
+                        side_effect=slow_fsync):
+            journal.open()
+            journal.append("start")
+            self.assertTrue(syncing.wait(5))
+            start = time.monotonic()
+            journal.append("task_started", task=0)
+            self.assertLess(time.monotonic() - start, 1)
+            release.set()
+            journal.close()
+        self.assertEqual(len(self.read_records()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
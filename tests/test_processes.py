@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import subprocess
+import unittest
+from unittest import mock
+import scriptrunner.lib.processes as processes
+from scriptrunner.lib.processes import (popen_in_group, get_session_pids,
+                                        stop_process_group)
+
+SPAWN_SCRIPT = """
+import os
+import sys
+import time
+import subprocess
+children = [subprocess.Popen([sys.executable, "-c",
+                              "import time; time.sleep(60)"])
+            for _ in range(2)]
+# A shell pipeline in the background, in its own process group
+subprocess.Popen("sleep 60 | sleep 60", shell=True, preexec_fn=os.setpgrp)
+print(" ".join(str(c.pid) for c in children), flush=True)
+time.sleep(60)
+"""
+
+STUBBORN_SCRIPT = """
+import time
+import signal
+signal.signal(signal.SIGINT, signal.SIG_IGN)
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+print("ready", flush=True)
+time.sleep(60)
+"""
+
+
+def is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+    except OSError:
+        return False
+
+
+@unittest.skipUnless(os.path.isdir("/proc") and os.name == "posix",
+                     "needs /proc")
+class TestProcessGroups(unittest.TestCase):
+    """Tests stopping scripts together with their descendants."""
+
+    def start(self, source):
+        process = popen_in_group([sys.executable, "-c", source],
+                                 stdout=subprocess.PIPE, text=True)
+        self.addCleanup(process.wait)
+        self.addCleanup(process.stdout.close)
+        return process, process.stdout.readline().split()
+
+    def test_stop_reaps_descendants(self):
+        process, child_pids = self.start(SPAWN_SCRIPT)
+        # Wait for the shell pipeline to start
+        deadline = time.monotonic() + 5
+        while len(get_session_pids(process.pid)) < 6 and \
+                time.monotonic() < deadline:
+            time.sleep(0.05)
+        pids = get_session_pids(process.pid)
+        self.assertGreaterEqual(len(pids), 6)
+        reaped, signal_name = stop_process_group(process, (2.0, 2.0))
+        self.assertEqual(signal_name, "SIGINT")
+        self.assertTrue(set(pids) <= set(reaped))
+        self.assertTrue({int(pid) for pid in child_pids} <= set(reaped))
+        self.assertFalse(any(is_running(pid) for pid in reaped))
+
+    def test_escalation(self):
+        process, _ = self.start(STUBBORN_SCRIPT)
+        start = time.monotonic()
+        reaped, signal_name = stop_process_group(process, (0.2, 0.2))
+        self.assertEqual(signal_name, "SIGKILL")
+        self.assertEqual(reaped, [process.pid])
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+        self.assertEqual(process.wait(5), -9)
+
+    def test_nothing_to_stop(self):
+        process, _ = self.start("print('done')")
+        process.wait(5)
+        self.assertEqual(stop_process_group(process), ([], None))
+
+    def test_survivors_are_not_reported(self):
+        process, _ = self.start(STUBBORN_SCRIPT)
+        self.addCleanup(process.kill)
+        # A process of the session that the signals can't reach
+        with mock.patch.object(processes, "get_session_pids",
+                               return_value=[process.pid]), \
+                mock.patch.object(processes, "signal_group"), \
+                mock.patch.object(processes, "KILL_WAIT", 0.2):
+            pids, signal_name = stop_process_group(process, (0.2, 0.2))
+        self.assertEqual(signal_name, "SIGKILL")
+        self.assertEqual(pids, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
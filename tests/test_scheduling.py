@@ -0,0 +1,560 @@
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+import unittest
+from unittest import mock
+from scriptrunner.lib import utilities as util
+from scriptrunner.lib.scheduling import (ParameterSweep, load_queue_file,
+                                         make_script_task, make_sleep_task,
+                                         make_sweep_task, get_retry_policy)
+from tests.queue_helpers import QueueTestCase, WAIT_SCRIPT
+
+AFFINITY_SCRIPT = """
+import os
+print("cores", sorted(os.sched_getaffinity(0)), os.environ["OMP_NUM_THREADS"])
+"""
+
+FLAKY_SCRIPT = """
+import os
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument("--fails", type=int, default=1)
+parser.add_argument("--code", type=int, default=75)
+args = parser.parse_args()
+path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attempts")
+attempt = 1
+if os.path.exists(path):
+    with open(path) as f:
+        attempt = int(f.read()) + 1
+with open(path, "w") as f:
+    f.write(str(attempt))
+print("attempt", attempt)
+raise SystemExit(args.code if attempt <= args.fails else 0)
+"""
+
+ONCE_SCRIPT = """
+import os
+import time
+path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "started")
+if not os.path.exists(path):
+    open(path, "w").close()
+    print("ready", flush=True)
+    try:
+        time.sleep(30)
+    except KeyboardInterrupt:
+        raise SystemExit(130)
+print("finished")
+"""
+
+
+class TestScheduler(QueueTestCase):
+    """Tests running queues with the GUI-free scheduler."""
+
+    scripts = dict(QueueTestCase.scripts, **{
+        "wait.py": WAIT_SCRIPT, "flaky.py": FLAKY_SCRIPT,
+        "once.py": ONCE_SCRIPT, "affinity.py": AFFINITY_SCRIPT})
+
+    def intervals(self):
+        """(start, end) times printed by each run of wait.py."""
+        times = {}
+        for kind, data in self.events:
+            if kind == "output":
+                word, value = data[1].split()
+                times.setdefault(data[0], []).append(float(value))
+        return [tuple(values[i:i + 2]) for values in times.values()
+                for i in range(0, len(values), 2)]
+
+    def test_run_queue(self):
+        tasks = [make_script_task("echo.py", {"value": "3"}, iterations=2),
+                 make_sleep_task(0.1),
+                 make_script_task("echo.py", {"value": "4"})]
+        self.assertTrue(self.make_scheduler(tasks).run())
+        self.assertEqual(self.output(), ["value 3", "value 3", "value 4"])
+        self.assertEqual([t['status'] for t in tasks], [util.STATUS_DONE] * 3)
+        command = [data[1] for kind, data in self.events
+                   if kind == "start"][0]
+        self.assertEqual(command[1:], ["-u",
+                                       os.path.join(self.tmp_dir, "echo.py"),
+                                       "--value", "3"])
+
+    def test_failure_skips_only_dependents(self):
+        tasks = [make_script_task("echo.py", {"fail": "True"}),
+                 make_script_task("echo.py", {"value": "1"})]
+        tasks.append(make_script_task("echo.py", {"value": "2"},
+                                      after=[tasks[0]['id']]))
+        tasks.append(make_script_task("echo.py", {"value": "3"},
+                                      after=[tasks[2]['id']]))
+        self.assertFalse(self.make_scheduler(tasks, 2).run())
+        self.assertEqual([t['status'] for t in tasks],
+                         [util.STATUS_FAILED, util.STATUS_DONE,
+                          util.STATUS_SKIPPED, util.STATUS_SKIPPED])
+        # A failure no longer aborts the next queue iterations
+        self.assertEqual(self.output(), ["value 0", "value 1"] * 2)
+
+    def test_dependency_graph(self):
+        # 1 -> (2, 3) -> 4, task 2 and 3 run in parallel
+        first = make_script_task("wait.py", {"delay": "0.1"})
+        second = make_script_task("wait.py", {"delay": "0.4"},
+                                  after=[first['id']])
+        third = make_script_task("wait.py", {"delay": "0.4"},
+                                 after=[first['id']])
+        last = make_script_task("wait.py", {"delay": "0.1"},
+                                after=[second['id'], third['id']])
+        tasks = [last, second, third, first]
+        self.assertTrue(self.make_scheduler(tasks, max_concurrent=4).run())
+        times = {}
+        for kind, data in self.events:
+            if kind == "output":
+                times.setdefault(data[0], []).append(
+                    float(data[1].split()[1]))
+        (last_start, _), (second_start, second_end), \
+            (third_start, third_end), (_, first_end) = \
+            [times[i] for i in range(4)]
+        self.assertGreaterEqual(second_start, first_end)
+        self.assertGreaterEqual(third_start, first_end)
+        self.assertLess(abs(second_start - third_start), 0.3)
+        self.assertGreaterEqual(last_start, max(second_end, third_end))
+
+    def test_dependency_cycle(self):
+        first = make_script_task("echo.py")
+        second = make_script_task("echo.py", after=[first['id']])
+        first['after'] = [second['id']]
+        third = make_script_task("echo.py", {"value": "3"})
+        tasks = [first, second, third]
+        self.assertFalse(self.make_scheduler(tasks).run())
+        self.assertEqual([t['status'] for t in tasks],
+                         [util.STATUS_FAILED, util.STATUS_FAILED,
+                          util.STATUS_DONE])
+        self.assertIn(("error", "Dependency cycle between tasks 1, 2"),
+                      self.events)
+
+    def test_done_tasks_are_skipped(self):
+        tasks = [make_script_task("echo.py", {"value": "1"}),
+                 make_script_task("echo.py", {"value": "2"})]
+        tasks[0]['status'] = util.STATUS_DONE
+        self.make_scheduler(tasks).run()
+        self.assertEqual(self.output(), ["value 2"])
+
+    def test_invalid_param(self):
+        tasks = [make_script_task("echo.py", {"value": "abc"})]
+        self.assertFalse(self.make_scheduler(tasks).run())
+        self.assertIn(("error", "Error: Invalid param value=abc"),
+                      self.events)
+
+    def test_stop(self):
+        tasks = [make_script_task("slow.py"), make_script_task("echo.py")]
+        scheduler = self.make_scheduler(tasks)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        while not scheduler.processes:
+            time.sleep(0.01)
+        scheduler.stop()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(scheduler.stopped)
+        self.assertEqual(tasks[1]['status'], util.STATUS_PENDING)
+
+    def test_sleep_duration(self):
+        scheduler = self.make_scheduler([make_sleep_task(0.25)])
+        start = time.monotonic()
+        self.assertTrue(scheduler.run())
+        self.assertAlmostEqual(time.monotonic() - start, 0.25, delta=0.04)
+
+    def test_pause_resume_sleep(self):
+        tasks = [make_sleep_task(0.3)]
+        scheduler = self.make_scheduler(tasks)
+        thread = threading.Thread(target=scheduler.run)
+        start = time.monotonic()
+        thread.start()
+        time.sleep(0.1)
+        scheduler.pause()
+        time.sleep(0.4)
+        # The paused time isn't counted
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(tasks[0]['status'], util.STATUS_RUNNING)
+        scheduler.resume()
+        thread.join(5)
+        self.assertEqual(tasks[0]['status'], util.STATUS_DONE)
+        self.assertAlmostEqual(time.monotonic() - start, 0.7, delta=0.08)
+
+    def test_stop_during_sleep(self):
+        scheduler = self.make_scheduler([make_sleep_task(30)])
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        time.sleep(0.1)
+        scheduler.pause()
+        start = time.monotonic()
+        scheduler.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertLess(time.monotonic() - start, 0.05)
+
+    def test_timeout(self):
+        tasks = [make_script_task("slow.py", timeout=0.3),
+                 make_script_task("echo.py")]
+        start = time.monotonic()
+        self.assertFalse(self.make_scheduler(tasks).run())
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual([t['status'] for t in tasks],
+                         [util.STATUS_FAILED, util.STATUS_DONE])
+        self.assertIn(("error", "Task 1 timed out after 0.3 seconds"),
+                      self.events)
+
+    def test_retry(self):
+        tasks = [make_script_task("flaky.py", {"fails": "2"}, retries=3,
+                                  backoff=0.05, retry_codes=[75])]
+        self.assertTrue(self.make_scheduler(tasks).run())
+        self.assertEqual(self.output(), ["attempt 1", "attempt 2",
+                                         "attempt 3"])
+
+    def test_exit_code_not_retryable(self):
+        tasks = [make_script_task("flaky.py", {"code": "1"}, retries=3,
+                                  backoff=0.05, retry_codes=[75])]
+        self.assertFalse(self.make_scheduler(tasks).run())
+        self.assertEqual(self.output(), ["attempt 1"])
+
+    def test_other_tasks_run_during_backoff(self):
+        tasks = [make_script_task("flaky.py", retries=1, backoff=1.0),
+                 make_script_task("echo.py")]
+        self.assertTrue(self.make_scheduler(tasks).run())
+        self.assertEqual(self.output(), ["attempt 1", "value 0",
+                                         "attempt 2"])
+
+    @unittest.skipUnless(os.name == "posix", "needs SIGSTOP")
+    def test_suspend_resume(self):
+        tasks = [make_script_task("wait.py", {"delay": "0.3"}, timeout=0.5)
+                 for _ in range(2)]
+        scheduler = self.make_scheduler(tasks, max_concurrent=2)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        while len(self.output()) < 2:
+            time.sleep(0.01)
+        scheduler.suspend()
+        processes = list(scheduler.processes.values())
+        time.sleep(0.7)
+        for process in processes:
+            with open(f"/proc/{process.pid}/stat") as f:
+                self.assertEqual(f.read().rsplit(")", 1)[1].split()[0], "T")
+        self.assertEqual(len(self.output()), 2)
+        self.assertEqual([t['status'] for t in tasks],
+                         [util.STATUS_SUSPENDED] * 2)
+        times = scheduler.get_suspended_times()
+        self.assertEqual(sorted(times), [0, 1])
+        self.assertTrue(all(t >= 0.7 for t in times.values()))
+        scheduler.resume()
+        thread.join(10)
+        # The suspended time doesn't count towards the timeout
+        self.assertEqual([t['status'] for t in tasks],
+                         [util.STATUS_DONE] * 2)
+        (start, end), _ = self.intervals()
+        self.assertGreater(end - start, 0.7)
+        self.assertEqual(len([data for kind, data in self.events
+                              if kind == "info" and "resumed after" in data]),
+                         2)
+
+    @unittest.skipUnless(os.name == "posix", "needs SIGSTOP")
+    def test_stop_suspended(self):
+        tasks = [make_script_task("slow.py")]
+        scheduler = self.make_scheduler(tasks, grace_periods=(1, 1))
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        while not scheduler.processes:
+            time.sleep(0.01)
+        scheduler.suspend()
+        scheduler.stop()
+        thread.join(10)
+        scheduler.wait_stopped()
+        self.assertFalse(thread.is_alive())
+        self.assertIn("SIGINT", [data for kind, data in self.events
+                                 if kind == "info"][-1])
+
+    def test_concurrent_tasks(self):
+        tasks = [make_script_task("wait.py") for _ in range(4)]
+        self.assertTrue(self.make_scheduler(tasks, max_concurrent=2).run())
+        intervals = self.intervals()
+        self.assertEqual(len(intervals), 4)
+        for start, _ in intervals:
+            running = sum(1 for s, e in intervals if s <= start < e)
+            self.assertLessEqual(running, 2)
+        self.assertGreaterEqual(max(sum(1 for s, e in intervals
+                                        if s <= start < e)
+                                    for start, _ in intervals), 2)
+
+    def test_priority_order(self):
+        tasks = [make_script_task("echo.py", {"value": str(i)},
+                                  priority=priority)
+                 for i, priority in enumerate((0, 2, 1))]
+        self.assertTrue(self.make_scheduler(tasks).run())
+        self.assertEqual(self.output(), ["value 1", "value 2", "value 0"])
+
+    def run_preempted(self, low_task, preempt):
+        """Submit an urgent task once low_task runs, return its index."""
+        scheduler = self.make_scheduler([low_task], preempt=preempt)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        while not self.output():
+            time.sleep(0.01)
+        urgent = make_script_task("echo.py", {"value": "9"}, priority=10)
+        index, = scheduler.submit([urgent])
+        thread.join(20)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([t['status'] for t in scheduler.tasks],
+                         [util.STATUS_DONE] * 2)
+        return index
+
+    @unittest.skipUnless(os.name == "posix", "needs SIGSTOP")
+    def test_preempt_suspend(self):
+        index = self.run_preempted(make_script_task("wait.py",
+                                                    {"delay": "0.5"}),
+                                   "suspend")
+        self.assertEqual(index, 1)
+        output = self.output()
+        self.assertEqual(output[1], "value 9")
+        self.assertTrue(output[2].startswith("end"))
+        infos = [data for kind, data in self.events if kind == "info"]
+        self.assertIn("Task 1: suspended for task 2", infos)
+        self.assertTrue(any(info.startswith("Task 1 resumed after")
+                            for info in infos))
+        self.assertIn(("status", (0, util.STATUS_PREEMPTED)), self.events)
+
+    def test_preempt_requeue(self):
+        self.run_preempted(make_script_task("once.py"), "requeue")
+        self.assertEqual(self.output(), ["ready", "value 9", "finished"])
+        self.assertEqual([data[0] for kind, data in self.events
+                          if kind == "start"], [0, 1, 0])
+        infos = [data for kind, data in self.events if kind == "info"]
+        self.assertIn("Task 1: stopped for task 2, requeued", infos)
+
+    def test_submit_as_queue_ends(self):
+        # A task submitted while the last one finishes either runs or is
+        # refused, never left pending
+        for delay in (0, 0.0005, 0.001, 0.002, 0.005):
+            tasks = [make_sleep_task(0)]
+            scheduler = self.make_scheduler(tasks)
+            results = []
+
+            def submit_later():
+                time.sleep(delay)
+                results.append(scheduler.submit([make_sleep_task(0)]))
+
+            def on_event(kind, data):
+                if kind == "status" and data == (0, util.STATUS_DONE):
+                    threading.Thread(target=submit_later).start()
+
+            scheduler.on_event = on_event
+            self.assertTrue(scheduler.run())
+            while not results:
+                time.sleep(0.001)
+            if results[0] is None:
+                self.assertEqual(len(tasks), 1)
+            else:
+                self.assertEqual(tasks[1]['status'], util.STATUS_DONE)
+        self.assertIsNone(scheduler.submit([make_sleep_task(0)]))
+
+    def test_start_time(self):
+        start = time.time() + 0.8
+        tasks = [make_script_task("echo.py", {"value": "1"}),
+                 make_script_task("echo.py", {"value": "2"})]
+        tasks[0]['at'] = start
+        self.assertTrue(self.make_scheduler(tasks).run())
+        self.assertGreaterEqual(time.time(), start)
+        self.assertEqual(self.output(), ["value 2", "value 1"])
+        self.assertTrue(any(kind == "status" and data[0] == 0 and
+                            data[1].startswith(util.STATUS_SCHEDULED)
+                            for kind, data in self.events))
+
+    def test_recurring_task(self):
+        tasks = [make_script_task("echo.py", {"value": "1"})]
+        tasks[0]['every'] = "0.3s"
+        tasks.append(make_script_task("echo.py", {"value": "2"},
+                                      after=[tasks[0]['id']]))
+        scheduler = self.make_scheduler(tasks)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        started = time.monotonic()
+        deadline = started + 20
+        while self.output().count("value 1") < 3:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.02)
+        scheduler.stop()
+        thread.join(20)
+        self.assertFalse(thread.is_alive())
+        self.assertGreaterEqual(time.monotonic() - started, 0.6)
+        # The dependent task ran once, after the first run
+        output = self.output()
+        self.assertEqual(output.count("value 2"), 1)
+        self.assertEqual(output[0], "value 1")
+        self.assertEqual(tasks[1]['status'], util.STATUS_DONE)
+
+    def test_sleep_waits_for_running_tasks(self):
+        tasks = [make_script_task("wait.py", {"delay": "0.3"}),
+                 make_sleep_task(0.1),
+                 make_script_task("wait.py", {"delay": "0.1"})]
+        self.assertTrue(self.make_scheduler(tasks, max_concurrent=4).run())
+        (_, first_end), (second_start, _) = sorted(self.intervals())
+        self.assertGreaterEqual(second_start - first_end, 0.1)
+
+    def test_stop_terminates_all_tasks(self):
+        tasks = [make_script_task("slow.py") for _ in range(3)]
+        scheduler = self.make_scheduler(tasks, max_concurrent=3)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        while len(scheduler.processes) < 3:
+            time.sleep(0.01)
+        processes = list(scheduler.processes.values())
+        scheduler.stop()
+        thread.join(10)
+        scheduler.wait_stopped()
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(all(p.poll() is not None for p in processes))
+        reports = [data for kind, data in self.events
+                   if kind == "info" and "reaped PIDs" in data]
+        self.assertEqual(len(reports), 3)
+        for process in processes:
+            self.assertTrue(any(str(process.pid) in report
+                                for report in reports))
+
+    def test_memory_reservations(self):
+        # Only two of the 3 GB tasks fit in 7 GB, the 1 GB task backfills
+        tasks = [make_script_task("wait.py", memory=3) for _ in range(3)]
+        tasks.append(make_script_task("wait.py", {"delay": "0.1"}, memory=1))
+        scheduler = self.make_scheduler(tasks, max_concurrent=8,
+                                        total_memory=7)
+        self.assertTrue(scheduler.run())
+        intervals = self.intervals()
+        large = [(s, e) for s, e in intervals if e - s > 0.3]
+        self.assertEqual(len(large), 3)
+        for start, _ in large:
+            running = sum(1 for s, e in large if s <= start < e)
+            self.assertLessEqual(running, 2)
+        self.assertEqual(scheduler.free_memory, 7)
+
+    def test_oversized_reservation_fails(self):
+        tasks = [make_script_task("echo.py", cores=1000),
+                 make_script_task("echo.py", {"value": "2"})]
+        self.assertFalse(self.make_scheduler(tasks).run())
+        self.assertEqual([t['status'] for t in tasks],
+                         [util.STATUS_FAILED, util.STATUS_DONE])
+
+    @unittest.skipUnless(hasattr(os, "sched_setaffinity"),
+                         "no CPU affinity support")
+    def test_cores_are_pinned(self):
+        cores = sorted(os.sched_getaffinity(0))
+        tasks = [make_script_task("affinity.py", cores=1)]
+        with mock.patch.dict(os.environ):
+            os.environ.pop("OMP_NUM_THREADS", None)
+            self.make_scheduler(tasks).run()
+        self.assertEqual(self.output(), [f"cores {cores[:1]} 1"])
+
+    def test_sweep(self):
+        tasks = [make_sweep_task("wait.py", {"delay": "[0.3, 0.2, 0.3, 0.2]"},
+                                 parallel=2)]
+        self.assertTrue(self.make_scheduler(tasks, max_concurrent=4).run())
+        intervals = self.intervals()
+        self.assertEqual(len(intervals), 4)
+        for start, _ in intervals:
+            running = sum(1 for s, e in intervals if s <= start < e)
+            self.assertLessEqual(running, 2)
+        statuses = [data[1] for kind, data in self.events if kind == "status"]
+        self.assertIn("Sweep 4/4", statuses)
+        self.assertEqual(statuses[-1], util.STATUS_DONE)
+
+    def test_sweep_failure(self):
+        tasks = [make_sweep_task("echo.py", {"value": "range(1, 4)",
+                                             "fail": "[False, True, False]"},
+                                 mode="zip")]
+        tasks.append(make_script_task("echo.py", after=[tasks[0]['id']]))
+        self.assertFalse(self.make_scheduler(tasks, max_concurrent=3).run())
+        self.assertEqual(sorted(self.output()),
+                         ["value 1", "value 2", "value 3"])
+        self.assertEqual([t['status'] for t in tasks],
+                         [util.STATUS_FAILED, util.STATUS_SKIPPED])
+        self.assertIn(("error", "Task 1: 1 of 3 sweep points failed"),
+                      self.events)
+
+    def test_load_queue_file(self):
+        path = os.path.join(self.tmp_dir, "queue.json")
+        with open(path, "w") as f:
+            json.dump({"folder": "scripts", "iterations": 2, "tasks": [
+                {"name": "echo.py", "params": {"value": "1"}, "id": "pre"},
+                {"type": "sleep", "params": {"duration": 2}},
+                {"name": "echo.py", "after": [1, "pre"]}]}, f)
+        tasks, folder, iterations = load_queue_file(path)
+        self.assertEqual(folder, os.path.join(self.tmp_dir, "scripts"))
+        self.assertEqual(iterations, 2)
+        self.assertEqual(tasks[0], make_script_task("echo.py", {"value": "1"},
+                                                    task_id="pre"))
+        self.assertEqual(tasks[1]['params'], {'duration': 2.0})
+        self.assertEqual(tasks[2]['after'], ["pre", "pre"])
+
+    def test_queue_file_defaults(self):
+        path = os.path.join(self.tmp_dir, "queue.json")
+        with open(path, "w") as f:
+            json.dump([{"name": "echo.py", "retry_codes": [75]},
+                       {"name": "echo.py", "retries": 0, "timeout": 5}], f)
+        tasks, _, _ = load_queue_file(path, {"timeout": 60, "retries": 3,
+                                             "backoff": 2.0,
+                                             "retry_codes": [1]})
+        self.assertEqual(get_retry_policy(tasks[0]), (60.0, 3, 2.0, [75]))
+        self.assertEqual(get_retry_policy(tasks[1]), (5.0, 0, 2.0, [1]))
+
+    def test_headless_command(self):
+        code = ("import sys; from scriptrunner import main; "
+                "code = main.run_headless(main.parse_headless_args(sys.argv[1:]));"
+                "print('tkinter' in sys.modules, code)")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root)
+        result = subprocess.run(
+            [sys.executable, "-c", code, "run",
+             os.path.join(self.tmp_dir, "echo.py"), "-p", "value=5",
+             "-e", sys.executable], capture_output=True, text=True, env=env,
+            timeout=30)
+        lines = result.stdout.splitlines()
+        self.assertEqual(lines[-1], "False 0")
+        records = [json.loads(line) for line in lines[:-1]]
+        self.assertIn("value 5", [r.get("line") for r in records])
+        self.assertEqual(records[-1]["event"], "finished")
+
+
+class TestParameterSweep(unittest.TestCase):
+    """Tests expanding the points of parameter sweeps."""
+
+    def test_product(self):
+        sweep = ParameterSweep({"s": "range(0, 20, 10)",
+                                "ring": "[sort, 'norm']", "r": "0.5"})
+        self.assertEqual(len(sweep), 4)
+        self.assertEqual([(p["s"], p["ring"], p["r"]) for p in sweep],
+                         [("0", "sort", "0.5"), ("0", "norm", "0.5"),
+                          ("10", "sort", "0.5"), ("10", "norm", "0.5")])
+
+    def test_zip(self):
+        sweep = ParameterSweep({"a": "[1, 2, 3]", "b": "range(0.0, 0.3, 0.1)"},
+                               "zip")
+        self.assertEqual([(p["a"], p["b"]) for p in sweep],
+                         [("1", "0.0"), ("2", "0.1"), ("3", "0.2")])
+
+    def test_large_sweep_is_lazy(self):
+        sweep = ParameterSweep({"a": "range(1000)", "b": "range(100)",
+                                "c": "[x, y]"})
+        self.assertEqual(len(sweep), 200000)
+        self.assertEqual(sweep[199999], {"a": "999", "b": "99", "c": "y"})
+        points = iter(sweep)
+        self.assertEqual(next(points), {"a": "0", "b": "0", "c": "x"})
+
+    def test_invalid(self):
+        for params, mode in (({"a": "1"}, "product"),
+                             ({"a": "[]"}, "product"),
+                             ({"a": "range(5, 1)"}, "product"),
+                             ({"a": "range(0, 1, 0.0)"}, "product"),
+                             ({"a": "range(a, b)"}, "product"),
+                             ({"a": "[1, 2]", "b": "[1]"}, "zip"),
+                             ({"a": "[1, 2]"}, "grid")):
+            with self.assertRaises(ValueError):
+                ParameterSweep(params, mode)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import socket
+import threading
+from scriptrunner.lib import utilities as util
+from scriptrunner.lib.scheduling import (Scheduler, make_script_task,
+                                         make_sleep_task)
+from scriptrunner.lib.server import (JobServer, JobClient, ServerQueue,
+                                     get_server_address)
+from tests.queue_helpers import QueueTestCase
+
+
+class TestJobServer(QueueTestCase):
+    """Tests submitting tasks to a job server."""
+
+    def setUp(self):
+        super().setUp()
+        self.scheduler = Scheduler([], self.tmp_dir, sys.executable,
+                                   max_concurrent=2)
+        if hasattr(socket, "AF_UNIX"):
+            address = os.path.join(self.tmp_dir, "server.sock")
+        else:
+            address = "0"
+        self.server = JobServer(self.scheduler, address)
+        self.server.start()
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.start()
+        self.client = JobClient(self.server.address)
+
+    def tearDown(self):
+        self.client.close()
+        self.scheduler.stop()
+        self.thread.join(10)
+        self.scheduler.wait_stopped()
+        super().tearDown()
+
+    def wait_status(self, key, statuses, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = self.client.get_task(key)['status']
+            if status in statuses:
+                return status
+            time.sleep(0.02)
+        self.fail(f"Task {key} is still {status}")
+
+    def test_get_server_address(self):
+        self.assertEqual(get_server_address("8080"), ("127.0.0.1", 8080))
+        self.assertEqual(get_server_address("host:80"), ("host", 80))
+        self.assertEqual(get_server_address("/tmp/a.sock"), "/tmp/a.sock")
+
+    def test_submit_and_events(self):
+        results = self.client.submit([{"name": "echo.py", "id": "first",
+                                       "params": {"value": "1"}},
+                                      {"name": "echo.py", "after": [1],
+                                       "params": {"value": "2"}}])
+        self.assertEqual([r["index"] for r in results], [0, 1])
+        self.assertEqual(results[0]["id"], "first")
+        self.wait_status(results[1]["id"], [util.STATUS_DONE])
+        self.assertEqual(self.client.get_task(1)['after'], ["first"])
+        events = self.client.get_events()["events"]
+        lines = [e["line"] for e in events if e["event"] == "output"]
+        self.assertEqual(lines, ["value 1", "value 2"])
+        status = self.client.get_status()
+        self.assertEqual(status["tasks"], {util.STATUS_DONE: 2})
+        self.assertEqual(status["running"], 0)
+
+    def test_numeric_ids(self):
+        # Ids and indexes have their own routes: id "0" doesn't hide index 0
+        self.client.submit([{"type": "sleep", "id": "1",
+                             "params": {"duration": 0}},
+                            {"type": "sleep", "id": "0",
+                             "params": {"duration": 0}}])
+        self.assertEqual(self.client.get_task("0")["index"], 1)
+        self.assertEqual(self.client.get_task(0)["id"], "1")
+        with self.assertRaises(ValueError):
+            self.client.get_task(5)
+
+    def test_failed_dependency_skips(self):
+        self.client.submit([{"name": "echo.py", "id": "bad",
+                             "params": {"fail": "True"}}])
+        self.wait_status("bad", [util.STATUS_FAILED])
+        self.client.submit([{"name": "echo.py", "id": "next",
+                             "after": ["bad"]}])
+        self.wait_status("next", [util.STATUS_SKIPPED])
+        with self.assertRaises(ValueError):
+            self.client.submit([{"name": "echo.py", "after": ["unknown"]}])
+        with self.assertRaises(ValueError):
+            self.client.submit([{"name": "echo.py", "id": "bad"}])
+
+    def test_cancel(self):
+        self.client.submit([{"name": "slow.py", "id": "slow"}])
+        while not self.scheduler.processes:
+            time.sleep(0.01)
+        self.client.pause()
+        self.client.submit([{"name": "echo.py", "id": "pending"},
+                            {"name": "echo.py", "after": ["pending"],
+                             "id": "dependent"}])
+        self.assertTrue(self.client.cancel("pending")["cancelled"])
+        self.wait_status("pending", [util.STATUS_CANCELLED])
+        self.wait_status("dependent", [util.STATUS_SKIPPED])
+        self.assertFalse(self.client.cancel("pending")["cancelled"])
+        self.client.cancel("slow")
+        self.wait_status("slow", [util.STATUS_CANCELLED])
+        with self.assertRaises(ValueError):
+            self.client.cancel("missing")
+
+    def test_submission_rate(self):
+        # Submissions are not held up by the running tasks
+        self.client.submit([{"type": "sleep", "params": {"duration": 30}}])
+        count = 300
+        start = time.monotonic()
+        for i in range(count):
+            self.client.submit({"type": "sleep",
+                                "params": {"duration": 0.01}})
+        rate = count / (time.monotonic() - start)
+        self.assertGreater(rate, 100)
+        self.assertEqual(self.client.get_status()["total"], count + 1)
+
+    def test_server_queue(self):
+        tasks = [make_script_task("echo.py", {"value": "1"}),
+                 make_sleep_task(0.1),
+                 make_script_task("echo.py", {"value": "2"})]
+        client = JobClient(self.server.address)
+        self.addCleanup(client.close)
+        server_queue = ServerQueue(client, tasks, self.tmp_dir,
+                                   queue_iterations=2, on_event=self.on_event)
+        self.assertTrue(server_queue.run())
+        self.assertEqual([t['status'] for t in tasks], [util.STATUS_DONE] * 3)
+        self.assertEqual(self.output(), ["value 1", "value 2"] * 2)
+        self.assertEqual(self.client.get_status()["total"], 6)
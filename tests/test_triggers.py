@@ -0,0 +1,155 @@
+import os
+import time
+import shutil
+import datetime
+import tempfile
+import unittest
+from scriptrunner.lib.triggers import (CronPattern, FileTrigger,
+                                       parse_interval, parse_start_time,
+                                       get_first_run, get_next_run,
+                                       get_file_fields, fill_params)
+
+
+def local(*args):
+    return datetime.datetime(*args).timestamp()
+
+
+class TestTriggers(unittest.TestCase):
+    """Tests start times, intervals and cron patterns of timed tasks."""
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval("90"), 90)
+        self.assertEqual(parse_interval("5m"), 300)
+        self.assertEqual(parse_interval("1.5h"), 5400)
+        for value in ("", "0", "-1s", "abc"):
+            with self.assertRaises(ValueError):
+                parse_interval(value)
+
+    def test_parse_start_time(self):
+        now = local(2026, 3, 10, 12, 0)
+        self.assertEqual(parse_start_time("13:30", now),
+                         local(2026, 3, 10, 13, 30))
+        # Already past today: tomorrow
+        self.assertEqual(parse_start_time("08:00:15", now),
+                         local(2026, 3, 11, 8, 0, 15))
+        self.assertEqual(parse_start_time("2026-03-12 01:02", now),
+                         local(2026, 3, 12, 1, 2))
+        for value in ("25:00", "noon"):
+            with self.assertRaises(ValueError):
+                parse_start_time(value, now)
+
+    def test_cron_pattern(self):
+        now = local(2026, 3, 10, 12, 7, 30)
+        self.assertEqual(CronPattern("*/15 * * * *").next_after(now),
+                         local(2026, 3, 10, 12, 15))
+        self.assertEqual(CronPattern("0 2 * * *").next_after(now),
+                         local(2026, 3, 11, 2, 0))
+        # 2026-03-10 is a Tuesday, the next Sunday is the 15th
+        self.assertEqual(CronPattern("30 6 * * 0").next_after(now),
+                         local(2026, 3, 15, 6, 30))
+        self.assertEqual(CronPattern("0 0 1 1-6/3 *").next_after(now),
+                         local(2026, 4, 1))
+        # Either day field matches when both are set
+        self.assertEqual(CronPattern("0 0 20 * 3").next_after(now),
+                         local(2026, 3, 11))
+        self.assertEqual(CronPattern("0 0 29 2 *").next_after(now),
+                         local(2028, 2, 29))
+        for text in ("* * *", "60 * * * *", "*/0 * * * *"):
+            with self.assertRaises(ValueError):
+                CronPattern(text)
+
+    def test_runs(self):
+        now = local(2026, 3, 10, 12, 0)
+        self.assertIsNone(get_first_run({}, now))
+        task = {'at': local(2026, 3, 10, 11, 0), 'every': "25m"}
+        # Keeps the phase of the start time
+        self.assertEqual(get_first_run(task, now), local(2026, 3, 10, 12, 15))
+        # Runs missed while the task ran are skipped
+        self.assertEqual(get_next_run(task, local(2026, 3, 10, 12, 15),
+                                      local(2026, 3, 10, 13, 0)),
+                         local(2026, 3, 10, 13, 5))
+        self.assertIsNone(get_next_run({'at': now}, now, now))
+
+
+class TestFileTrigger(unittest.TestCase):
+    """Tests reporting new files of a folder once they are written."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.write("old_001.h5", "old")
+        self.batches = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content, mode="w"):
+        with open(os.path.join(self.tmp_dir, name), mode) as f:
+            f.write(content)
+
+    def wait_files(self, count, timeout=20):
+        deadline = time.monotonic() + timeout
+        while sum(len(batch) for batch in self.batches) < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.02)
+        return [os.path.basename(path) for batch in self.batches
+                for path in batch]
+
+    def check_trigger(self, use_inotify):
+        trigger = FileTrigger(self.tmp_dir, "*.h5", self.batches.append,
+                              settle=0.3, poll_interval=0.05,
+                              use_inotify=use_inotify)
+        try:
+            trigger.start()
+            # Reported once it stops growing
+            self.write("scan_002.h5", "a")
+            time.sleep(0.2)
+            self.write("scan_002.h5", "b", "a")
+            self.write("notes.txt", "ignored")
+            started = time.monotonic()
+            self.assertEqual(self.wait_files(1), ["scan_002.h5"])
+            self.assertGreaterEqual(time.monotonic() - started, 0.25)
+            # A burst of files is reported in a few batches
+            for i in range(200):
+                self.write(f"scan_{i + 100}.h5", "data")
+            names = self.wait_files(201)
+            self.assertEqual(names[1:], [f"scan_{i + 100}.h5"
+                                         for i in range(200)])
+            self.assertLess(len(self.batches), 50)
+            # Modified files are not reported again
+            self.write("scan_002.h5", "c", "a")
+            time.sleep(0.6)
+            self.assertEqual(len(self.wait_files(201)), 201)
+        finally:
+            trigger.close()
+
+    def test_scandir_polling(self):
+        self.check_trigger(use_inotify=False)
+
+    def test_inotify(self):
+        trigger = FileTrigger(self.tmp_dir, "*.h5", None)
+        uses_inotify = trigger.uses_inotify
+        trigger.close()
+        if not uses_inotify:
+            self.skipTest("inotify is not available")
+        self.check_trigger(use_inotify=True)
+
+    def test_existing_files(self):
+        trigger = FileTrigger(self.tmp_dir, "*.h5", self.batches.append,
+                              settle=0, poll_interval=0.05, existing=True)
+        try:
+            trigger.start()
+            self.assertEqual(self.wait_files(1), ["old_001.h5"])
+        finally:
+            trigger.close()
+
+    def test_file_params(self):
+        path = os.path.join("data", "scan_00042.h5")
+        fields = get_file_fields(path, r"scan_(?P<scan>\d+)")
+        self.assertEqual(fill_params({"input": "{path}", "scan": "{number}",
+                                      "out": "{stem}.tif",
+                                      "index": "{scan}"}, fields),
+                         {"input": path, "scan": "00042",
+                          "out": "scan_00042.tif", "index": "00042"})
+        self.assertIsNone(get_file_fields("notes.txt", r"scan_\d+"))
+        with self.assertRaises(ValueError):
+            fill_params({"scan": "{missing}"}, fields)
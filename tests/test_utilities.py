@@ -1,5 +1,12 @@
 import os
+import io
+import sys
+import pickle
+import shutil
+import tempfile
+import subprocess
 import unittest
+from unittest import mock
 from scriptrunner.lib import utilities as util
 
 # Path to the temporary dummy scripts directory
@@ -44,3 +51,219 @@ class TestScriptUtilities(unittest.TestCase):
         arguments, has_argparse = util.get_script_arguments(NO_ARGPARSE_PATH)
         self.assertFalse(has_argparse, "Should not detect argparse usage.")
         self.assertEqual(len(arguments), 0, "Should find 0 arguments.")
+
+
+class TestScriptArgumentCache(unittest.TestCase):
+    """Tests the invalidation-aware cache of parsed script arguments."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_dir, "cache", "args.json")
+        self.script_path = os.path.join(self.tmp_dir, "script.py")
+        shutil.copy(CLI_SCRIPT_PATH, self.script_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache_hit_skips_parsing(self):
+        cache = util.ScriptArgumentCache(self.cache_path)
+        first = cache.get(self.script_path)
+        with mock.patch.object(util, "parse_script_arguments") as parse:
+            second = cache.get(self.script_path)
+            parse.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_touched_but_unchanged_file_is_not_reparsed(self):
+        cache = util.ScriptArgumentCache(self.cache_path)
+        cache.get(self.script_path)
+        stat = os.stat(self.script_path)
+        os.utime(self.script_path, ns=(stat.st_atime_ns,
+                                       stat.st_mtime_ns + 10 ** 9))
+        with mock.patch.object(util, "parse_script_arguments") as parse:
+            arguments, has_argparse = cache.get(self.script_path)
+            parse.assert_not_called()
+        self.assertTrue(has_argparse)
+        self.assertEqual(len(arguments), 3)
+
+    def test_modified_file_is_reparsed(self):
+        cache = util.ScriptArgumentCache(self.cache_path)
+        self.assertEqual(len(cache.get(self.script_path)[0]), 3)
+        with open(self.script_path, "a") as f:
+            f.write("parser.add_argument('--extra', type=float)\n")
+        arguments, _ = cache.get(self.script_path)
+        self.assertEqual(len(arguments), 4)
+        self.assertEqual(arguments[3][3], float)
+
+    def test_cache_persists_across_sessions(self):
+        cache = util.ScriptArgumentCache(self.cache_path)
+        expected = cache.get(self.script_path)
+        cache.save()
+        self.assertTrue(os.path.isfile(self.cache_path))
+        new_cache = util.ScriptArgumentCache(self.cache_path)
+        with mock.patch.object(util, "parse_script_arguments") as parse:
+            result = new_cache.get(self.script_path)
+            parse.assert_not_called()
+        self.assertEqual(result, expected)
+
+
+class TestArgparsePrefilter(unittest.TestCase):
+    """Tests the byte-level pre-filter run before AST parsing."""
+
+    def test_non_cli_script_is_not_parsed(self):
+        with mock.patch.object(util, "parse_script_arguments") as parse:
+            scanned = util.scan_script_file(NO_ARGPARSE_PATH)
+            parse.assert_not_called()
+        self.assertEqual(len(scanned["spec"].arguments), 0)
+        self.assertFalse(scanned["spec"].has_argparse)
+
+    def test_empty_script(self):
+        with tempfile.NamedTemporaryFile(suffix=".py", delete=False) as f:
+            path = f.name
+        try:
+            arguments, has_argparse = util.get_script_arguments(
+                path, use_cache=False)
+        finally:
+            os.remove(path)
+        self.assertEqual(len(arguments), 0)
+        self.assertFalse(has_argparse)
+
+    def test_cli_script_passes_filter(self):
+        with open(CLI_SCRIPT_PATH, "rb") as f:
+            self.assertTrue(util.has_argparse_tokens(f))
+        scanned = util.scan_script_file(CLI_SCRIPT_PATH)
+        self.assertTrue(scanned["spec"].has_argparse)
+        self.assertIsNotNone(scanned["digest"])
+
+
+class TestRecursiveDiscovery(unittest.TestCase):
+    """Tests the recursive, ignore-aware script search."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for rel_path in ("top.py", "xrd/fit.py", "xrd/deep/more/peak.py",
+                         "tomo/recon.py", "tomo/build/gen.py",
+                         "__pycache__/cached.py", ".git/hook.py",
+                         "env/lib/site.py", "notes.txt"):
+            path = os.path.join(self.tmp_dir, *rel_path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write("print('hello')\n")
+        with open(os.path.join(self.tmp_dir, "env", "pyvenv.cfg"), "w") as f:
+            f.write("home = /usr/bin\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_top_level_only_by_default(self):
+        self.assertEqual(util.find_possible_scripts(self.tmp_dir), ["top.py"])
+
+    def test_recursive_skips_caches_and_virtualenvs(self):
+        files = util.find_possible_scripts(self.tmp_dir, recursive=True)
+        self.assertEqual(sorted(files),
+                         ["tomo/build/gen.py", "tomo/recon.py", "top.py",
+                          "xrd/deep/more/peak.py", "xrd/fit.py"])
+
+    def test_depth_limit(self):
+        files = util.find_possible_scripts(self.tmp_dir, recursive=True,
+                                           max_depth=1)
+        self.assertEqual(sorted(files),
+                         ["tomo/recon.py", "top.py", "xrd/fit.py"])
+
+    def test_ignore_patterns(self):
+        patterns = ["# comment", "build/", "/xrd/deep", "recon*.py",
+                    "!tomo/recon.py"]
+        files = util.find_possible_scripts(self.tmp_dir, recursive=True,
+                                           ignore_patterns=patterns)
+        self.assertEqual(sorted(files), ["tomo/recon.py", "top.py",
+                                         "xrd/fit.py"])
+
+    def test_anchored_directory_pattern(self):
+        path = os.path.join(self.tmp_dir, "build", "out.py")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write("print('hello')\n")
+        files = util.find_possible_scripts(self.tmp_dir, recursive=True,
+                                           ignore_patterns=["/build/"])
+        self.assertIn("tomo/build/gen.py", files)
+        self.assertNotIn("build/out.py", files)
+        rules = util.compile_ignore_patterns(["/build/"])
+        self.assertFalse(util.is_ignored("sub/build", True, rules))
+        self.assertTrue(util.is_ignored("build", True, rules))
+
+    def test_results_are_lazy(self):
+        scripts = util.iter_possible_scripts(self.tmp_dir, recursive=True)
+        self.assertEqual(next(scripts), "top.py")
+
+
+class TestScriptSpec(unittest.TestCase):
+    """Tests the compact argument model used to build commands."""
+
+    def setUp(self):
+        self.spec = util.get_script_arguments(CLI_SCRIPT_PATH,
+                                              use_cache=False)
+
+    def test_lookup_dicts(self):
+        self.assertEqual(self.spec.flags, {"f": "-f", "count": "--count",
+                                           "v": "-v"})
+        self.assertEqual(self.spec.types["count"], int)
+        self.assertEqual(self.spec.arguments[1].default_value, 10)
+
+    def test_build_argv(self):
+        argv = self.spec.build_argv({"f": "data.h5", "count": "5", "v": "",
+                                     "extra": "1"})
+        self.assertEqual(argv, ["-f", "data.h5", "--count", "5",
+                                "--extra", "1"])
+        with self.assertRaises(ValueError):
+            self.spec.build_argv({"count": "five"})
+
+    def test_pickle_and_json_round_trip(self):
+        self.assertEqual(pickle.loads(pickle.dumps(self.spec)), self.spec)
+        self.assertEqual(util.ScriptSpec.from_json(self.spec.to_json()),
+                         self.spec)
+
+
+class TestStartupProfile(unittest.TestCase):
+
+    def test_disabled_records_nothing(self):
+        profile = util.StartupProfile()
+        with profile.section("step"):
+            pass
+        profile.mark("point")
+        self.assertEqual(profile.steps, [])
+
+    def test_report(self):
+        profile = util.StartupProfile()
+        profile.enable()
+        with profile.section("outer"):
+            with profile.section("inner"):
+                pass
+        profile.mark("point")
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as out:
+            profile.report()
+            profile.report()
+        lines = out.getvalue().splitlines()
+        names = [line.split()[0] for line in lines
+                 if line.split() and line.split()[0] in ("outer", "inner",
+                                                         "point")]
+        self.assertEqual(names, ["outer", "inner", "point"])
+        self.assertEqual(out.getvalue().count("Startup step"), 1)
+
+    def test_gui_modules_load_editor_lazily(self):
+        code = ("import sys, scriptrunner.lib.interactions; "
+                "print(sorted(m for m in ('idlelib', 'tkinter.filedialog', "
+                "'scriptrunner.lib.editor', 'scriptrunner.lib.introspection', "
+                "'scriptrunner.lib.journal', 'scriptrunner.lib.agents', "
+                "'scriptrunner.lib.batch', 'scriptrunner.lib.scheduling', "
+                "'scriptrunner.lib.triggers') "
+                "if m in sys.modules))")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        try:
+            result = subprocess.run([sys.executable, "-c", code],
+                                    capture_output=True, text=True,
+                                    env=dict(os.environ, PYTHONPATH=root),
+                                    timeout=60)
+        except subprocess.TimeoutExpired:
+            self.skipTest("import timed out")
+        if result.returncode != 0:
+            self.skipTest("tkinter is not available")
+        self.assertEqual(result.stdout.strip(), "[]")
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+from scriptrunner.lib import utilities as util
+from scriptrunner.lib.watching import FolderWatcher
+
+
+class TestFolderWatcher(unittest.TestCase):
+    """Tests incremental change detection of a script folder."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ("a.py", "b.py", "notes.txt"):
+            self.write(name, "print('hello')\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        with open(os.path.join(self.tmp_dir, name), "w") as f:
+            f.write(content)
+
+    def check_changes(self, use_inotify):
+        watcher = FolderWatcher(self.tmp_dir, use_inotify=use_inotify)
+        try:
+            self.assertEqual(sorted(watcher.reset()), ["a.py", "b.py"])
+            self.assertEqual(watcher.poll(), ([], [], []))
+            self.write("c.py", "print('new')\n")
+            self.write("a.py", "print('modified')\n")
+            self.write("other.txt", "ignored\n")
+            os.remove(os.path.join(self.tmp_dir, "b.py"))
+            self.assertEqual(watcher.poll(), (["c.py"], ["b.py"], ["a.py"]))
+            self.assertEqual(watcher.poll(), ([], [], []))
+            self.assertEqual(sorted(watcher.entries), ["a.py", "c.py"])
+        finally:
+            watcher.close()
+
+    def test_scandir_diffing(self):
+        self.check_changes(use_inotify=False)
+
+    def test_inotify(self):
+        watcher = FolderWatcher(self.tmp_dir)
+        uses_inotify = watcher.uses_inotify
+        watcher.close()
+        if not uses_inotify:
+            self.skipTest("inotify is not available")
+        self.check_changes(use_inotify=True)
+
+    def test_abandoned_snapshot(self):
+        watcher = FolderWatcher(self.tmp_dir, use_inotify=False)
+        try:
+            self.assertFalse(watcher.complete)
+            self.assertEqual(sorted(watcher.reset()), ["a.py", "b.py"])
+            self.assertTrue(watcher.complete)
+            scan = watcher.iter_reset()
+            next(scan)
+            scan.close()
+            self.assertFalse(watcher.complete)
+        finally:
+            watcher.close()
+
+    def test_ignore_file(self):
+        self.write(util.IGNORE_FILE, "skip_*.py\n")
+        for use_inotify in (False, True):
+            watcher = FolderWatcher(
+                self.tmp_dir, use_inotify=use_inotify,
+                ignore_patterns=util.load_ignore_patterns(self.tmp_dir))
+            try:
+                watcher.reset()
+                self.write(f"skip_{use_inotify}.py", "print('ignored')\n")
+                self.write(f"new_{use_inotify}.py", "print('new')\n")
+                self.assertEqual(watcher.poll(),
+                                 ([f"new_{use_inotify}.py"], [], []))
+            finally:
+                watcher.close()